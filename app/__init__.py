@@ -3,6 +3,10 @@ from flask import Flask
 from flask_migrate import Migrate
 from .models import db, HVACDevice
 from .routes import main
+from .commands import register_commands
+from .snapshot import get_catalog_snapshot
+from .device_cache import configure_device_cache
+from .singleflight import configure_single_flight
 from config import Config
 
 def create_app(config_class=Config):
@@ -18,10 +22,15 @@ def create_app(config_class=Config):
     
     # Register blueprints
     app.register_blueprint(main)
+    register_commands(app)
+    configure_device_cache(app.config)
+    configure_single_flight(app.config)
     
     # Create database tables if they don't exist
     with app.app_context():
         print(Config.SQLALCHEMY_DATABASE_URI)
         db.create_all()
+        if app.config.get('COLUMNAR_SNAPSHOT'):
+            get_catalog_snapshot()
     
     return app
\ No newline at end of file
@@ -0,0 +1,83 @@
+# app/cache.py
+import json
+import threading
+from collections import OrderedDict
+from flask import g
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from .models import db, CatalogVersion
+
+# Bumped whenever the catalog changes (CSV import, manual add, refresh commands), inside the
+# transaction making the change. Cached results are keyed on it so they go stale automatically
+# instead of being purged by hand. It is stored in the catalog_version table, so a bump in one
+# gunicorn worker or a CLI command reaches every process; each reads it once per app context.
+
+
+def get_catalog_version():
+    if 'catalog_version' not in g:
+        g.catalog_version = db.session.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+    return g.catalog_version
+
+
+def bump_catalog_version():
+    """Increments the version in the caller's transaction; the caller commits."""
+    stmt = insert(CatalogVersion).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(index_elements=[CatalogVersion.id], set_={'version': CatalogVersion.version + 1})
+    version = db.session.execute(stmt.returning(CatalogVersion.version)).scalar_one()
+    # Re-read after the commit rather than trusting a value a rollback could still undo
+    g.pop('catalog_version', None)
+    return version
+
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Request args that change presentation only, never the set of matching devices.
+NON_FILTER_PARAMS = {'page', 'fields_to_display', 'group_by_field', 'submit', 'csrf_token'}
+
+
+def make_filter_key(search_params, prefix='', extra=None):
+    """Builds a canonical, hashable cache key from search parameters."""
+    canonical = {}
+    for key, value in search_params.items():
+        if key in NON_FILTER_PARAMS:
+            continue
+        values = value if isinstance(value, list) else [value]
+        values = [str(v).strip() for v in values if v is not None and str(v).strip() != '']
+        if values:
+            canonical[key] = values
+    payload = {'filters': canonical, 'extra': extra or {}}
+    return (prefix, get_catalog_version(), json.dumps(payload, sort_keys=True, default=str))
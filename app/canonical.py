@@ -0,0 +1,41 @@
+# app/canonical.py
+from sqlalchemy import select, literal, union_all
+from .models import db, HVACDevice, DeviceCanonicalMetric, MODEL_MAP
+from .cache import bump_catalog_version
+from .forms import CANONICAL_METRICS
+
+
+def canonical_select(device_type, canonical_metric, attr):
+    hvac_table = HVACDevice.__table__
+    child_table = MODEL_MAP[device_type].__table__
+    value_column = child_table.c[attr] if attr in child_table.c else hvac_table.c[attr]
+    return select(
+        hvac_table.c.id.label('device_id'),
+        literal(canonical_metric).label('canonical_metric'),
+        hvac_table.c.device_type,
+        value_column.label('value'),
+    ).select_from(hvac_table.join(child_table, child_table.c.id == hvac_table.c.id))\
+     .where(hvac_table.c.device_type == device_type)\
+     .where(value_column.isnot(None))
+
+
+def refresh_canonical_metrics(device_type=None):
+    """Rebuilds device_canonical_metrics with one INSERT ... SELECT per device type. Returns the row count."""
+    canonical_table = DeviceCanonicalMetric.__table__
+    written = 0
+    for type_key in MODEL_MAP:
+        if device_type and type_key != device_type:
+            continue
+        db.session.execute(canonical_table.delete().where(canonical_table.c.device_type == type_key))
+        selects = [canonical_select(type_key, name, definition['sources'][type_key])
+                   for name, definition in CANONICAL_METRICS.items() if type_key in definition['sources']]
+        if not selects:
+            continue
+        stmt = canonical_table.insert().from_select(
+            ['device_id', 'canonical_metric', 'device_type', 'value'],
+            union_all(*selects)
+        )
+        written += db.session.execute(stmt).rowcount
+    bump_catalog_version()
+    db.session.commit()
+    return written
@@ -0,0 +1,115 @@
+# app/climate.py
+import numpy as np
+
+# EN 14825 reference heating seasons: hours per year in each 1 K outdoor temperature bin (°C)
+# and the design temperature of the building load line.
+CLIMATES = {
+    'average': {
+        'label': 'Average (Strasbourg)',
+        'design_temperature': -10,
+        'bin_hours': {
+            -10: 1, -9: 25, -8: 23, -7: 24, -6: 27, -5: 68, -4: 91, -3: 89, -2: 165, -1: 173,
+            0: 240, 1: 280, 2: 320, 3: 357, 4: 356, 5: 303, 6: 330, 7: 326, 8: 348, 9: 335,
+            10: 315, 11: 215, 12: 169, 13: 151, 14: 105, 15: 74,
+        },
+    },
+    'colder': {
+        'label': 'Colder (Helsinki)',
+        'design_temperature': -22,
+        'bin_hours': {
+            -22: 1, -21: 6, -20: 13, -19: 17, -18: 19, -17: 26, -16: 39, -15: 41, -14: 35, -13: 52,
+            -12: 37, -11: 41, -10: 43, -9: 54, -8: 90, -7: 125, -6: 169, -5: 195, -4: 278, -3: 306,
+            -2: 454, -1: 385, 0: 490, 1: 533, 2: 380, 3: 228, 4: 261, 5: 279, 6: 229, 7: 269,
+            8: 233, 9: 230, 10: 243, 11: 191, 12: 146, 13: 150, 14: 97, 15: 61,
+        },
+    },
+    'warmer': {
+        'label': 'Warmer (Athens)',
+        'design_temperature': 2,
+        'bin_hours': {
+            2: 3, 3: 22, 4: 63, 5: 63, 6: 175, 7: 162, 8: 259, 9: 360, 10: 428, 11: 430,
+            12: 503, 13: 444, 14: 384, 15: 294,
+        },
+    },
+}
+# No space heating is needed from this outdoor temperature on
+HEATING_LIMIT_TEMPERATURE = 16
+# Outdoor temperatures of the declared part-load points A, B and C (cop_am7/a2/a7, ph_am7/a2/a7)
+DECLARED_TEMPERATURES = np.array([-7.0, 2.0, 7.0])
+# Below the lowest declared point the COP is extrapolated, but never below direct electric heating
+MIN_COP = 1.0
+
+
+def climate_bins(climate=None, bin_hours=None, design_temperature=None):
+    """(temperatures, hours, design temperature) of a reference climate or of user-supplied bin hours."""
+    if bin_hours is None:
+        if climate not in CLIMATES:
+            raise ValueError(f"Unknown climate '{climate}', expected one of {', '.join(CLIMATES)}")
+        bin_hours = CLIMATES[climate]['bin_hours']
+        design_temperature = CLIMATES[climate]['design_temperature'] if design_temperature is None else design_temperature
+    temperatures = np.array(sorted(bin_hours), dtype=float)
+    hours = np.array([bin_hours[t] for t in sorted(bin_hours)], dtype=float)
+    if not len(temperatures) or (hours < 0).any() or hours.sum() <= 0:
+        raise ValueError("Bin hours must be non-negative and add up to more than zero")
+    if design_temperature is None:
+        design_temperature = temperatures.min()
+    if design_temperature >= HEATING_LIMIT_TEMPERATURE:
+        raise ValueError(f"Design temperature must be below {HEATING_LIMIT_TEMPERATURE} °C")
+    return temperatures, hours, float(design_temperature)
+
+
+def parse_bin_hours(value):
+    """Parses "-10:1,-9:25,..." (temperature:hours pairs) into a dict."""
+    bin_hours = {}
+    for pair in value.split(','):
+        temperature, _, hours = pair.strip().partition(':')
+        try:
+            bin_hours[float(temperature)] = float(hours)
+        except ValueError:
+            raise ValueError(f"Invalid bin '{pair.strip()}', expected temperature:hours")
+    return bin_hours
+
+
+def interpolate_declared(points, temperatures):
+    """
+    Piecewise-linear curves through the declared points (n x 3, at DECLARED_TEMPERATURES),
+    evaluated at every bin temperature (n x bins). Extrapolated below -7 °C, held above 7 °C.
+    """
+    t = np.minimum(temperatures, DECLARED_TEMPERATURES[-1])[None, :]
+    low = np.where(t <= DECLARED_TEMPERATURES[1], 0, 1)
+    t_low, t_high = DECLARED_TEMPERATURES[low], DECLARED_TEMPERATURES[low + 1]
+    rows = np.arange(len(points))[:, None]
+    v_low, v_high = points[rows, low], points[rows, low + 1]
+    return v_low + (v_high - v_low) * (t - t_low) / (t_high - t_low)
+
+
+def bin_method_energy(annual_heat_demand, temperatures, hours, design_temperature,
+                      cop_points, capacity_points, seasonal_cop):
+    """
+    Annual electricity (kWh) per heat pump by the bin method.
+
+    The heat demand is spread over the bins along the building load line, which is zero at
+    16 °C and reaches the design load at the design temperature. In each bin the heat pump
+    covers the load up to its interpolated capacity at the interpolated part-load COP; the
+    rest comes from an electric back-up heater. Rows without all three COP points use their
+    seasonal COP for every bin; rows without all three capacities get no back-up.
+    """
+    load_fraction = np.clip((HEATING_LIMIT_TEMPERATURE - temperatures) / (HEATING_LIMIT_TEMPERATURE - design_temperature), 0, None)
+    degree_hours = (hours * load_fraction).sum()
+    design_load = annual_heat_demand / degree_hours if degree_hours > 0 else 0.0
+    load = design_load * load_fraction[None, :]
+
+    cop = np.maximum(interpolate_declared(cop_points, temperatures), MIN_COP)
+    cop = np.where(np.isnan(cop_points).any(axis=1)[:, None], np.asarray(seasonal_cop, dtype=float)[:, None], cop)
+    capacity = interpolate_declared(capacity_points, temperatures)
+    capacity = np.where(np.isnan(capacity_points).any(axis=1)[:, None], np.inf, np.maximum(capacity, 0))
+
+    heat_pump_heat = np.minimum(load, capacity)
+    backup_heat = load - heat_pump_heat
+    electricity = (hours * (heat_pump_heat / cop + backup_heat)).sum(axis=1)
+    return {
+        'design_load_kw': design_load,
+        'electricity_kwh': electricity,
+        'backup_heat_kwh': (hours * backup_heat).sum(axis=1),
+        'seasonal_cop': np.divide(annual_heat_demand, electricity, out=np.full(len(electricity), np.nan), where=electricity > 0),
+    }
@@ -0,0 +1,44 @@
+# app/commands.py
+import click
+from .models import MODEL_MAP
+from .validity import refresh_validity_flags
+from .outliers import refresh_outlier_flags
+from .ranks import refresh_metric_ranks
+from .canonical import refresh_canonical_metrics
+from .utils import refresh_device_components
+
+
+def register_commands(app):
+    @app.cli.command('refresh-validity')
+    @click.option('--device-type', type=click.Choice(list(MODEL_MAP.keys())), default=None)
+    def refresh_validity_command(device_type):
+        """Re-evaluate the plausibility rules for existing devices."""
+        updated = refresh_validity_flags(device_type)
+        click.echo(f"Validity flags refreshed for {updated} devices.")
+
+    @app.cli.command('refresh-outliers')
+    @click.option('--device-type', type=click.Choice(list(MODEL_MAP.keys())), default=None)
+    def refresh_outliers_command(device_type):
+        """Recompute the statistical outlier flags (median/MAD per capacity bin)."""
+        flagged = refresh_outlier_flags(device_type)
+        click.echo(f"Outlier flags refreshed: {flagged} flagged values.")
+
+    @app.cli.command('refresh-ranks')
+    @click.option('--device-type', type=click.Choice(list(MODEL_MAP.keys())), default=None)
+    def refresh_ranks_command(device_type):
+        """Recompute the percentile ranks per device type and entry year."""
+        written = refresh_metric_ranks(device_type)
+        click.echo(f"Percentile ranks refreshed: {written} rows.")
+
+    @app.cli.command('refresh-canonical')
+    @click.option('--device-type', type=click.Choice(list(MODEL_MAP.keys())), default=None)
+    def refresh_canonical_command(device_type):
+        """Rebuild the cross-type canonical metrics table."""
+        written = refresh_canonical_metrics(device_type)
+        click.echo(f"Canonical metrics refreshed: {written} rows.")
+
+    @app.cli.command('refresh-components')
+    def refresh_components_command():
+        """Rebuild the model identifier component index."""
+        written = refresh_device_components()
+        click.echo(f"Device components refreshed: {written} rows.")
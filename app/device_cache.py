@@ -0,0 +1,223 @@
+# app/device_cache.py
+import json
+import os
+import sqlite3
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import HVACDevice
+from .cache import LRUCache
+
+# Read-through cache of serialized devices (to_dict payloads) keyed by id. Entries are dropped
+# one by one when a device row changes: a session hook collects the ids of inserted, updated and
+# deleted devices and invalidates them once the transaction commits. Bulk Core updates bypass the
+# hook (and may run in another process, e.g. the CLI); the only one (refresh-validity) writes
+# validity_flags and through it the generated is_plausible, both of which to_dict() leaves out
+# (SERIALIZER_EXCLUDED_COLUMNS, GENERATED_COLUMNS), so no cached payload goes stale.
+#
+# With config DEVICE_CACHE_PATH set, payloads are also kept in a SQLite file shared by all workers
+# on the host. Invalidations are appended to a log there, which every worker reads before a lookup
+# to drop the same ids from its in-process layer.
+
+# Invalidation log rows kept; a worker that fell further behind clears its in-process layer
+INVALIDATION_LOG_SIZE = 10000
+
+
+class SharedPayloadStore:
+    """Bounded (oldest entries dropped first) payload store plus invalidation log in a SQLite file."""
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS device_payloads "
+                         "(entry INTEGER PRIMARY KEY AUTOINCREMENT, device_id INTEGER NOT NULL UNIQUE, payload TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS invalidations "
+                         "(seq INTEGER PRIMARY KEY AUTOINCREMENT, device_id INTEGER NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread and process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def last_seq(self):
+        return self._connect().execute("SELECT coalesce(max(seq), 0) FROM invalidations").fetchone()[0]
+
+    def invalidations_since(self, seq):
+        """(latest seq, ids invalidated after seq), or (latest seq, None) if the log no longer reaches back."""
+        rows = self._connect().execute(
+            "SELECT seq, device_id FROM invalidations WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        if not rows:
+            return seq, []
+        if rows[0][0] != seq + 1:
+            return rows[-1][0], None
+        return rows[-1][0], [device_id for _, device_id in rows]
+
+    def get(self, device_id):
+        row = self._connect().execute("SELECT payload FROM device_payloads WHERE device_id = ?", (device_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, device_id, payload, seq):
+        """Stores the payload unless an invalidation was logged after seq (the value may be stale)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT coalesce(max(seq), 0) FROM invalidations").fetchone()[0] == seq:
+                entry = conn.execute("INSERT OR REPLACE INTO device_payloads (device_id, payload) VALUES (?, ?)",
+                                     (device_id, json.dumps(payload))).lastrowid
+                conn.execute("DELETE FROM device_payloads WHERE entry <= ?", (entry - self.maxsize,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, device_ids):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM device_payloads WHERE device_id = ?", [(i,) for i in device_ids])
+            seq = None
+            for device_id in device_ids:
+                seq = conn.execute("INSERT INTO invalidations (device_id) VALUES (?)", (device_id,)).lastrowid
+            if seq is not None:
+                conn.execute("DELETE FROM invalidations WHERE seq <= ?", (seq - INVALIDATION_LOG_SIZE,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM device_payloads")
+
+
+class DeviceCache:
+    def __init__(self, maxsize=4096):
+        self.local = LRUCache(maxsize=maxsize)
+        self.shared = None
+        self.shared_hits = 0
+        self.shared_misses = 0
+        # Bumped on every invalidation applied here; a value loaded before a bump is not stored
+        self._generation = 0
+        self._shared_seq = 0
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, shared_path=None, shared_maxsize=None):
+        if maxsize:
+            self.local = LRUCache(maxsize=maxsize)
+        self.shared = SharedPayloadStore(shared_path, shared_maxsize or 10 * self.local.maxsize) if shared_path else None
+        self._shared_seq = self.shared.last_seq() if self.shared else 0
+
+    def _sync(self):
+        """Applies invalidations other workers logged in the shared store since the last lookup."""
+        seq, device_ids = self.shared.invalidations_since(self._shared_seq)
+        if seq == self._shared_seq:
+            return
+        with self._lock:
+            if seq <= self._shared_seq:
+                return
+            if device_ids is None:
+                self.local.clear()
+            else:
+                for device_id in device_ids:
+                    self.local.discard(device_id)
+            self._shared_seq = seq
+            self._generation += 1
+
+    def get(self, device_id, loader):
+        """The cached payload, or loader(device_id) (None for a missing device, which is not cached)."""
+        if self.shared is not None:
+            self._sync()
+        generation, shared_seq = self._generation, self._shared_seq
+        payload = self.local.get(device_id)
+        if payload is not None:
+            return payload
+        if self.shared is not None:
+            payload = self.shared.get(device_id)
+            if payload is not None:
+                self.shared_hits += 1
+            else:
+                self.shared_misses += 1
+        if payload is None:
+            payload = loader(device_id)
+            if payload is None:
+                return None
+            if self.shared is not None:
+                self.shared.set(device_id, payload, shared_seq)
+        with self._lock:
+            if self._generation == generation:
+                self.local.set(device_id, payload)
+        return payload
+
+    def invalidate(self, device_ids):
+        device_ids = sorted(set(device_ids))
+        if not device_ids:
+            return
+        with self._lock:
+            for device_id in device_ids:
+                self.local.discard(device_id)
+            self._generation += 1
+        if self.shared is not None:
+            self.shared.invalidate(device_ids)
+
+    def clear(self):
+        with self._lock:
+            self.local.clear()
+            self._generation += 1
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        lookups = self.local.hits + self.local.misses
+        database_loads = self.shared_misses if self.shared is not None else self.local.misses
+        stats = {
+            'size': len(self.local),
+            'maxsize': self.local.maxsize,
+            'lookups': lookups,
+            'hits': self.local.hits,
+            'hit_rate': round(self.local.hits / lookups, 4) if lookups else None,
+            'database_loads': database_loads,
+            'overall_hit_rate': round(1 - database_loads / lookups, 4) if lookups else None,
+        }
+        if self.shared is not None:
+            shared_lookups = self.shared_hits + self.shared_misses
+            stats['shared'] = {
+                'path': self.shared.path,
+                'hits': self.shared_hits,
+                'hit_rate': round(self.shared_hits / shared_lookups, 4) if shared_lookups else None,
+            }
+        return stats
+
+
+device_cache = DeviceCache()
+
+
+def configure_device_cache(config):
+    device_cache.configure(maxsize=config.get('DEVICE_CACHE_SIZE'),
+                           shared_path=config.get('DEVICE_CACHE_PATH'),
+                           shared_maxsize=config.get('DEVICE_CACHE_SHARED_SIZE'))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_devices(session, flush_context):
+    changed = session.info.setdefault('changed_device_ids', set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, HVACDevice) and instance.id is not None:
+            changed.add(instance.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_devices(session):
+    device_cache.invalidate(session.info.pop('changed_device_ids', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_devices(session):
+    session.info.pop('changed_device_ids', None)
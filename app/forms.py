@@ -1,11 +1,12 @@
 # app/forms.py
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, IntegerField, FloatField, SubmitField, SelectField, TextAreaField, SelectMultipleField, RadioField, DecimalField
+from wtforms import StringField, IntegerField, FloatField, SubmitField, SelectField, TextAreaField, SelectMultipleField, RadioField, DecimalField, BooleanField
 from wtforms.fields import DateField # Ensure DateField is imported if used elsewhere
 from wtforms.validators import DataRequired, Optional, NumberRange, ValidationError, InputRequired
 import json
 from .models import DEVICE_TYPES # For DEVICE_TYPE_CHOICES
+from .climate import CLIMATES
 
 # Field Definitions, to be extended with additional device types
 FIELD_DEFINITIONS = {
@@ -14,11 +15,16 @@ FIELD_DEFINITIONS = {
     'manufacturer': {'label': 'Manufacturer', 'model_attr': 'manufacturer', 'model_class_name': 'HVACDevice', 'type': 'string', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': True},
     'model_identifier': {'label': 'Model Identifier', 'model_attr': 'model_identifier', 'model_class_name': 'HVACDevice', 'type': 'string', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': False},
     'market_entry': {'label': 'Market Entry Date', 'model_attr': 'market_entry', 'model_class_name': 'HVACDevice', 'type': 'date', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': True}, # Group by year special
+    'entry_year': {'label': 'Market Entry Year', 'model_attr': 'entry_year', 'model_class_name': 'HVACDevice', 'type': 'integer', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
+    'market_life_days': {'label': 'Market Life (days)', 'model_attr': 'market_life_days', 'model_class_name': 'HVACDevice', 'type': 'integer', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
+    'price_amount': {'label': 'Price', 'model_attr': 'price_amount', 'model_class_name': 'HVACDevice', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
     'noise_level_dba': {'label': 'Noise Level (dBA)', 'model_attr': 'noise_level_dba', 'model_class_name': 'HVACDevice', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
     # AC
     'ac_seer': {'label': 'SEER (AC)', 'model_attr': 'seer', 'model_class_name': 'AirConditioner', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
     'ac_scop_average': {'label': 'SCOP Average (AC)', 'model_attr': 'scop_average', 'model_class_name': 'AirConditioner', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
+    'ac_noise_level_outdoor_cooling_db': {'label': 'Outdoor Noise Cooling (AC dB)', 'model_attr': 'noise_level_outdoor_cooling_db', 'model_class_name': 'AirConditioner', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
     'ac_refrigerant_type': {'label': 'Refrigerant (AC)', 'model_attr': 'refrigerant_type', 'model_class_name': 'AirConditioner', 'type': 'string', 'metric': False, 'searchable':True, 'displayable':True, 'groupable':True},
+    'ac_energy_class_cooling': {'label': 'Energy Class Cooling (AC)', 'model_attr': 'energy_class_cooling', 'model_class_name': 'AirConditioner', 'type': 'string', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': True},
 
     # HP
     'hp_refrigerant': {'label': 'Refrigerant (HP)', 'model_attr': 'refrigerant', 'model_class_name': 'HeatPump', 'type': 'string', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': True},
@@ -30,11 +36,51 @@ FIELD_DEFINITIONS = {
     # RVU
     'rvu_specificpowerinput': {'label': 'Specific Power Input (RVU)', 'model_attr': 'specificpowerinput', 'model_class_name': 'ResidentialVentilationUnit', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
     'rvu_typology': {'label': 'Typology (RVU)', 'model_attr': 'typology', 'model_class_name': 'ResidentialVentilationUnit', 'type': 'string', 'metric': False, 'searchable':True, 'displayable':True, 'groupable':True},
+    'rvu_energyclass': {'label': 'Energy Class (RVU)', 'model_attr': 'energyclass', 'model_class_name': 'ResidentialVentilationUnit', 'type': 'string', 'metric': False, 'searchable': True, 'displayable': True, 'groupable': True},
     'rvu_thermalefficiencyheatrecovery': {'label': 'Thermal Eff. Heat Rec. (RVU %)', 'model_attr': 'thermalefficiencyheatrecovery', 'model_class_name': 'ResidentialVentilationUnit', 'type': 'float', 'metric': True, 'searchable': True, 'displayable': True, 'groupable': False},
 }
+# Metrics with stored percentile ranks per device type and entry year (device_metric_ranks, see app/ranks.py)
+PERCENTILE_RANK_METRICS = ['ac_seer', 'ac_scop_average', 'hp_scop_avg_lwt35', 'hp_cop_a7_w35', 'rvu_specificpowerinput', 'rvu_thermalefficiencyheatrecovery']
+
+# The same quantity under different column names per device type, stored side by side in
+# device_canonical_metrics (see app/canonical.py) so cross-type comparisons read one table
+CANONICAL_METRICS = {
+    'seasonal_heating_efficiency': {
+        'label': 'Seasonal Heating Efficiency (SCOP, average climate)',
+        'sources': {'air_conditioner': 'scop_average', 'heat_pump': 'scop_avg_lwt35'},
+    },
+    'seasonal_cooling_efficiency': {
+        'label': 'Seasonal Cooling Efficiency (SEER)',
+        'sources': {'air_conditioner': 'seer', 'heat_pump': 'seer_ac'},
+    },
+    'heating_efficiency_percent': {
+        'label': 'Seasonal Space Heating Efficiency ηs (%)',
+        'sources': {'air_conditioner': 'eta_s_heating_average_percent', 'heat_pump': 'eta_sh_avg_lwt35'},
+    },
+    'heating_design_load_kw': {
+        'label': 'Heating Design Load (kW)',
+        'sources': {'air_conditioner': 'design_load_heating_average_kw', 'heat_pump': 'pdesignh_avg_lwt35'},
+    },
+    'cooling_capacity_kw': {
+        'label': 'Cooling Capacity (kW)',
+        'sources': {'air_conditioner': 'design_load_cooling_kw', 'heat_pump': 'pc_a35_w12_7'},
+    },
+    'noise_db': {
+        'label': 'Noise (dB, outdoor / sound power / dBA by type)',
+        'sources': {'air_conditioner': 'noise_level_outdoor_cooling_db', 'heat_pump': 'sound_power_level_lw',
+                    'residential_ventilation_unit': 'noise_level_dba'},
+    },
+}
+
 SPECIAL_GROUPING_OPTIONS = {
-    'market_entry_year': {'label': 'Market Entry Year', 'model_attr': 'market_entry'} # Actual attr is market_entry
+    'market_entry_year': {'label': 'Market Entry Year', 'model_attr': 'entry_year'}, # Stored generated column
 }
+for rank_metric in PERCENTILE_RANK_METRICS:
+    SPECIAL_GROUPING_OPTIONS[f'{rank_metric}_decile'] = {
+        'label': f"{FIELD_DEFINITIONS[rank_metric]['label']} Decile (within Entry Year)",
+        'model_attr': 'decile',
+        'rank_metric': rank_metric,
+    }
 
 DEVICE_TYPE_MODEL_MAPPING = {
     'air_conditioner': 'AirConditioner',
@@ -61,8 +107,9 @@ def get_initial_choices(purpose='displayable'):
             seen_names.add(name)
             
     if purpose == 'groupable':
-        if 'market_entry_year' not in seen_names:
-             choices.append(('market_entry_year', 'Market Entry Year'))
+        for name, definition in SPECIAL_GROUPING_OPTIONS.items():
+            if name not in seen_names:
+                choices.append((name, definition['label']))
     return choices
 
 
@@ -124,6 +171,33 @@ class SearchForm(FlaskForm):
     manufacturer = StringField('Filter by Manufacturer', validators=[Optional()])
     device_type = SelectField('Filter by Device Type', choices=DEVICE_TYPE_CHOICES, validators=[Optional()], id="device_type_select")
     id_or_model_identifier = StringField('Search by ID or Model Identifier', validators=[Optional()])
+    component = StringField(
+        'Contains Unit',
+        validators=[Optional()],
+        render_kw={"placeholder": "Indoor/outdoor unit code, e.g. MSZ-SF15VA"}
+    )
+    on_market_at = DateField('On the Market At', format='%Y-%m-%d', validators=[Optional()])
+    plausible_only = BooleanField('Only plausible data (passes all range checks)')
+    percentile_metric = SelectField(
+        'Percentile Rank Metric',
+        choices=[('', '-- Select Metric --')] + [(name, FIELD_DEFINITIONS[name]['label']) for name in PERCENTILE_RANK_METRICS],
+        validators=[Optional()]
+    )
+    percentile_min = FloatField('Percentile From', validators=[Optional(), NumberRange(min=0, max=100)], render_kw={"placeholder": "e.g. 90 for the top 10%"})
+    percentile_max = FloatField('Percentile To', validators=[Optional(), NumberRange(min=0, max=100)], render_kw={"placeholder": "e.g. 10 for the bottom 10%"})
+    canonical_metric = SelectField(
+        'Cross-Type Metric',
+        choices=[('', '-- Select Metric --')] + [(name, definition['label']) for name, definition in CANONICAL_METRICS.items()],
+        validators=[Optional()]
+    )
+    canonical_min = FloatField('Minimum', validators=[Optional()])
+    canonical_max = FloatField('Maximum', validators=[Optional()])
+    outliers = SelectField(
+        'Statistical Outliers',
+        choices=[('', 'Include outliers'), ('exclude', 'Exclude outliers'), ('only', 'Only outliers')],
+        validators=[Optional()],
+        description="Median/MAD outliers within device type and capacity class, e.g. unit mix-ups."
+    )
 
     # Core Metric Filters
     search_metric_name = SelectField('Metric to Search', validators=[Optional()], id="search_metric_name_select")
@@ -193,19 +267,29 @@ class TCOCalculatorForm(FlaskForm):
     discount_rate = FloatField('Discount Rate (e.g., 0.04 for 4%)', validators=[InputRequired(), NumberRange(min=0, max=1)], description="...")
     capital_cost_subsidy = FloatField('Capital Cost Subsidy (%)', validators=[Optional(), NumberRange(min=0)], default=0.0, description="...")
 
-    hp_data_source = RadioField('Heat Pump Data Source', choices=[('custom', 'Enter Custom HP Data'), ('database', 'Select HP from Database')], default='custom', validators=[InputRequired()])
+    hp_data_source = RadioField('Heat Pump Data Source', choices=[('custom', 'Enter Custom HP Data'), ('database', 'Select HP from Database'), ('rank', 'Rank All Database Heat Pumps')], default='custom', validators=[InputRequired()])
 
     custom_hp_price = FloatField('HP Capital Cost (€) (Custom)', validators=[Optional(), NumberRange(min=0)], description="...")
     custom_hp_scop = FloatField('SCOP (Custom HP)', validators=[Optional(), NumberRange(min=0.1)], description="...")
 
+    # Options are filled by the typeahead (/api/heat_pumps/lookup); the view checks the id exists
     db_hp_id = SelectField(
         'Select Heat Pump from Database', 
         coerce=coerce_int_or_none,
         validators=[Optional()],
-        description="Choose an existing heat pump from the database."
+        validate_choice=False,
+        description="Type a manufacturer or model to search the database."
     )
     db_hp_price_override = FloatField('HP Capital Cost (€) (DB HP)', validators=[Optional(), NumberRange(min=0)], description="...")
-    
+
+    rank_min_capacity = FloatField('Min. Design Capacity (kW, LWT 35)', validators=[Optional(), NumberRange(min=0)])
+    rank_max_capacity = FloatField('Max. Design Capacity (kW, LWT 35)', validators=[Optional(), NumberRange(min=0)])
+    rank_top_n = IntegerField('Number of Heat Pumps to Show', validators=[Optional(), NumberRange(min=1, max=100)], default=20)
+    climate = SelectField('Climate', choices=[('', 'Declared SCOP (no climate model)')] + [(key, climate['label']) for key, climate in CLIMATES.items()],
+                          validators=[Optional()], default='', description="Bin-method consumption from the declared part-load COPs.")
+    flow_temperature = SelectField('Flow Temperature', choices=[(35, '35 °C (underfloor heating)'), (55, '55 °C (radiators)')],
+                                   coerce=int, validators=[Optional()], default=35)
+
     submit = SubmitField('Calculate TCO')
 
     def validate(self, extra_validators=None):
@@ -224,4 +308,39 @@ class TCOCalculatorForm(FlaskForm):
             if self.db_hp_id.data is None: 
                 self.db_hp_id.errors.append('Please select a heat pump from the database.')
                 valid_form = False
+        elif self.hp_data_source.data == 'rank':
+            if self.rank_min_capacity.data is not None and self.rank_max_capacity.data is not None \
+                    and self.rank_min_capacity.data > self.rank_max_capacity.data:
+                self.rank_max_capacity.errors.append('Max. capacity must not be below min. capacity.')
+                valid_form = False
         return valid_form
+
+
+AC_CLIMATE_ZONE_CHOICES = [('average', 'Average'), ('warmer', 'Warmer'), ('colder', 'Colder')]
+
+
+class ACTCOCalculatorForm(FlaskForm):
+    climate_zone = SelectField('Climate Zone', choices=AC_CLIMATE_ZONE_CHOICES, default='average', validators=[InputRequired()])
+    usage = SelectField('Usage', choices=[('both', 'Cooling and Heating'), ('cooling', 'Cooling Only'), ('heating', 'Heating Only')], default='both', validators=[InputRequired()])
+    annual_cooling_demand = FloatField('Annual Cooling Demand (kWh/year)', validators=[Optional(), NumberRange(min=0)], description="Leave empty to use the declared annual cooling consumption.")
+    annual_heating_demand = FloatField('Annual Heating Demand (kWh/year)', validators=[Optional(), NumberRange(min=0)], description="Leave empty to use the declared annual heating consumption of the climate zone.")
+    electricity_price = FloatField('Electricity Price (€/kWh or similar)', validators=[InputRequired(), NumberRange(min=0)])
+    annual_maintenance_cost = FloatField('Annual Maintenance Cost (€/year)', validators=[InputRequired(), NumberRange(min=0)])
+    system_lifetime = IntegerField('System Lifetime (Years)', validators=[InputRequired(), NumberRange(min=1, max=50)])
+    discount_rate = FloatField('Discount Rate (e.g., 0.04 for 4%)', validators=[InputRequired(), NumberRange(min=0, max=1)])
+    capital_cost_subsidy = FloatField('Capital Cost Subsidy (%)', validators=[Optional(), NumberRange(min=0)], default=0.0)
+
+    min_cooling_capacity = FloatField('Min. Cooling Design Load (kW)', validators=[Optional(), NumberRange(min=0)])
+    max_cooling_capacity = FloatField('Max. Cooling Design Load (kW)', validators=[Optional(), NumberRange(min=0)])
+    top_n = IntegerField('Number of Air Conditioners to Show', validators=[Optional(), NumberRange(min=1, max=100)], default=20)
+
+    submit = SubmitField('Rank Air Conditioners')
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if self.min_cooling_capacity.data is not None and self.max_cooling_capacity.data is not None \
+                and self.min_cooling_capacity.data > self.max_cooling_capacity.data:
+            self.max_cooling_capacity.errors.append('Max. capacity must not be below min. capacity.')
+            return False
+        return True
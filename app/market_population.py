@@ -0,0 +1,70 @@
+# app/market_population.py
+import numpy as np
+import pandas as pd
+
+
+def to_months(values):
+    """Converts dates (or anything pandas can parse) to months since 1970-01 as int64; missing -> -1."""
+    as_datetime = pd.to_datetime(pd.Series(values, dtype='object'), errors='coerce')
+    months = as_datetime.to_numpy(dtype='datetime64[M]').astype('int64')
+    months[as_datetime.isna().to_numpy()] = -1
+    return months
+
+
+def monthly_market_population(market_entry, market_exit, start=None, end=None):
+    """
+    Monthly market population from entry/exit dates in one counting-sort sweep.
+
+    A device counts as on the market from its entry month up to (not including)
+    its exit month, matching the [market_entry, market_exit) range used by the
+    market_period column. Devices without an entry date, or with an exit before
+    their entry, are ignored.
+
+    Args:
+        market_entry, market_exit: Sequences of dates of equal length (exit may be None/NaT).
+        start, end: Optional first/last month to report (anything pd.Timestamp accepts).
+
+    Returns:
+        pandas.DataFrame with one row per month: month, active (on the market at the
+        end of the month), entries, exits and churn_rate (exits / active at the start
+        of the month).
+    """
+    entry_months = to_months(market_entry)
+    exit_months = to_months(market_exit)
+
+    valid = (entry_months >= 0) & ((exit_months < 0) | (exit_months >= entry_months))
+    entry_months = entry_months[valid]
+    exit_months = exit_months[valid]
+
+    columns = ['month', 'active', 'entries', 'exits', 'churn_rate']
+    if entry_months.size == 0:
+        return pd.DataFrame(columns=columns)
+
+    has_exit = exit_months >= 0
+    first_month = int(entry_months.min())
+    last_month = int(max(entry_months.max(), exit_months[has_exit].max() if has_exit.any() else first_month))
+    if end is not None:
+        last_month = max(last_month, int(to_months([end])[0]))
+    span = last_month - first_month + 1
+
+    entries = np.bincount(entry_months - first_month, minlength=span)
+    exits = np.bincount(exit_months[has_exit] - first_month, minlength=span)
+    active = np.cumsum(entries) - np.cumsum(exits)
+    active_at_start = np.concatenate(([0], active[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        churn_rate = np.where(active_at_start > 0, exits / active_at_start, np.nan)
+
+    months = np.arange(first_month, last_month + 1).astype('datetime64[M]')
+    population = pd.DataFrame({
+        'month': months.astype('datetime64[ns]'),
+        'active': active,
+        'entries': entries,
+        'exits': exits,
+        'churn_rate': churn_rate,
+    }, columns=columns)
+
+    if start is not None:
+        population = population[population['month'] >= pd.Timestamp(start).to_period('M').to_timestamp()]
+    if end is not None:
+        population = population[population['month'] <= pd.Timestamp(end).to_period('M').to_timestamp()]
+    return population.reset_index(drop=True)
@@ -2,8 +2,10 @@ from datetime import datetime, date
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Column, Integer, String, Float, DateTime, TIMESTAMP, JSON, Date, ForeignKey, Text
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import DATERANGE
+from sqlalchemy.sql import func, text
 import json
+from .serializers import RowSerializer
 
 db = SQLAlchemy()
 
@@ -26,16 +28,40 @@ class HVACDevice(db.Model):
     
     market_entry = db.Column(db.Date, nullable=True, index=True)
     market_exit = db.Column(db.Date, nullable=True)
+    # [market_entry, market_exit) as a range, so "on the market at date X" is a GiST lookup (market_period @> X)
+    market_period = db.Column(DATERANGE, db.Computed(
+        "CASE WHEN market_entry IS NOT NULL AND (market_exit IS NULL OR market_exit >= market_entry) "
+        "THEN daterange(market_entry, market_exit, '[)') END", persisted=True))
+    entry_year = db.Column(db.Integer, db.Computed("EXTRACT(YEAR FROM market_entry)::integer", persisted=True), index=True)
+    market_life_days = db.Column(db.Integer, db.Computed("market_exit - market_entry", persisted=True), index=True)
     noise_level_dba = db.Column(db.Float, nullable=True)
     price_currency = db.Column(db.String(3), nullable=True)
     price_amount = db.Column(db.Float, nullable=True)
     data_source = db.Column(db.String(255), nullable=True)
+
+    # Bit i set = PLAUSIBILITY_RULES[i] (app/validity.py) violated; evaluated once at import
+    validity_flags = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    is_plausible = db.Column(db.Boolean, db.Computed("validity_flags = 0", persisted=True), index=True)
     
     created_at = db.Column(db.TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = db.Column(db.TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
     
     device_type = db.Column(db.String(50), nullable=False, index=True)
 
+    # Normalized unit codes of (multi-split) model identifiers, for exact component lookups
+    components = db.relationship('DeviceComponent', cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        # Search and trend queries filter on device type together with a market entry range
+        db.Index('ix_hvacdevices_device_type_market_entry', 'device_type', 'market_entry'),
+        # "Currently on market" snapshots: (market_exit IS NULL OR market_exit > CURRENT_DATE).
+        # The partial index serves the IS NULL branch, ix_hvacdevices_market_exit the other one.
+        db.Index('ix_hvacdevices_on_market', 'device_type', 'market_entry', postgresql_where=text('market_exit IS NULL')),
+        db.Index('ix_hvacdevices_market_exit', 'market_exit'),
+        db.Index('ix_hvacdevices_market_period', 'market_period', postgresql_using='gist'),
+        db.Index('ix_hvacdevices_device_type_entry_year', 'device_type', 'entry_year'),
+    )
+
     __mapper_args__ = {
         'polymorphic_identity': 'hvac_device_base',
         'polymorphic_on': device_type
@@ -45,21 +71,7 @@ class HVACDevice(db.Model):
         return f'<{self.__class__.__name__} {self.id}: {self.manufacturer} {self.model_identifier}>'
 
     def to_dict(self):
-        common_data = {
-            'id': self.id,
-            'device_type': DEVICE_TYPES.get(self.device_type, self.device_type),
-            'manufacturer': self.manufacturer,
-            'model_identifier': self.model_identifier,
-            'market_entry': self.market_entry.isoformat() if isinstance(self.market_entry, date) else None,
-            'market_exit': self.market_exit.isoformat() if isinstance(self.market_exit, date) else None,
-            'noise_level_dba': self.noise_level_dba,
-            'price_currency': self.price_currency,
-            'price_amount': self.price_amount,
-            'data_source': self.data_source,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
-        return common_data
+        return device_serializer(type(self)).from_instance(self)
     
 
 # Air Conditioner
@@ -69,7 +81,7 @@ class AirConditioner(HVACDevice):
     id = db.Column(db.Integer, ForeignKey('hvacdevices.id'), primary_key=True)
 
     eer = db.Column(db.Float, nullable=True)
-    seer = db.Column(db.Float, nullable=True)
+    seer = db.Column(db.Float, nullable=True, index=True)
     rated_power_cooling_kw = db.Column(db.Float, nullable=True)
     energy_class_cooling = db.Column(db.String(50), nullable=True)
     design_load_cooling_kw = db.Column(db.Float, nullable=True)
@@ -77,7 +89,7 @@ class AirConditioner(HVACDevice):
 
     rated_power_heating_kw = db.Column(db.Float, nullable=True)
     cop_standard = db.Column(db.Float, nullable=True)
-    scop_average = db.Column(db.Float, nullable=True)
+    scop_average = db.Column(db.Float, nullable=True, index=True)
     energy_class_heating_average = db.Column(db.String(50), nullable=True)
     design_load_heating_average_kw = db.Column(db.Float, nullable=True)
     annual_consumption_heating_average_kwh = db.Column(db.Float, nullable=True)
@@ -145,73 +157,16 @@ class AirConditioner(HVACDevice):
     capacity_control_type = db.Column(db.String(100), nullable=True)
     degradation_coeff_cooling_cd = db.Column(db.Float, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_air_conditioners_design_load_cooling_kw_seer', 'design_load_cooling_kw', 'seer'),
+        # Top-N per group (/api/top): rows come out of the index already ordered within each refrigerant
+        db.Index('ix_air_conditioners_refrigerant_type_seer', 'refrigerant_type', db.text('seer DESC NULLS LAST')),
+    )
+
     __mapper_args__ = {
         'polymorphic_identity': 'air_conditioner',
     }
 
-    def to_dict(self):
-        data = super().to_dict()
-        data.update({
-            'eer': self.eer,
-            'seer': self.seer,
-            'rated_power_cooling_kw': self.rated_power_cooling_kw,
-            'energy_class_cooling': self.energy_class_cooling,
-            'design_load_cooling_kw': self.design_load_cooling_kw,
-            'annual_consumption_cooling_kwh': self.annual_consumption_cooling_kwh,
-            'rated_power_heating_kw': self.rated_power_heating_kw,
-            'cop_standard': self.cop_standard,
-            'scop_average': self.scop_average,
-            'energy_class_heating_average': self.energy_class_heating_average,
-            'design_load_heating_average_kw': self.design_load_heating_average_kw,
-            'annual_consumption_heating_average_kwh': self.annual_consumption_heating_average_kwh,
-            'scop_warm': self.scop_warm,
-            'energy_class_heating_warm': self.energy_class_heating_warm,
-            'design_load_heating_warm_kw': self.design_load_heating_warm_kw,
-            'annual_consumption_heating_warm_kwh': self.annual_consumption_heating_warm_kwh,
-            'scop_cold': self.scop_cold,
-            'energy_class_heating_cold': self.energy_class_heating_cold,
-            'design_load_heating_cold_kw': self.design_load_heating_cold_kw,
-            'annual_consumption_heating_cold_kwh': self.annual_consumption_heating_cold_kwh,
-            'refrigerant_type': self.refrigerant_type,
-            'refrigerant_gwp': self.refrigerant_gwp,
-            'noise_level_outdoor_cooling_db': self.noise_level_outdoor_cooling_db,
-            'model_identifier': self.model_identifier,
-            'eta_s_cooling_percent': self.eta_s_cooling_percent,
-            'eta_s_heating_average_percent': self.eta_s_heating_average_percent,
-            'eta_s_heating_warm_percent': self.eta_s_heating_warm_percent,
-            'eta_s_heating_cold_percent': self.eta_s_heating_cold_percent,
-            'pc_cooling_cond_b_kw': self.pc_cooling_cond_b_kw,
-            'eer_cooling_cond_b': self.eer_cooling_cond_b,
-            'pc_cooling_cond_c_kw': self.pc_cooling_cond_c_kw,
-            'eer_cooling_cond_c': self.eer_cooling_cond_c,
-            'pc_cooling_cond_d_kw': self.pc_cooling_cond_d_kw,
-            'eer_cooling_cond_d': self.eer_cooling_cond_d,
-            'ph_heating_cond_a_kw': self.ph_heating_cond_a_kw,
-            'cop_heating_cond_a': self.cop_heating_cond_a,
-            'ph_heating_cond_b_kw': self.ph_heating_cond_b_kw,
-            'cop_heating_cond_b': self.cop_heating_cond_b,
-            'ph_heating_cond_c_kw': self.ph_heating_cond_c_kw,
-            'cop_heating_cond_c': self.cop_heating_cond_c,
-            'ph_heating_cond_d_kw': self.ph_heating_cond_d_kw,
-            'cop_heating_cond_d': self.cop_heating_cond_d,
-            'tol_temp_heating': self.tol_temp_heating,
-            'ph_heating_tol_kw': self.ph_heating_tol_kw,
-            'cop_heating_tol': self.cop_heating_tol,
-            'tbiv_temp_heating': self.tbiv_temp_heating,
-            'ph_heating_tbiv_kw': self.ph_heating_tbiv_kw,
-            'cop_heating_tbiv': self.cop_heating_tbiv,
-            'power_standby_cooling_kw': self.power_standby_cooling_kw,
-            'power_off_cooling_kw': self.power_off_cooling_kw,
-            'power_standby_heating_kw': self.power_standby_heating_kw,
-            'power_off_heating_kw': self.power_off_heating_kw,
-            'noise_level_indoor_cooling_db': self.noise_level_indoor_cooling_db,
-            'noise_level_outdoor_heating_db': self.noise_level_outdoor_heating_db,
-            'noise_level_indoor_heating_db': self.noise_level_indoor_heating_db,
-            'capacity_control_type': self.capacity_control_type,
-            'degradation_coeff_cooling_cd': self.degradation_coeff_cooling_cd,
-        })
-        return data
-
 # Heat pump
 class HeatPump(HVACDevice):
     __tablename__ = 'heat_pumps'
@@ -247,8 +202,8 @@ class HeatPump(HVACDevice):
     eta_sc_ac = db.Column(db.Float, nullable=True)
 
     # Heating Performance - LWT 35°C (Average Climate) (Flattened KPIs)
-    pdesignh_avg_lwt35 = db.Column(db.Float, nullable=True)
-    scop_avg_lwt35 = db.Column(db.Float, nullable=True)
+    pdesignh_avg_lwt35 = db.Column(db.Float, nullable=True, index=True)
+    scop_avg_lwt35 = db.Column(db.Float, nullable=True, index=True)
     eta_sh_avg_lwt35 = db.Column(db.Float, nullable=True)
     ph_a7_w35 = db.Column(db.Float, nullable=True)
     cop_a7_w35 = db.Column(db.Float, nullable=True)
@@ -273,59 +228,14 @@ class HeatPump(HVACDevice):
     psbc_standby_cooling = db.Column(db.Float, nullable=True)
     psbh_standby_heating = db.Column(db.Float, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_heat_pumps_refrigerant_scop_avg_lwt35', 'refrigerant', db.text('scop_avg_lwt35 DESC NULLS LAST')),
+    )
+
     __mapper_args__ = {
         'polymorphic_identity': 'heat_pump',
     }
 
-    def to_dict(self):
-        data = super().to_dict()
-        data.update({
-            'trade_name': self.trade_name,
-            'model_type': self.model_type,
-            'software_name': self.software_name,
-            'software_version': self.software_version,
-            'refrigerant': self.refrigerant,
-            'main_power_supply': self.main_power_supply,
-            'control_of_pump_speed': self.control_of_pump_speed,
-            'reversibility_on_water_side': self.reversibility_on_water_side,
-            'simultaneous_heating': self.simultaneous_heating,
-            'esp_duct': self.esp_duct,
-            'outdoor_heat_exchanger_type': self.outdoor_heat_exchanger_type,
-            'indoor_heat_exchanger_type': self.indoor_heat_exchanger_type,
-            'expansion_valve_type': self.expansion_valve_type,
-            'unit_capacity_control': self.unit_capacity_control,
-            'compressor_type': self.compressor_type,
-            'compressor_inverter': self.compressor_inverter,
-            'compressor_number': self.compressor_number,
-            
-            # Flattened KPIs
-            'sound_power_level_lw': self.sound_power_level_lw,
-            'pc_a35_w12_7': self.pc_a35_w12_7,
-            'eer_a35_w12_7': self.eer_a35_w12_7,
-            'seer_ac': self.seer_ac,
-            'eta_sc_ac': self.eta_sc_ac,
-            'pdesignh_avg_lwt35': self.pdesignh_avg_lwt35,
-            'scop_avg_lwt35': self.scop_avg_lwt35,
-            'eta_sh_avg_lwt35': self.eta_sh_avg_lwt35,
-            'ph_a7_w35': self.ph_a7_w35,
-            'cop_a7_w35': self.cop_a7_w35,
-            'ph_a2_w35': self.ph_a2_w35,
-            'cop_a2_w35': self.cop_a2_w35,
-            'ph_am7_w35': self.ph_am7_w35,
-            'cop_am7_w35': self.cop_am7_w35,
-            'pdesignh_avg_lwt55': self.pdesignh_avg_lwt55,
-            'scop_avg_lwt55': self.scop_avg_lwt55,
-            'eta_sh_avg_lwt55': self.eta_sh_avg_lwt55,
-            'ph_a7_w55_approx': self.ph_a7_w55_approx,
-            'cop_a7_w55_approx': self.cop_a7_w55_approx,
-            'sepr_mt': self.sepr_mt,
-            'sepr_ht': self.sepr_ht,
-            'sepr_lt': self.sepr_lt,
-            'psbc_standby_cooling': self.psbc_standby_cooling,
-            'psbh_standby_heating': self.psbh_standby_heating,
-        })
-        return data    
-
 
 class ResidentialVentilationUnit(HVACDevice):
     __tablename__ = 'residential_ventilation_units'
@@ -337,7 +247,7 @@ class ResidentialVentilationUnit(HVACDevice):
     typology = db.Column(db.String(100), nullable=True) 
     heatrecoverysystem = db.Column(String(100), nullable=True) 
     thermalefficiencyheatrecovery = db.Column(db.Float, nullable=True)
-    specificpowerinput = db.Column(db.Float, nullable=True)
+    specificpowerinput = db.Column(db.Float, nullable=True, index=True)
     fandrivepowerinput = db.Column(db.Float, nullable=True)
     drivetype = db.Column(db.String(50), nullable=True)
     ductedunit = db.Column(db.String(50), nullable=True)
@@ -356,31 +266,84 @@ class ResidentialVentilationUnit(HVACDevice):
         'polymorphic_identity': 'residential_ventilation_unit', 
     }
 
+
+# Robust (median/MAD) outliers per device type and capacity bin, rebuilt after each import by app/outliers.py
+class DeviceOutlier(db.Model):
+    __tablename__ = 'device_outliers'
+
+    device_id = db.Column(db.Integer, ForeignKey('hvacdevices.id', ondelete='CASCADE'), primary_key=True)
+    metric = db.Column(db.String(100), primary_key=True)
+    device_type = db.Column(db.String(50), nullable=False)
+    capacity_bin = db.Column(db.Integer, nullable=True)
+    value = db.Column(db.Float, nullable=True)
+    robust_z = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_device_outliers_device_type_metric', 'device_type', 'metric'),
+    )
+
     def to_dict(self):
-        data = super().to_dict()
-        data.update({
-            'maximumflowrate': self.maximumflowrate,
-            'referenceflowrate': self.referenceflowrate,
-            'referencepressuredifference': self.referencepressuredifference,
-            'typology': self.typology,
-            'heatrecoverysystem': self.heatrecoverysystem,
-            'thermalefficiencyheatrecovery': self.thermalefficiencyheatrecovery,
-            'specificpowerinput': self.specificpowerinput,
-            'fandrivepowerinput': self.fandrivepowerinput,
-            'drivetype': self.drivetype,
-            'ductedunit': self.ductedunit,
-            'controltypology': self.controltypology,
-            'specificenergyconsumptionwarm': self.specificenergyconsumptionwarm,
-            'specificenergyconsumptionaverage': self.specificenergyconsumptionaverage,
-            'specificenergyconsumptioncold': self.specificenergyconsumptioncold,
-            'annualheatingsavedaverageclimate': self.annualheatingsavedaverageclimate,
-            'annualheatingsavedwarmclimate': self.annualheatingsavedwarmclimate,
-            'annualheatingsavedcoldclimate': self.annualheatingsavedcoldclimate,
-            'energyclass': self.energyclass,
-            'maximuminternalleakagerate': self.maximuminternalleakagerate,
-            'maximumexternalleakagerate': self.maximumexternalleakagerate,
-        })
-        return data
+        return {
+            'device_id': self.device_id,
+            'metric': self.metric,
+            'device_type': self.device_type,
+            'capacity_bin': self.capacity_bin,
+            'value': self.value,
+            'robust_z': self.robust_z,
+        }
+
+
+# percent_rank of a metric within device type and entry year, rebuilt after each import by app/ranks.py
+class DeviceMetricRank(db.Model):
+    __tablename__ = 'device_metric_ranks'
+
+    device_id = db.Column(db.Integer, ForeignKey('hvacdevices.id', ondelete='CASCADE'), primary_key=True)
+    metric = db.Column(db.String(100), primary_key=True) # FIELD_DEFINITIONS key, e.g. 'ac_seer'
+    device_type = db.Column(db.String(50), nullable=False)
+    entry_year = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    percent_rank = db.Column(db.Float, nullable=False) # 0 = lowest value of its year, 1 = highest
+    decile = db.Column(db.SmallInteger, nullable=False) # 1..10
+
+    __table_args__ = (
+        db.Index('ix_device_metric_ranks_metric_percent_rank', 'metric', 'percent_rank'),
+        db.Index('ix_device_metric_ranks_device_type', 'device_type'),
+    )
+
+
+# One row per device and CANONICAL_METRICS entry (app/forms.py), rebuilt after each import by app/canonical.py
+class DeviceCanonicalMetric(db.Model):
+    __tablename__ = 'device_canonical_metrics'
+
+    device_id = db.Column(db.Integer, ForeignKey('hvacdevices.id', ondelete='CASCADE'), primary_key=True)
+    canonical_metric = db.Column(db.String(100), primary_key=True)
+    device_type = db.Column(db.String(50), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_device_canonical_metrics_metric_value', 'canonical_metric', 'value'),
+        db.Index('ix_device_canonical_metrics_device_type', 'device_type'),
+    )
+
+
+# One row per unit code in a model identifier, e.g. "MXZ-2D33VA-E4 / MSZ-SF15VA" -> MXZ-2D33VA, MSZ-SF15VA
+class DeviceComponent(db.Model):
+    __tablename__ = 'device_components'
+
+    device_id = db.Column(db.Integer, ForeignKey('hvacdevices.id', ondelete='CASCADE'), primary_key=True)
+    component = db.Column(db.String(255), primary_key=True) # Upper-cased output of identifier_components()
+
+    __table_args__ = (
+        db.Index('ix_device_components_component', 'component'),
+    )
+
+
+# Single row (id 1) holding the catalog version every worker and CLI command keys its caches on (app/cache.py)
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
 
 
 MODEL_MAP = {
@@ -388,4 +351,23 @@ MODEL_MAP = {
     'heat_pump': HeatPump,
     'residential_ventilation_unit': ResidentialVentilationUnit
     # Add other types as you define their models
-}
\ No newline at end of file
+}
+
+# Never serialized: the range is derived from market_entry/market_exit, the bitmask is internal
+SERIALIZER_EXCLUDED_COLUMNS = ('market_period', 'validity_flags')
+# Generated columns (entry_year, market_life_days, is_plausible) are left out of the public device JSON,
+# which keeps the shape it had before they were added; the search results table asks for them explicitly
+GENERATED_COLUMNS = tuple(column.key for column in HVACDevice.__table__.columns
+                          if column.computed is not None and column.key not in SERIALIZER_EXCLUDED_COLUMNS)
+_device_serializers = {}
+
+
+def device_serializer(model_class, include_generated=False):
+    """The generated to_dict() of a device class, built from its mapped columns on first use."""
+    serializer = _device_serializers.get((model_class, include_generated))
+    if serializer is None:
+        exclude = SERIALIZER_EXCLUDED_COLUMNS if include_generated else SERIALIZER_EXCLUDED_COLUMNS + GENERATED_COLUMNS
+        serializer = RowSerializer(model_class, exclude=exclude,
+                                   converters={'device_type': lambda value: DEVICE_TYPES.get(value, value)})
+        _device_serializers[model_class, include_generated] = serializer
+    return serializer
\ No newline at end of file
@@ -0,0 +1,123 @@
+# app/outliers.py
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from .models import db, HVACDevice, DeviceOutlier, MODEL_MAP
+from .cache import bump_catalog_version
+
+# |robust z| above this is an outlier (Iglewicz & Hoaglin). Unit mix-ups such as m³/s vs m³/h
+# or dB vs dBA land far beyond it.
+OUTLIER_Z_THRESHOLD = 3.5
+# Devices are compared within quantile bins of their capacity, so small and large units
+# are not judged against each other.
+CAPACITY_BINS = 5
+# Bins with fewer values than this are too small for a stable median/MAD and are skipped.
+MIN_BIN_SIZE = 10
+
+OUTLIER_METRICS = {
+    'air_conditioner': {
+        'capacity': 'design_load_cooling_kw',
+        'metrics': ['seer', 'eer', 'scop_average', 'eta_s_cooling_percent', 'annual_consumption_cooling_kwh',
+                    'noise_level_outdoor_cooling_db', 'noise_level_indoor_cooling_db'],
+    },
+    'heat_pump': {
+        'capacity': 'pdesignh_avg_lwt35',
+        'metrics': ['scop_avg_lwt35', 'eta_sh_avg_lwt35', 'scop_avg_lwt55', 'eta_sh_avg_lwt55',
+                    'seer_ac', 'eer_a35_w12_7', 'sound_power_level_lw'],
+    },
+    'residential_ventilation_unit': {
+        'capacity': 'maximumflowrate',
+        'metrics': ['referenceflowrate', 'specificpowerinput', 'fandrivepowerinput',
+                    'thermalefficiencyheatrecovery', 'specificenergyconsumptionaverage', 'noise_level_dba'],
+    },
+}
+
+
+def capacity_bins(capacity, bins=CAPACITY_BINS):
+    """Quantile bin per row (0..bins-1), -1 where the capacity is missing."""
+    capacity = pd.to_numeric(pd.Series(capacity), errors='coerce')
+    if capacity.notna().sum() < bins:
+        return np.where(capacity.notna(), 0, -1)
+    binned = pd.qcut(capacity, bins, labels=False, duplicates='drop')
+    return binned.fillna(-1).astype(int).to_numpy()
+
+
+def robust_z_scores(values, groups, min_group_size=MIN_BIN_SIZE):
+    """
+    Median/MAD z-scores within each group: 0.6745 * (x - median) / MAD.
+
+    Where more than half of a group shares one value the MAD is 0; the mean absolute
+    deviation (scaled by 1.2533) is used instead. Missing values, and groups smaller
+    than min_group_size, get NaN.
+    """
+    values = pd.to_numeric(pd.Series(values), errors='coerce').reset_index(drop=True)
+    groups = pd.Series(groups).reset_index(drop=True)
+
+    grouped = values.groupby(groups)
+    median = grouped.transform('median')
+    abs_deviation = (values - median).abs()
+    deviation_grouped = abs_deviation.groupby(groups)
+    mad = deviation_grouped.transform('median').to_numpy()
+    mean_ad = deviation_grouped.transform('mean').to_numpy()
+    group_size = grouped.transform('count').to_numpy()
+
+    deviation = (values - median).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(mad > 0, 0.6745 * deviation / mad, deviation / (1.253314 * mean_ad))
+    z[~np.isfinite(z) | (group_size < min_group_size)] = np.nan
+    return z
+
+
+def find_outliers(frame, device_type, threshold=OUTLIER_Z_THRESHOLD):
+    """Outlier records for one device type, from a frame with an id column and the configured columns."""
+    config = OUTLIER_METRICS[device_type]
+    bins = capacity_bins(frame[config['capacity']])
+    records = []
+    for metric in config['metrics']:
+        z = robust_z_scores(frame[metric], bins)
+        with np.errstate(invalid='ignore'):
+            flagged = np.flatnonzero(np.abs(z) > threshold)
+        for position in flagged:
+            value = frame[metric].iat[position]
+            records.append({
+                'device_id': int(frame['id'].iat[position]),
+                'metric': metric,
+                'device_type': device_type,
+                'capacity_bin': int(bins[position]) if bins[position] >= 0 else None,
+                'value': None if pd.isna(value) else float(value),
+                'robust_z': round(float(z[position]), 3),
+            })
+    return records
+
+
+def load_outlier_frame(device_type):
+    config = OUTLIER_METRICS[device_type]
+    hvac_table = HVACDevice.__table__
+    child_table = MODEL_MAP[device_type].__table__
+    column_names = [config['capacity']] + config['metrics']
+    columns = [child_table.c[name] if name in child_table.c else hvac_table.c[name] for name in column_names]
+
+    stmt = select(hvac_table.c.id, *columns)\
+        .select_from(hvac_table.join(child_table, child_table.c.id == hvac_table.c.id))\
+        .where(hvac_table.c.device_type == device_type)
+    frame = pd.DataFrame(db.session.execute(stmt).all(), columns=['id'] + column_names)
+    for name in column_names:
+        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+    return frame
+
+
+def refresh_outlier_flags(device_type=None):
+    """Recomputes the outlier side table for one (or every) device type. Returns the number of flags written."""
+    outlier_table = DeviceOutlier.__table__
+    flagged = 0
+    for type_key in OUTLIER_METRICS:
+        if device_type and type_key != device_type:
+            continue
+        records = find_outliers(load_outlier_frame(type_key), type_key)
+        db.session.execute(outlier_table.delete().where(outlier_table.c.device_type == type_key))
+        if records:
+            db.session.execute(outlier_table.insert(), records)
+        flagged += len(records)
+    bump_catalog_version()
+    db.session.commit()
+    return flagged
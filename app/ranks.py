@@ -0,0 +1,55 @@
+# app/ranks.py
+from sqlalchemy import select, func, literal, union_all, Integer
+from .models import db, HVACDevice, DeviceMetricRank, MODEL_MAP
+from .cache import bump_catalog_version
+from .forms import FIELD_DEFINITIONS, PERCENTILE_RANK_METRICS, DEVICE_TYPE_MODEL_MAPPING
+
+
+def rank_metrics_for_type(device_type):
+    model_class_name = DEVICE_TYPE_MODEL_MAPPING.get(device_type)
+    return [name for name in PERCENTILE_RANK_METRICS if FIELD_DEFINITIONS[name]['model_class_name'] == model_class_name]
+
+
+def ranked_select(device_type, metric_name):
+    hvac_table = HVACDevice.__table__
+    child_table = MODEL_MAP[device_type].__table__
+    value_column = child_table.c[FIELD_DEFINITIONS[metric_name]['model_attr']]
+    percent_rank = func.percent_rank().over(partition_by=hvac_table.c.entry_year, order_by=value_column)
+
+    return select(
+        hvac_table.c.id.label('device_id'),
+        literal(metric_name).label('metric'),
+        hvac_table.c.device_type,
+        hvac_table.c.entry_year,
+        value_column.label('value'),
+        percent_rank.label('percent_rank'),
+    ).select_from(hvac_table.join(child_table, child_table.c.id == hvac_table.c.id))\
+     .where(hvac_table.c.device_type == device_type)\
+     .where(hvac_table.c.entry_year.isnot(None))\
+     .where(hvac_table.c.is_plausible.is_(True))\
+     .where(value_column.isnot(None))
+
+
+def refresh_metric_ranks(device_type=None):
+    """Recomputes the stored percentile ranks in one INSERT ... SELECT per device type. Returns the row count."""
+    rank_table = DeviceMetricRank.__table__
+    written = 0
+    for type_key in MODEL_MAP:
+        if device_type and type_key != device_type:
+            continue
+        metric_names = rank_metrics_for_type(type_key)
+        db.session.execute(rank_table.delete().where(rank_table.c.device_type == type_key))
+        if not metric_names:
+            continue
+
+        ranked = union_all(*[ranked_select(type_key, name) for name in metric_names]).subquery()
+        decile = func.least(func.floor(ranked.c.percent_rank * 10).cast(Integer), 9) + 1
+        stmt = rank_table.insert().from_select(
+            ['device_id', 'metric', 'device_type', 'entry_year', 'value', 'percent_rank', 'decile'],
+            select(ranked.c.device_id, ranked.c.metric, ranked.c.device_type, ranked.c.entry_year,
+                   ranked.c.value, ranked.c.percent_rank, decile)
+        )
+        written += db.session.execute(stmt).rowcount
+    bump_catalog_version()
+    db.session.commit()
+    return written
@@ -1,11 +1,23 @@
 import os
+import numpy as np
 import pandas as pd
 from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app, Response
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, and_, extract, func, cast, String, Numeric, Date 
-from .models import db, HVACDevice, AirConditioner, HeatPump, ResidentialVentilationUnit, MODEL_MAP, DEVICE_TYPES
-from .forms import HVACDeviceForm, CSVUploadForm, SearchForm, SPECIAL_GROUPING_OPTIONS, FIELD_DEFINITIONS, DEVICE_TYPE_CHOICES, DEVICE_TYPE_MODEL_MAPPING, TCOCalculatorForm
-from .utils import allowed_file, process_csv
+from sqlalchemy import or_, and_, extract, func, cast, String, Numeric, Date, select, text, exists, literal, case, true, tuple_
+from .models import db, device_serializer, HVACDevice, AirConditioner, HeatPump, ResidentialVentilationUnit, DeviceOutlier, DeviceMetricRank, DeviceCanonicalMetric, DeviceComponent, MODEL_MAP, DEVICE_TYPES
+from .forms import HVACDeviceForm, CSVUploadForm, SearchForm, SPECIAL_GROUPING_OPTIONS, FIELD_DEFINITIONS, PERCENTILE_RANK_METRICS, CANONICAL_METRICS, DEVICE_TYPE_CHOICES, DEVICE_TYPE_MODEL_MAPPING, TCOCalculatorForm, ACTCOCalculatorForm
+from .utils import allowed_file, process_csv, refresh_derived_tables, get_single_param, TRUTHY_PARAM_VALUES, component_codes, build_device_components
+from .cache import LRUCache, make_filter_key, bump_catalog_version
+from .serializers import json_response
+from .device_cache import device_cache
+from .singleflight import single_flight
+from .market_population import monthly_market_population
+from .validity import compute_validity_flags
+from .skyline import pareto_front
+from .similarity import find_similar_devices
+from .snapshot import get_catalog_snapshot, SnapshotPagination
+from .climate import climate_bins, parse_bin_hours
+from .tco import scenario_from_form, ac_scenario_from_form, calculate_tco, heat_pump_tco, evaluate_tco_batch, rank_heat_pumps_by_tco, rank_air_conditioners_by_tco, heat_pump_sensitivity, SENSITIVITY_PARAMETERS, SENSITIVITY_MAX_SCENARIOS, SENSITIVITY_MAX_DEVICES, TCO_SCENARIO_LIMITS
 import json
 import csv
 import io
@@ -39,197 +51,317 @@ MODEL_CLASSES = {
 }
 
 
-def build_and_run_search_query(search_params, page=None, per_page=None):
-    results_data = []
-    selected_columns_tuples = []
-    is_grouped = False
-    pagination_obj = None
-    base_query = db.session.query(HVACDevice) 
+# Groups are listed in code point order ("C" collation), which is how the columnar snapshot sorts them
+def group_sort_key(column):
+    return column.collate('C') if isinstance(column.type, String) else column
 
-    current_app.logger.debug(f"Received search_params: {search_params}")
+# Shared by search, export and the JSON API endpoints. Invalid parameters are appended to messages
+# as (message, category) for the HTML views to flash; without a list the first one raises ValueError.
+def apply_search_filters(base_query, search_params, messages=None):
+    def report(message, category):
+        if messages is None:
+            raise ValueError(message)
+        messages.append((message, category))
 
-    try:
-        def get_single_param(param_name):
-            val = search_params.get(param_name) 
-            if isinstance(val, list):
-                return val[0] if len(val) > 0 and val[0] is not None and str(val[0]).strip() != '' else None
-            elif isinstance(val, str):
-                return val if val.strip() != '' else None
-            elif val is not None:
-                return val 
-            return None
+    # Basic Filters
+    manufacturer_val = get_single_param(search_params, 'manufacturer')
+    if manufacturer_val:
+        base_query = base_query.filter(HVACDevice.manufacturer.icontains(manufacturer_val, autoescape=True))
+    
+    device_type_filter_key = get_single_param(search_params, 'device_type')
+    current_app.logger.debug(f"Device type filter key (processed): '{device_type_filter_key}'")
+    if device_type_filter_key:
+        base_query = base_query.filter(HVACDevice.device_type == device_type_filter_key)
 
-        # Basic Filters
-        manufacturer_val = get_single_param('manufacturer')
-        if manufacturer_val:
-            base_query = base_query.filter(HVACDevice.manufacturer.ilike(f'%{manufacturer_val}%'))
-        
-        device_type_filter_key = get_single_param('device_type')
-        current_app.logger.debug(f"Device type filter key (processed): '{device_type_filter_key}'")
-        if device_type_filter_key:
-            base_query = base_query.filter(HVACDevice.device_type == device_type_filter_key)
+    id_or_model_val = get_single_param(search_params, 'id_or_model_identifier')
+    if id_or_model_val:
+        try:
+            device_id = int(id_or_model_val)
+            base_query = base_query.filter(HVACDevice.id == device_id)
+        except ValueError:
+            base_query = base_query.filter(HVACDevice.model_identifier.icontains(id_or_model_val, autoescape=True))
+
+    # Systems containing all given units, e.g. "MSZ-SF15VA" or "MSZ-SF15VA + MSZ-EF18VE" (exact lookups)
+    component_val = get_single_param(search_params, 'component')
+    if component_val:
+        for component in component_codes(component_val):
+            base_query = base_query.filter(exists().where(DeviceComponent.device_id == HVACDevice.id, DeviceComponent.component == component))
+
+    # Time-travel filters, answered from the GiST index on market_period
+    on_market_at_val = get_single_param(search_params, 'on_market_at')
+    if on_market_at_val:
+        try:
+            on_market_date = on_market_at_val if isinstance(on_market_at_val, date) else date.fromisoformat(str(on_market_at_val))
+            base_query = base_query.filter(HVACDevice.market_period.op('@>')(on_market_date))
+        except ValueError:
+            report(f"Invalid 'on market at' date '{on_market_at_val}'. Expected YYYY-MM-DD.", "warning")
+
+    on_market_from_val = get_single_param(search_params, 'on_market_from')
+    on_market_to_val = get_single_param(search_params, 'on_market_to')
+    if on_market_from_val or on_market_to_val:
+        try:
+            span_start = date.fromisoformat(str(on_market_from_val)) if on_market_from_val else None
+            span_end = date.fromisoformat(str(on_market_to_val)) if on_market_to_val else None
+            base_query = base_query.filter(HVACDevice.market_period.op('&&')(func.daterange(span_start, span_end, '[]')))
+        except ValueError:
+            report("Invalid market span dates. Expected YYYY-MM-DD.", "warning")
+
+    plausible_only_val = get_single_param(search_params, 'plausible_only')
+    if plausible_only_val and str(plausible_only_val).lower() in TRUTHY_PARAM_VALUES:
+        base_query = base_query.filter(HVACDevice.is_plausible.is_(True))
+
+    outliers_val = get_single_param(search_params, 'outliers')
+    if outliers_val in ('exclude', 'only'):
+        has_outlier = exists().where(DeviceOutlier.device_id == HVACDevice.id)
+        base_query = base_query.filter(~has_outlier if outliers_val == 'exclude' else has_outlier)
+
+    # Percentile band within device type and entry year, e.g. 90-100 = top 10%
+    percentile_metric_val = get_single_param(search_params, 'percentile_metric')
+    percentile_min_val = get_single_param(search_params, 'percentile_min')
+    percentile_max_val = get_single_param(search_params, 'percentile_max')
+    if percentile_metric_val in PERCENTILE_RANK_METRICS and (percentile_min_val is not None or percentile_max_val is not None):
+        try:
+            rank_conditions = [DeviceMetricRank.device_id == HVACDevice.id, DeviceMetricRank.metric == percentile_metric_val]
+            if percentile_min_val is not None:
+                rank_conditions.append(DeviceMetricRank.percent_rank >= float(percentile_min_val) / 100)
+            if percentile_max_val is not None:
+                rank_conditions.append(DeviceMetricRank.percent_rank <= float(percentile_max_val) / 100)
+            base_query = base_query.filter(exists().where(*rank_conditions))
+        except ValueError:
+            report("Invalid percentile range. Expected numbers between 0 and 100.", "warning")
+
+    # Cross-type metric range, answered from device_canonical_metrics
+    canonical_metric_val = get_single_param(search_params, 'canonical_metric')
+    canonical_min_val = get_single_param(search_params, 'canonical_min')
+    canonical_max_val = get_single_param(search_params, 'canonical_max')
+    if canonical_metric_val in CANONICAL_METRICS and (canonical_min_val is not None or canonical_max_val is not None):
+        try:
+            canonical_conditions = [DeviceCanonicalMetric.device_id == HVACDevice.id, DeviceCanonicalMetric.canonical_metric == canonical_metric_val]
+            if canonical_min_val is not None:
+                canonical_conditions.append(DeviceCanonicalMetric.value >= float(canonical_min_val))
+            if canonical_max_val is not None:
+                canonical_conditions.append(DeviceCanonicalMetric.value <= float(canonical_max_val))
+            base_query = base_query.filter(exists().where(*canonical_conditions))
+        except ValueError:
+            report("Invalid cross-type metric range. Expected numbers.", "warning")
+
+    # Generic Metric Filter
+    metric_name_key = get_single_param(search_params, 'search_metric_name') 
+    metric_operator = get_single_param(search_params, 'search_metric_operator')
+    metric_value_str = get_single_param(search_params, 'search_metric_value')
+
+    current_app.logger.debug(f"Metric filter attempt: Name='{metric_name_key}', Op='{metric_operator}', Val='{metric_value_str}'")
+
+    if metric_name_key and metric_operator and metric_value_str is not None: 
+        metric_def = FIELD_DEFINITIONS.get(metric_name_key)
+        if metric_def and metric_def.get('searchable'):
+            model_class_name_for_metric = metric_def['model_class_name']
+            model_attr_name = metric_def['model_attr']
+            attr_type = metric_def.get('type', 'string')
+            
+            TargetModelClassForMetric = MODEL_CLASSES.get(model_class_name_for_metric)
 
-        id_or_model_val = get_single_param('id_or_model_identifier')
-        if id_or_model_val:
-            try:
-                device_id = int(id_or_model_val)
-                base_query = base_query.filter(HVACDevice.id == device_id)
-            except ValueError:
-                base_query = base_query.filter(HVACDevice.model_identifier.ilike(f'%{id_or_model_val}%'))
-
-        # Generic Metric Filter
-        metric_name_key = get_single_param('search_metric_name') 
-        metric_operator = get_single_param('search_metric_operator')
-        metric_value_str = get_single_param('search_metric_value')
-
-        current_app.logger.debug(f"Metric filter attempt: Name='{metric_name_key}', Op='{metric_operator}', Val='{metric_value_str}'")
-
-        if metric_name_key and metric_operator and metric_value_str is not None: 
-            metric_def = FIELD_DEFINITIONS.get(metric_name_key)
-            if metric_def and metric_def.get('searchable'):
-                model_class_name_for_metric = metric_def['model_class_name']
-                model_attr_name = metric_def['model_attr']
-                attr_type = metric_def.get('type', 'string')
+            if not TargetModelClassForMetric:
+                report(f"Config error (metric): Model class '{model_class_name_for_metric}' not found for '{metric_def['label']}'.", "danger")
+            elif not hasattr(TargetModelClassForMetric, model_attr_name):
+                report(f"Config error (metric): Attribute '{model_attr_name}' not found on '{model_class_name_for_metric}' for '{metric_def['label']}'.", "danger")
+            else:
+                column_to_filter = getattr(TargetModelClassForMetric, model_attr_name)
                 
-                TargetModelClassForMetric = MODEL_CLASSES.get(model_class_name_for_metric)
-
-                if not TargetModelClassForMetric:
-                    flash(f"Config error (metric): Model class '{model_class_name_for_metric}' not found for '{metric_def['label']}'.", "danger")
-                elif not hasattr(TargetModelClassForMetric, model_attr_name):
-                    flash(f"Config error (metric): Attribute '{model_attr_name}' not found on '{model_class_name_for_metric}' for '{metric_def['label']}'.", "danger")
+                if TargetModelClassForMetric != HVACDevice:
+                    current_app.logger.debug(f"Metric filter: Explicitly joining to {TargetModelClassForMetric.__name__} for attribute {model_attr_name}")
+                    base_query = base_query.join(TargetModelClassForMetric)
+                                    
+                processed_value = None
+                if metric_value_str.strip() == '':
+                    report(f"Metric value for '{metric_def['label']}' cannot be empty.", "warning")
                 else:
-                    column_to_filter = getattr(TargetModelClassForMetric, model_attr_name)
-                    
-                    if TargetModelClassForMetric != HVACDevice:
-                        current_app.logger.debug(f"Metric filter: Explicitly joining to {TargetModelClassForMetric.__name__} for attribute {model_attr_name}")
-                        base_query = base_query.join(TargetModelClassForMetric)
-                                        
-                    processed_value = None
-                    if metric_value_str.strip() == '':
-                        flash(f"Metric value for '{metric_def['label']}' cannot be empty.", "warning")
-                    else:
-                        try:
-                            if attr_type == 'float': processed_value = float(metric_value_str)
-                            elif attr_type == 'integer': processed_value = int(metric_value_str)
-                            elif attr_type == 'date': processed_value = date.fromisoformat(metric_value_str)
-                            else: processed_value = metric_value_str
-                        except ValueError:
-                            flash(f"Invalid value '{metric_value_str}' for metric '{metric_def['label']}'. Expected {attr_type}.", "warning")
-                    
-                    if processed_value is not None:
-                        current_app.logger.debug(f"Applying metric filter: {model_class_name_for_metric}.{model_attr_name} {metric_operator} {processed_value}")
-                        if metric_operator == '>=': base_query = base_query.filter(column_to_filter >= processed_value)
-                        elif metric_operator == '<=': base_query = base_query.filter(column_to_filter <= processed_value)
-                        elif metric_operator == '==': base_query = base_query.filter(column_to_filter == processed_value)
-                        elif metric_operator == 'like' and attr_type == 'string': base_query = base_query.filter(column_to_filter.ilike(f'%{processed_value}%'))
-                        else: flash(f"Unsupported operator '{metric_operator}' for metric type '{attr_type}'.", "warning")
-            elif metric_name_key:
-                flash(f"Metric '{metric_name_key}' not found or not searchable.", "warning")
-        
-        # Advanced Generic Filter
-        adv_filter_field_key = get_single_param('filter_field')
-        adv_filter_value = get_single_param('filter_value')
-
-        if adv_filter_field_key and adv_filter_value is not None:
-            adv_filter_def = FIELD_DEFINITIONS.get(adv_filter_field_key)
-            if adv_filter_def:
-                adv_model_class_name = adv_filter_def['model_class_name']
-                adv_model_attr_name = adv_filter_def['model_attr']
-                adv_attr_type = adv_filter_def.get('type', 'string')
-                AdvTargetModelClass = MODEL_CLASSES.get(adv_model_class_name)
-
-                if AdvTargetModelClass and hasattr(AdvTargetModelClass, adv_model_attr_name):
-                    adv_column_to_filter = getattr(AdvTargetModelClass, adv_model_attr_name)
-                    
-                    if AdvTargetModelClass != HVACDevice:
-                        current_app.logger.debug(f"Advanced filter: Explicitly joining to {AdvTargetModelClass.__name__}")
-                        base_query = base_query.join(AdvTargetModelClass)
-                        
-                    adv_processed_value = None
                     try:
-                        if adv_attr_type == 'float': adv_processed_value = float(adv_filter_value)
-                        elif adv_attr_type == 'integer': adv_processed_value = int(adv_filter_value)
-                        elif adv_attr_type == 'date': adv_processed_value = date.fromisoformat(adv_filter_value)
-                        else: adv_processed_value = str(adv_filter_value)
+                        if attr_type == 'float': processed_value = float(metric_value_str)
+                        elif attr_type == 'integer': processed_value = int(metric_value_str)
+                        elif attr_type == 'date': processed_value = date.fromisoformat(metric_value_str)
+                        else: processed_value = metric_value_str
                     except ValueError:
-                        flash(f"Invalid value for advanced filter on '{adv_filter_def['label']}'.", "warning")
+                        report(f"Invalid value '{metric_value_str}' for metric '{metric_def['label']}'. Expected {attr_type}.", "warning")
+                
+                if processed_value is not None:
+                    current_app.logger.debug(f"Applying metric filter: {model_class_name_for_metric}.{model_attr_name} {metric_operator} {processed_value}")
+                    if metric_operator == '>=': base_query = base_query.filter(column_to_filter >= processed_value)
+                    elif metric_operator == '<=': base_query = base_query.filter(column_to_filter <= processed_value)
+                    elif metric_operator == '==': base_query = base_query.filter(column_to_filter == processed_value)
+                    elif metric_operator == 'like' and attr_type == 'string': base_query = base_query.filter(column_to_filter.icontains(processed_value, autoescape=True))
+                    else: report(f"Unsupported operator '{metric_operator}' for metric type '{attr_type}'.", "warning")
+        elif metric_name_key:
+            report(f"Metric '{metric_name_key}' not found or not searchable.", "warning")
+    
+    # Advanced Generic Filter
+    adv_filter_field_key = get_single_param(search_params, 'filter_field')
+    adv_filter_value = get_single_param(search_params, 'filter_value')
+
+    if adv_filter_field_key and adv_filter_value is not None:
+        adv_filter_def = FIELD_DEFINITIONS.get(adv_filter_field_key)
+        if adv_filter_def:
+            adv_model_class_name = adv_filter_def['model_class_name']
+            adv_model_attr_name = adv_filter_def['model_attr']
+            adv_attr_type = adv_filter_def.get('type', 'string')
+            AdvTargetModelClass = MODEL_CLASSES.get(adv_model_class_name)
+
+            if AdvTargetModelClass and hasattr(AdvTargetModelClass, adv_model_attr_name):
+                adv_column_to_filter = getattr(AdvTargetModelClass, adv_model_attr_name)
+                
+                if AdvTargetModelClass != HVACDevice:
+                    current_app.logger.debug(f"Advanced filter: Explicitly joining to {AdvTargetModelClass.__name__}")
+                    base_query = base_query.join(AdvTargetModelClass)
+                    
+                adv_processed_value = None
+                try:
+                    if adv_attr_type == 'float': adv_processed_value = float(adv_filter_value)
+                    elif adv_attr_type == 'integer': adv_processed_value = int(adv_filter_value)
+                    elif adv_attr_type == 'date': adv_processed_value = date.fromisoformat(adv_filter_value)
+                    else: adv_processed_value = str(adv_filter_value)
+                except ValueError:
+                    report(f"Invalid value for advanced filter on '{adv_filter_def['label']}'.", "warning")
+
+                if adv_processed_value is not None:
+                    if isinstance(adv_column_to_filter.type, String):
+                        base_query = base_query.filter(adv_column_to_filter.icontains(adv_processed_value, autoescape=True))
+                    else: 
+                        base_query = base_query.filter(adv_column_to_filter == adv_processed_value)
+            else:
+                report(f"Advanced filter field '{adv_filter_field_key}' misconfigured or attribute not found.", "warning")
 
-                    if adv_processed_value is not None:
-                        if isinstance(adv_column_to_filter.type, String):
-                            base_query = base_query.filter(adv_column_to_filter.ilike(f'%{adv_processed_value}%'))
-                        else: 
-                            base_query = base_query.filter(adv_column_to_filter == adv_processed_value)
-                else:
-                    flash(f"Advanced filter field '{adv_filter_field_key}' misconfigured or attribute not found.", "warning")
+    return base_query, device_type_filter_key
 
 
-        current_app.logger.debug(f"Query after all filters, before grouping/ordering: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
+# Warnings for the page (invalid filters, grouping) are appended to messages as (message, category)
+def run_search_sql(search_params, page=None, per_page=None, messages=None):
+    messages = [] if messages is None else messages
+    selected_columns_tuples = []
+    is_grouped = False
+    pagination_obj = None
+    base_query = db.session.query(HVACDevice) 
 
-        # Grouping
-        group_by_field_key = get_single_param('group_by_field')
-        query_before_grouping = base_query
+    base_query, device_type_filter_key = apply_search_filters(base_query, search_params, messages)
 
-        if group_by_field_key:
-            group_def = FIELD_DEFINITIONS.get(group_by_field_key) or \
-                        SPECIAL_GROUPING_OPTIONS.get(group_by_field_key)
-            
-            if group_def and group_def.get('groupable', True):
-                is_grouped = True 
-                header_name = group_def['label']
-                grouping_expression_col = None
-                
-                query_for_grouping = base_query 
+    current_app.logger.debug(f"Query after all filters, before grouping/ordering: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
+
+    # Grouping
+    group_by_field_key = get_single_param(search_params, 'group_by_field')
+    query_before_grouping = base_query
 
-                if group_by_field_key == 'market_entry_year':
-                    grouping_expression_col = extract('year', HVACDevice.market_entry).label('grouping_key')
+    if group_by_field_key:
+        group_def = FIELD_DEFINITIONS.get(group_by_field_key) or \
+                    SPECIAL_GROUPING_OPTIONS.get(group_by_field_key)
+        
+        if group_def and group_def.get('groupable', True):
+            is_grouped = True 
+            header_name = group_def['label']
+            grouping_expression_col = None
+            
+            query_for_grouping = base_query 
+
+            if group_by_field_key == 'market_entry_year':
+                grouping_expression_col = HVACDevice.entry_year.label('grouping_key')
+            elif group_def.get('rank_metric'):
+                query_for_grouping = query_for_grouping.join(
+                    DeviceMetricRank,
+                    and_(DeviceMetricRank.device_id == HVACDevice.id, DeviceMetricRank.metric == group_def['rank_metric'])
+                )
+                grouping_expression_col = DeviceMetricRank.decile.label('grouping_key')
+            else:
+                group_model_class_name = group_def.get('model_class_name')
+                group_model_attr = group_def['model_attr']
+                GroupModelClass = MODEL_CLASSES.get(group_model_class_name) if group_model_class_name else HVACDevice
+
+                if GroupModelClass and hasattr(GroupModelClass, group_model_attr):
+                    if GroupModelClass != HVACDevice:
+                        current_app.logger.debug(f"Grouping: Explicitly joining to {GroupModelClass.__name__} for attribute {group_model_attr}")
+                        query_for_grouping = query_for_grouping.join(GroupModelClass)
+                    grouping_expression_col = getattr(GroupModelClass, group_model_attr).label('grouping_key')
                 else:
-                    group_model_class_name = group_def.get('model_class_name')
-                    group_model_attr = group_def['model_attr']
-                    GroupModelClass = MODEL_CLASSES.get(group_model_class_name) if group_model_class_name else HVACDevice
-
-                    if GroupModelClass and hasattr(GroupModelClass, group_model_attr):
-                        if GroupModelClass != HVACDevice:
-                            current_app.logger.debug(f"Grouping: Explicitly joining to {GroupModelClass.__name__} for attribute {group_model_attr}")
-                            query_for_grouping = query_for_grouping.join(GroupModelClass)
-                        grouping_expression_col = getattr(GroupModelClass, group_model_attr).label('grouping_key')
-                    else:
-                        flash(f"Cannot group by '{header_name}', attribute or model definition error.", "warning")
-                        is_grouped = False
-                
-                if is_grouped and grouping_expression_col is not None:
-                    base_query = query_for_grouping.with_entities(
-                                       grouping_expression_col, 
-                                       func.count(HVACDevice.id).label('count')
-                                   ).group_by(grouping_expression_col) 
-                    selected_columns_tuples = [('grouping_key', header_name), ('count', 'Count')]
-                else: 
+                    messages.append((f"Cannot group by '{header_name}', attribute or model definition error.", "warning"))
                     is_grouped = False
-                    base_query = query_before_grouping
-            else:
-                flash(f"Grouping field '{group_by_field_key}' not found or not groupable.", "warning")
+            
+            if is_grouped and grouping_expression_col is not None:
+                base_query = query_for_grouping.with_entities(
+                                   grouping_expression_col, 
+                                   func.count(HVACDevice.id).label('count')
+                               ).group_by(grouping_expression_col) 
+                selected_columns_tuples = [('grouping_key', header_name), ('count', 'Count')]
+            else: 
                 is_grouped = False
                 base_query = query_before_grouping
-        
-        # Query Execution / Pagination
-        if not is_grouped:
-            order_by_expr = HVACDevice.id.desc()
-            base_query = base_query.order_by(order_by_expr) 
-            current_app.logger.debug(f"Final Ungrouped Query for pagination/all: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
-            if page and per_page:
-                pagination_obj = base_query.paginate(page=page, per_page=per_page, error_out=False)
-                results_raw = pagination_obj.items
-            else: 
-                results_raw = base_query.all()
-        elif is_grouped: 
-            base_query = base_query.order_by('grouping_key') 
-            current_app.logger.debug(f"Final Grouped Query: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
-            results_raw = base_query.all()
+        else:
+            messages.append((f"Grouping field '{group_by_field_key}' not found or not groupable.", "warning"))
+            is_grouped = False
+            base_query = query_before_grouping
+    
+    # Query Execution / Pagination (ungrouped: only the ids, the caller fetches the columns per type)
+    if not is_grouped:
+        order_by_expr = HVACDevice.id.desc()
+        base_query = base_query.with_entities(HVACDevice.id).order_by(order_by_expr) 
+        current_app.logger.debug(f"Final Ungrouped Query for pagination/all: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
+        if page and per_page:
+            pagination_obj = base_query.paginate(page=page, per_page=per_page, error_out=False)
+            results_raw = [row.id for row in pagination_obj.items]
+        else: 
+            results_raw = [row.id for row in base_query.all()]
+    elif is_grouped: 
+        base_query = base_query.order_by(group_sort_key(grouping_expression_col.element)) 
+        current_app.logger.debug(f"Final Grouped Query: {str(base_query.statement.compile(compile_kwargs={'literal_binds': True}))}")
+        results_raw = base_query.all()
+
+    return results_raw, selected_columns_tuples, is_grouped, pagination_obj, device_type_filter_key
+
+
+# Same answers as run_search_sql from the in-memory snapshot (ungrouped: ids in display order), or None to use SQL
+def run_search_on_snapshot(search_params, page=None, per_page=None):
+    snapshot = get_catalog_snapshot()
+    if snapshot is None:
+        return None
+    mask = snapshot.filter_mask(search_params)
+    if mask is None:
+        return None
+    device_type_filter_key = get_single_param(search_params, 'device_type')
+
+    group_by_field_key = get_single_param(search_params, 'group_by_field')
+    if group_by_field_key:
+        group_rows = snapshot.group_counts(mask, group_by_field_key)
+        if group_rows is None:
+            return None
+        group_def = FIELD_DEFINITIONS.get(group_by_field_key) or SPECIAL_GROUPING_OPTIONS.get(group_by_field_key)
+        return group_rows, [('grouping_key', group_def['label']), ('count', 'Count')], True, None, device_type_filter_key
+
+    matching_ids = snapshot.matching_ids(mask)
+    if page and per_page:
+        pagination_obj = SnapshotPagination(page=page, per_page=per_page, max_per_page=None, error_out=False, ids=matching_ids)
+        return pagination_obj.items, [], False, pagination_obj, device_type_filter_key
+    return [int(device_id) for device_id in matching_ids], [], False, None, device_type_filter_key
+
+
+# Returns the page's flash messages with the results, so callers that share one run (single_flight) all show them
+def build_and_run_search_query(search_params, page=None, per_page=None):
+    results_data = []
+    selected_columns_tuples = []
+    is_grouped = False
+    pagination_obj = None
+    messages = []
+
+    current_app.logger.debug(f"Received search_params: {search_params}")
+
+    try:
+        snapshot_answer = run_search_on_snapshot(search_params, page, per_page)
+        if snapshot_answer is None:
+            snapshot_answer = run_search_sql(search_params, page, per_page, messages)
+        results_raw, selected_columns_tuples, is_grouped, pagination_obj, device_type_filter_key = snapshot_answer
 
         # Results presentation
         if is_grouped:
             results_data = [row._asdict() for row in results_raw]
         else: 
-            raw_device_dicts = [device.to_dict() for device in results_raw] 
+            # results_raw holds ids in display order: one column projection per device type loads them
+            device_dicts_by_id = fetch_device_dicts(results_raw, include_generated=True)
+            raw_device_dicts = [device_dicts_by_id[device_id] for device_id in results_raw if device_id in device_dicts_by_id]
             temp_selected_columns = []
             
             fields_to_display_keys_val = search_params.get('fields_to_display', [])
@@ -281,12 +413,12 @@ def build_and_run_search_query(search_params, page=None, per_page=None):
         if results_data:
             current_app.logger.debug(f"First processed result for template: {results_data[0]}")
 
-        return results_data, selected_columns_tuples, is_grouped, pagination_obj
+        return results_data, selected_columns_tuples, is_grouped, pagination_obj, messages
 
     except Exception as e:
         current_app.logger.error(f"Build and Run Query Exception: {e}", exc_info=True)
-        flash(f"An unexpected error occurred while processing your search: {e}", "danger")
-        return [], [], False, None
+        messages.append((f"An unexpected error occurred while processing your search: {e}", "danger"))
+        return [], [], False, None, messages
 
     
 
@@ -340,8 +472,13 @@ def add_device():
 
         try:
             device = ModelClass(**data_for_model)
+            device.validity_flags = compute_validity_flags(selected_type_key, data_for_model)
+            device.components = build_device_components(device.model_identifier)
             db.session.add(device)
+            bump_catalog_version()
             db.session.commit()
+            # Outlier bins and yearly ranks depend on the whole type, so its derived rows are rebuilt as after an import
+            refresh_derived_tables(selected_type_key)
             flash(f'{DEVICE_TYPES.get(selected_type_key, selected_type_key)} added successfully!', 'success')
             return redirect(url_for('main.search')) 
         except Exception as e:
@@ -388,6 +525,12 @@ def upload_csv():
 
 PER_PAGE = 25 
 
+def coalescing_key(prefix, search_params, **extra):
+    """Canonical key of a search-backed request, including the display params that shape its result."""
+    shaping_params = {param: search_params.get(param) for param in ('fields_to_display', 'group_by_field')}
+    return make_filter_key(search_params, prefix=prefix, extra={**shaping_params, **extra})
+
+
 @main.route('/search', methods=['GET', 'POST'])
 def search():
     form = SearchForm() 
@@ -438,11 +581,21 @@ def search():
             query_executed = True
             search_active_params = request.args.to_dict(flat=False) 
             current_app.logger.debug(f"GET request: search_active_params for query: {search_active_params}")
-            results_data, selected_columns, is_grouped, pagination = build_and_run_search_query(
+            search_call = lambda: build_and_run_search_query(
                 search_active_params,
                 page=page if not is_grouped else None,
                 per_page=PER_PAGE if not is_grouped else None
             )
+            if get_single_param(search_active_params, 'group_by_field'):
+                # Grouped answers are few rows but scan every match; identical ones in flight run once
+                results_data, selected_columns, is_grouped, pagination, messages = single_flight.do(
+                    coalescing_key('search', search_active_params, page=page), search_call,
+                    shareable=lambda result: result[3] is None
+                )
+            else:
+                results_data, selected_columns, is_grouped, pagination, messages = search_call()
+            for message, category in messages:
+                flash(message, category)
             if not results_data and query_executed:
                 flash("No devices found matching your criteria.", "info")
 
@@ -479,9 +632,12 @@ def export_csv():
     else:
         search_params_for_export['fields_to_display'] = [str(f) for f in current_fields_to_display if f is not None]
 
-    results_for_csv, selected_columns_tuples, _, _ = build_and_run_search_query(
-        search_params_for_export, page=None, per_page=None
+    results_for_csv, selected_columns_tuples, _, _, messages = single_flight.do(
+        coalescing_key('export_csv', search_params_for_export),
+        lambda: build_and_run_search_query(search_params_for_export, page=None, per_page=None)
     )
+    for message, category in messages:
+        flash(message, category)
 
     if not results_for_csv:
         flash("No data found for export with the given criteria.", "info")
@@ -517,160 +673,803 @@ def export_csv():
 
 
 # API Routes
+def fetch_device_dicts(id_filter, device_types=None, fields=None, include_generated=False):
+    """
+    {id: to_dict()} of the devices whose id is in id_filter (a list of ids or a select of ids),
+    read with one column projection per device type rather than by loading ORM objects.
+    device_types limits the queries to those types; fields limits each dict (and projection)
+    to those keys plus 'id'. include_generated adds the generated columns (for display).
+    """
+    if isinstance(id_filter, (list, tuple, set)) and not id_filter:
+        return {}
+    device_dicts = {}
+    for type_key, ModelClass in MODEL_MAP.items():
+        if device_types is not None and type_key not in device_types:
+            continue
+        serializer = device_serializer(ModelClass, include_generated)
+        if fields is not None:
+            serializer = serializer.only({'id', *fields})
+        stmt = select(*serializer.columns).where(HVACDevice.device_type == type_key, ModelClass.id.in_(id_filter))
+        for row in db.session.execute(stmt):
+            device_dict = serializer.from_row(row)
+            device_dicts[device_dict['id']] = device_dict
+    return device_dicts
+
+
 @main.route('/api/devices')
 def api_devices():
-    devices = HVACDevice.query.all()
-    return jsonify([device.to_dict() for device in devices])
+    try:
+        devices_query, _ = apply_search_filters(db.session.query(HVACDevice), request.args.to_dict(flat=False))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filtered_ids = devices_query.with_entities(HVACDevice.id).subquery()
+    device_dicts = fetch_device_dicts(select(filtered_ids.c.id))
+    return json_response([device_dicts[device_id] for device_id in sorted(device_dicts)])
+
+
+def load_device_dict(device_id):
+    device = db.session.get(HVACDevice, device_id)
+    return device.to_dict() if device is not None else None
 
 
 @main.route('/api/device/<int:device_id>')
 def api_device(device_id):
+    device_dict = device_cache.get(device_id, load_device_dict)
+    if device_dict is None:
+        return jsonify({"error": "Device not found"}), 404
+    return json_response(device_dict)
+
+
+@main.route('/api/device_cache/stats')
+def api_device_cache_stats():
+    return jsonify(device_cache.stats())
+
+
+DEVICE_BATCH_LIMIT = 1000
+
+# JSON body: {"ids": [1, 2, ...], "fields": ["seer", ...] (optional)}. Answers {"devices": {id: {...}}, "missing": [...]}
+@main.route('/api/devices/batch', methods=['POST'])
+def api_devices_batch():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('ids'), list):
+        return jsonify({"error": "Expected a JSON object with an 'ids' list"}), 400
+    ids = payload['ids']
+    if not all(isinstance(device_id, int) and not isinstance(device_id, bool) for device_id in ids):
+        return jsonify({"error": "'ids' must be a list of integers"}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > DEVICE_BATCH_LIMIT:
+        return jsonify({"error": f"At most {DEVICE_BATCH_LIMIT} ids per request"}), 400
+
+    fields = payload.get('fields')
+    if fields is not None:
+        known_fields = {key for ModelClass in MODEL_MAP.values() for key in device_serializer(ModelClass).keys}
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            return jsonify({"error": "'fields' must be a list of field names"}), 400
+        unknown_fields = [field for field in fields if field not in known_fields]
+        if unknown_fields:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown_fields)}"}), 400
+
+    device_dicts = {}
+    if ids:
+        # Only the device types actually present are queried, one projection each
+        device_types = set(db.session.scalars(
+            select(HVACDevice.device_type).where(HVACDevice.id.in_(ids)).distinct()
+        ))
+        device_dicts = fetch_device_dicts(ids, device_types=device_types, fields=fields)
+    return json_response({
+        'devices': {device_id: device_dicts[device_id] for device_id in ids if device_id in device_dicts},
+        'missing': [device_id for device_id in ids if device_id not in device_dicts],
+    })
+
+
+SIMILAR_K_LIMIT = 100
+
+@main.route('/api/device/<int:device_id>/similar')
+def api_similar_devices(device_id):
     device = db.session.get(HVACDevice, device_id)
     if device is None:
         return jsonify({"error": "Device not found"}), 404
-    return jsonify(device.to_dict())
+    k = request.args.get('k', 10, type=int)
+    same_category = request.args.get('same_category', '1').lower() not in ('0', 'false', 'no', 'off')
+    if k < 1 or k > SIMILAR_K_LIMIT:
+        return jsonify({"error": f"'k' must be between 1 and {SIMILAR_K_LIMIT}"}), 400
+    try:
+        neighbours = find_similar_devices(device, k=k, same_category=same_category)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    neighbour_devices = fetch_device_dicts([n_id for n_id, _ in neighbours])
+    return json_response({
+        'device_id': device_id,
+        'similar': [{**neighbour_devices[n_id], 'distance': round(distance, 4)}
+                    for n_id, distance in neighbours if n_id in neighbour_devices],
+    })
+
+facet_cache = LRUCache(maxsize=512)
+FACET_VALUE_LIMIT = 50
+
+def get_facet_columns(device_type_filter_key=None):
+    hvac_table = HVACDevice.__table__
+    facet_columns = {'device_type': hvac_table.c.device_type}
+    filtered_model_class_name = DEVICE_TYPE_MODEL_MAPPING.get(device_type_filter_key) if device_type_filter_key else None
+    for def_name, f_def in FIELD_DEFINITIONS.items():
+        if not f_def.get('groupable') or f_def.get('type') == 'date':
+            continue
+        model_class_name = f_def['model_class_name']
+        if filtered_model_class_name and model_class_name not in ('HVACDevice', filtered_model_class_name):
+            continue
+        ModelClass = MODEL_CLASSES.get(model_class_name)
+        if ModelClass is not None and f_def['model_attr'] in ModelClass.__table__.c:
+            facet_columns[def_name] = ModelClass.__table__.c[f_def['model_attr']]
+    facet_columns['market_entry_year'] = hvac_table.c.entry_year
+    return facet_columns
+
+
+# All facet counts in one round trip: one GROUPING SET per facet plus the empty set for the total.
+def run_facet_query(search_params, value_limit=FACET_VALUE_LIMIT):
+    filtered_query, device_type_filter_key = apply_search_filters(db.session.query(HVACDevice), search_params)
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+
+    hvac_table = HVACDevice.__table__
+    from_clause = hvac_table
+    for ModelClass in MODEL_MAP.values():
+        child_table = ModelClass.__table__
+        from_clause = from_clause.outerjoin(child_table, child_table.c.id == hvac_table.c.id)
+
+    facet_columns = get_facet_columns(device_type_filter_key)
+    # A child-table column is NULL for every device of another type; it is grouped together with
+    # "row belongs to this table" so those devices do not pile up in its None bucket
+    owner_columns = {}
+    for name, column in facet_columns.items():
+        if column.table is not hvac_table:
+            owner_columns[name] = column.table.c.id.isnot(None).label(f'owner_{column.table.name}')
+    grouping_sets = [tuple_(column, owner_columns[name]) if name in owner_columns else column
+                     for name, column in facet_columns.items()]
+
+    select_columns = [column.label(name) for name, column in facet_columns.items()]
+    select_columns += [func.grouping(column).label(f'grouping_{name}') for name, column in facet_columns.items()]
+    select_columns += list({owner.name: owner for owner in owner_columns.values()}.values())
+    select_columns.append(func.count().label('count'))
+
+    stmt = select(*select_columns).select_from(from_clause)\
+        .where(hvac_table.c.id.in_(select(filtered_ids.c.id)))\
+        .group_by(func.grouping_sets(*grouping_sets, text('()')))
+
+    facets = {name: [] for name in facet_columns}
+    total = 0
+    for row in db.session.execute(stmt).mappings():
+        grouped_by = [name for name in facet_columns if row[f'grouping_{name}'] == 0]
+        if not grouped_by:
+            total = row['count']
+            continue
+        name = grouped_by[0]
+        if name in owner_columns and not row[owner_columns[name].name]:
+            continue
+        value = row[name]
+        facets[name].append({'value': value, 'count': row['count']})
+
+    for name, values in facets.items():
+        values.sort(key=lambda item: (-item['count'], str(item['value'])))
+        facets[name] = values[:value_limit]
+
+    return {
+        'total': total,
+        'facets': facets,
+        'labels': {name: (FIELD_DEFINITIONS.get(name) or SPECIAL_GROUPING_OPTIONS.get(name) or {'label': 'Device Type'})['label'] for name in facets},
+    }
+
+
+@main.route('/api/facets')
+def api_facets():
+    search_params = request.args.to_dict(flat=False)
+    value_limit = request.args.get('limit', FACET_VALUE_LIMIT, type=int)
+    if value_limit < 0:
+        return jsonify({"error": "'limit' must not be negative"}), 400
+    cache_key = make_filter_key(search_params, prefix='facets', extra={'limit': value_limit})
+    facet_result = facet_cache.get(cache_key)
+    if facet_result is None:
+        try:
+            facet_result = run_facet_query(search_params, value_limit=value_limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            current_app.logger.error(f"Facet query error: {e}", exc_info=True)
+            return jsonify({"error": "Could not compute facet counts"}), 500
+        facet_cache.set(cache_key, facet_result)
+    return jsonify(facet_result)
+
+
+OUTLIER_RESULT_LIMIT = 1000
+
+@main.route('/api/outliers')
+def api_outliers():
+    search_params = request.args.to_dict(flat=False)
+    metric = request.args.get('metric') or None
+    limit = request.args.get('limit', 100, type=int)
+    if not 0 <= limit <= OUTLIER_RESULT_LIMIT:
+        return jsonify({"error": f"'limit' must be between 0 and {OUTLIER_RESULT_LIMIT}"}), 400
+
+    try:
+        filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+    outlier_query = db.session.query(DeviceOutlier, HVACDevice.manufacturer, HVACDevice.model_identifier)\
+        .join(HVACDevice, HVACDevice.id == DeviceOutlier.device_id)\
+        .filter(DeviceOutlier.device_id.in_(select(filtered_ids.c.id)))
+    if metric:
+        outlier_query = outlier_query.filter(DeviceOutlier.metric == metric)
+
+    result = []
+    for outlier, manufacturer, model_identifier in outlier_query.order_by(func.abs(DeviceOutlier.robust_z).desc()).limit(limit):
+        outlier_data = outlier.to_dict()
+        outlier_data.update({'manufacturer': manufacturer, 'model_identifier': model_identifier})
+        result.append(outlier_data)
+    return jsonify(result)
+
+
+top_cache = LRUCache(maxsize=256)
+TOP_N_LIMIT = 100
+
+def resolve_field_column(field_key):
+    if field_key == 'market_entry_year':
+        return HVACDevice, HVACDevice.__table__.c.entry_year
+    f_def = FIELD_DEFINITIONS.get(field_key)
+    if not f_def:
+        return None, None
+    ModelClass = MODEL_CLASSES.get(f_def['model_class_name'])
+    if ModelClass is None or f_def['model_attr'] not in ModelClass.__table__.c:
+        return None, None
+    return ModelClass, ModelClass.__table__.c[f_def['model_attr']]
+
+
+# Best N devices per group in one pass: row_number() over the group, or DISTINCT ON for N = 1
+def run_top_query(search_params, metric_key, group_key, n, descending=True):
+    metric_class, metric_column = resolve_field_column(metric_key)
+    group_class, group_column = resolve_field_column(group_key)
+    if metric_column is None or not FIELD_DEFINITIONS.get(metric_key, {}).get('metric'):
+        raise ValueError(f"Unknown metric '{metric_key}'")
+    if group_column is None:
+        raise ValueError(f"Unknown group field '{group_key}'")
+    child_classes = {cls for cls in (metric_class, group_class) if cls is not HVACDevice}
+    if len(child_classes) > 1:
+        raise ValueError(f"'{metric_key}' and '{group_key}' belong to different device types")
+
+    snapshot = get_catalog_snapshot()
+    snapshot_mask = snapshot.filter_mask(search_params, ignore_params=('metric', 'group_by', 'n', 'order')) if snapshot else None
+    if snapshot_mask is not None:
+        groups = snapshot.top_n(snapshot_mask, metric_key, group_key, n, descending=descending)
+        if groups is not None:
+            return groups
+
+    filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+
+    hvac_table = HVACDevice.__table__
+    from_clause = hvac_table
+    for ModelClass in child_classes:
+        child_table = ModelClass.__table__
+        from_clause = from_clause.join(child_table, child_table.c.id == hvac_table.c.id)
+
+    metric_order = metric_column.desc() if descending else metric_column.asc()
+    group_order = group_sort_key(group_column)
+    columns = [
+        hvac_table.c.id, hvac_table.c.manufacturer, hvac_table.c.model_identifier,
+        group_column.label('group_value'), metric_column.label('metric_value'),
+    ]
+    conditions = [hvac_table.c.id.in_(select(filtered_ids.c.id)), metric_column.isnot(None), group_column.isnot(None)]
+
+    if n == 1:
+        stmt = select(*columns, literal(1).label('rank')).select_from(from_clause).where(*conditions)\
+            .distinct(group_order).order_by(group_order, metric_order, hvac_table.c.id)
+    else:
+        rank = func.row_number().over(partition_by=group_column, order_by=(metric_order, hvac_table.c.id))
+        ranked = select(*columns, rank.label('rank')).select_from(from_clause).where(*conditions).subquery()
+        stmt = select(ranked).where(ranked.c.rank <= n).order_by(group_sort_key(ranked.c.group_value), ranked.c.rank)
+
+    groups = []
+    for row in db.session.execute(stmt).mappings():
+        if not groups or groups[-1]['group'] != row['group_value']:
+            groups.append({'group': row['group_value'], 'devices': []})
+        groups[-1]['devices'].append({
+            'rank': row['rank'],
+            'id': row['id'],
+            'manufacturer': row['manufacturer'],
+            'model_identifier': row['model_identifier'],
+            'value': row['metric_value'],
+        })
+    return groups
+
+
+@main.route('/api/top')
+def api_top():
+    search_params = request.args.to_dict(flat=False)
+    metric_key = request.args.get('metric')
+    group_key = request.args.get('group_by')
+    n = request.args.get('n', 5, type=int)
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+    if not metric_key or not group_key:
+        return jsonify({"error": "Parameters 'metric' and 'group_by' are required"}), 400
+    if n < 1 or n > TOP_N_LIMIT:
+        return jsonify({"error": f"'n' must be between 1 and {TOP_N_LIMIT}"}), 400
+
+    cache_key = make_filter_key(search_params, prefix='top')
+    payload = top_cache.get(cache_key)
+    if payload is None:
+        try:
+            groups = run_top_query(search_params, metric_key, group_key, n, descending=descending)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        payload = {
+            'metric': metric_key,
+            'group_by': group_key,
+            'n': n,
+            'order': 'desc' if descending else 'asc',
+            'groups': [{**group, 'group': group['group'].isoformat() if isinstance(group['group'], date) else group['group']} for group in groups],
+        }
+        top_cache.set(cache_key, payload)
+    return jsonify(payload)
+
+
+CANONICAL_RESULT_LIMIT = 1000
+
+# Ranking across device types on one canonical metric, e.g. /api/canonical/seasonal_heating_efficiency?n=20
+@main.route('/api/canonical/<canonical_metric>')
+def api_canonical_ranking(canonical_metric):
+    if canonical_metric not in CANONICAL_METRICS:
+        return jsonify({"error": f"Unknown canonical metric '{canonical_metric}'", "available": list(CANONICAL_METRICS)}), 404
+    search_params = request.args.to_dict(flat=False)
+    n = request.args.get('n', 50, type=int)
+    if not 1 <= n <= CANONICAL_RESULT_LIMIT:
+        return jsonify({"error": f"'n' must be between 1 and {CANONICAL_RESULT_LIMIT}"}), 400
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+
+    try:
+        filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+    ranking = db.session.query(DeviceCanonicalMetric.value, HVACDevice.id, HVACDevice.device_type,
+                               HVACDevice.manufacturer, HVACDevice.model_identifier)\
+        .join(HVACDevice, HVACDevice.id == DeviceCanonicalMetric.device_id)\
+        .filter(DeviceCanonicalMetric.canonical_metric == canonical_metric)\
+        .filter(DeviceCanonicalMetric.device_id.in_(select(filtered_ids.c.id)))\
+        .order_by(DeviceCanonicalMetric.value.desc() if descending else DeviceCanonicalMetric.value.asc(), HVACDevice.id)\
+        .limit(n).all()
+
+    return jsonify({
+        'canonical_metric': canonical_metric,
+        'label': CANONICAL_METRICS[canonical_metric]['label'],
+        'sources': CANONICAL_METRICS[canonical_metric]['sources'],
+        'order': 'desc' if descending else 'asc',
+        'devices': [
+            {'id': device_id, 'device_type': device_type, 'manufacturer': manufacturer,
+             'model_identifier': model_identifier, 'value': value}
+            for value, device_id, device_type, manufacturer, model_identifier in ranking
+        ],
+    })
+
+
+skyline_cache = LRUCache(maxsize=128)
+
+# Pareto front over 2-4 metrics, e.g. ?metrics=ac_seer:max&metrics=ac_noise_level_outdoor_cooling_db:min&metrics=price_amount:min
+@main.route('/api/skyline')
+def api_skyline():
+    search_params = request.args.to_dict(flat=False)
+    metric_specs = []
+    for spec in request.args.getlist('metrics'):
+        metric_key, _, direction = spec.partition(':')
+        direction = direction or 'max'
+        if direction not in ('min', 'max'):
+            return jsonify({"error": f"Invalid direction '{direction}' for '{metric_key}', expected min or max"}), 400
+        metric_specs.append((metric_key, direction))
+    if not 2 <= len(metric_specs) <= 4:
+        return jsonify({"error": "Between 2 and 4 'metrics' parameters are required"}), 400
+
+    cache_key = make_filter_key(search_params, prefix='skyline')
+    payload = skyline_cache.get(cache_key)
+    if payload is not None:
+        return jsonify(payload)
+
+    metric_columns = []
+    child_classes = set()
+    for metric_key, _ in metric_specs:
+        ModelClass, column = resolve_field_column(metric_key)
+        if column is None or not FIELD_DEFINITIONS.get(metric_key, {}).get('metric'):
+            return jsonify({"error": f"Unknown metric '{metric_key}'"}), 400
+        metric_columns.append(column)
+        if ModelClass is not HVACDevice:
+            child_classes.add(ModelClass)
+    if len(child_classes) > 1:
+        return jsonify({"error": "All metrics must belong to the same device type"}), 400
+
+    try:
+        filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+    hvac_table = HVACDevice.__table__
+    from_clause = hvac_table
+    for ModelClass in child_classes:
+        child_table = ModelClass.__table__
+        from_clause = from_clause.join(child_table, child_table.c.id == hvac_table.c.id)
+
+    # Column projection: only ids and the compared metrics leave the database
+    stmt = select(hvac_table.c.id, *metric_columns).select_from(from_clause)\
+        .where(hvac_table.c.id.in_(select(filtered_ids.c.id)), *[column.isnot(None) for column in metric_columns])
+    rows = db.session.execute(stmt).all()
+    device_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    values = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(metric_columns))
+    front = pareto_front(values, [direction == 'max' for _, direction in metric_specs])
+
+    front_ids = device_ids[front].tolist()
+    names = dict(db.session.query(HVACDevice.id, func.concat(HVACDevice.manufacturer, ' ', HVACDevice.model_identifier))
+                 .filter(HVACDevice.id.in_(front_ids)).all()) if front_ids else {}
+    payload = {
+        'metrics': [{'metric': metric_key, 'direction': direction} for metric_key, direction in metric_specs],
+        'candidates': len(rows),
+        'front_size': len(front_ids),
+        'devices': [
+            {'id': device_id, 'name': names.get(device_id),
+             **{metric_key: float(value) for (metric_key, _), value in zip(metric_specs, values[position])}}
+            for device_id, position in zip(front_ids, front)
+        ],
+    }
+    skyline_cache.set(cache_key, payload)
+    return jsonify(payload)
+
+
+histogram_cache = LRUCache(maxsize=512)
+HISTOGRAM_MAX_BINS = 200
+HISTOGRAM_AUTO_MAX_BINS = 50
+
+# Binned counts in one statement; bins=None picks Sturges' rule (ceil(log2 n) + 1) in SQL
+def run_histogram_query(search_params, metric_key, bins=None):
+    # market_entry_year (offered by /api/facets) is the same integer column as the entry_year field
+    f_def = FIELD_DEFINITIONS.get('entry_year' if metric_key == 'market_entry_year' else metric_key)
+    ModelClass, metric_column = resolve_field_column(metric_key)
+    if metric_column is None or f_def is None or not f_def.get('searchable') or f_def.get('type') not in ('float', 'integer'):
+        raise ValueError(f"Unknown or non-numeric metric '{metric_key}'")
+
+    snapshot = get_catalog_snapshot()
+    snapshot_mask = snapshot.filter_mask(search_params, ignore_params=('metric', 'bins')) if snapshot else None
+    if snapshot_mask is not None:
+        histogram = snapshot.histogram(snapshot_mask, metric_key, bins=bins, auto_max_bins=HISTOGRAM_AUTO_MAX_BINS)
+        if histogram is not None:
+            return histogram
+
+    filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+    filtered_ids = filtered_query.with_entities(HVACDevice.id).subquery()
+    hvac_table = HVACDevice.__table__
+    from_clause = hvac_table
+    if ModelClass is not HVACDevice:
+        from_clause = hvac_table.join(ModelClass.__table__, ModelClass.__table__.c.id == hvac_table.c.id)
+
+    values = select(cast(metric_column, db.Float).label('v')).select_from(from_clause)\
+        .where(hvac_table.c.id.in_(select(filtered_ids.c.id)), metric_column.isnot(None)).cte('vals')
+    bin_count = literal(bins) if bins else func.least(
+        cast(func.ceil(func.log(2, func.greatest(func.count(), 1))), db.Integer) + 1, HISTOGRAM_AUTO_MAX_BINS)
+    stats = select(func.min(values.c.v).label('lo'), func.max(values.c.v).label('hi'),
+                   func.count().label('n'), bin_count.label('bins')).cte('stats')
+    bucket = case(
+        (stats.c.hi > stats.c.lo, func.least(func.width_bucket(values.c.v, stats.c.lo, stats.c.hi, stats.c.bins), stats.c.bins)),
+        else_=1
+    ).label('bucket')
+    stmt = select(bucket, func.count().label('count'), func.min(stats.c.lo).label('lo'), func.min(stats.c.hi).label('hi'),
+                  func.min(stats.c.n).label('n'), func.min(stats.c.bins).label('bins'))\
+        .select_from(values.join(stats, true()))\
+        .group_by(bucket).order_by(bucket)
+    rows = db.session.execute(stmt).all()
+
+    if not rows:
+        return {'metric': metric_key, 'count': 0, 'min': None, 'max': None, 'bins': 0, 'bin_width': None, 'counts': []}
+    lo, hi, total, bin_total = rows[0].lo, rows[0].hi, rows[0].n, rows[0].bins
+    if hi == lo:
+        bin_total = 1
+    counts = [0] * bin_total
+    for row in rows:
+        counts[row.bucket - 1] = row.count
+    return {
+        'metric': metric_key,
+        'count': total,
+        'min': lo,
+        'max': hi,
+        'bins': bin_total,
+        'bin_width': (hi - lo) / bin_total,
+        'counts': counts,
+    }
+
+
+@main.route('/api/histogram')
+def api_histogram():
+    search_params = request.args.to_dict(flat=False)
+    metric_key = request.args.get('metric')
+    bins = request.args.get('bins', type=int)
+    if not metric_key:
+        return jsonify({"error": "Parameter 'metric' is required"}), 400
+    if bins is not None and not 1 <= bins <= HISTOGRAM_MAX_BINS:
+        return jsonify({"error": f"'bins' must be between 1 and {HISTOGRAM_MAX_BINS}"}), 400
+
+    cache_key = make_filter_key(search_params, prefix='histogram')
+    payload = histogram_cache.get(cache_key)
+    if payload is None:
+        try:
+            payload = run_histogram_query(search_params, metric_key, bins=bins)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        histogram_cache.set(cache_key, payload)
+    return jsonify(payload)
+
+
+population_cache = LRUCache(maxsize=128)
+
+@main.route('/api/market/population')
+def api_market_population():
+    search_params = request.args.to_dict(flat=False)
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    cache_key = make_filter_key(search_params, prefix='population')
+    payload = population_cache.get(cache_key)
+    if payload is None:
+        try:
+            filtered_query, _ = apply_search_filters(db.session.query(HVACDevice), search_params)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            market_dates = filtered_query.with_entities(HVACDevice.market_entry, HVACDevice.market_exit)\
+                                         .filter(HVACDevice.market_entry.isnot(None)).all()
+            population = monthly_market_population(
+                [row.market_entry for row in market_dates],
+                [row.market_exit for row in market_dates],
+                start=start, end=end
+            )
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {e}"}), 400
+        payload = [
+            {
+                'month': row.month.strftime('%Y-%m'),
+                'active': int(row.active),
+                'entries': int(row.entries),
+                'exits': int(row.exits),
+                'churn_rate': None if pd.isna(row.churn_rate) else round(float(row.churn_rate), 5),
+            }
+            for row in population.itertuples(index=False)
+        ]
+        population_cache.set(cache_key, payload)
+    return jsonify(payload)
+
 
 @main.route('/api/efficiency/stats')
 def api_efficiency_stats():
-    stats_data = {}
-
-    devices = db.session.query(
-        HVACDevice.market_entry, 
-        AirConditioner.seer # Querying a subclass field
+    yearly_stats = db.session.query(
+        HVACDevice.entry_year,
+        func.avg(AirConditioner.seer).label('avg_seer'),
+        func.count(AirConditioner.seer).label('device_count')
     ).join(AirConditioner, HVACDevice.id == AirConditioner.id)\
-     .filter(HVACDevice.market_entry.isnot(None))\
+     .filter(HVACDevice.entry_year.isnot(None))\
      .filter(AirConditioner.seer.isnot(None))\
+     .group_by(HVACDevice.entry_year)\
+     .order_by(HVACDevice.entry_year)\
      .all()
 
-    for market_entry_date, seer_value in devices:
-        if market_entry_date and seer_value is not None:
-            year = market_entry_date.year
-            if year not in stats_data:
-                stats_data[year] = {'seer_sum': 0, 'count': 0}
-            stats_data[year]['seer_sum'] += seer_value
-            stats_data[year]['count'] += 1
-    
     result = []
-    for year, data in sorted(stats_data.items()):
-        if data['count'] > 0:
+    for year, avg_seer, device_count in yearly_stats:
+        if device_count > 0:
             result.append({
                 'year': year,
-                'avg_seer': data['seer_sum'] / data['count'],
-                'device_count': data['count']
+                'avg_seer': float(avg_seer),
+                'device_count': device_count
             })
     
     return jsonify(result)
 
+TCO_RANK_LIMIT = 500
+HEAT_PUMP_LOOKUP_LIMIT = 50
+heat_pump_lookup_cache = LRUCache(maxsize=1024)
+
+
+def heat_pump_choice_label(heat_pump):
+    return f"{heat_pump.manufacturer} - {heat_pump.model_identifier} (SCOP LWT35: {heat_pump.scop_avg_lwt35 if heat_pump.scop_avg_lwt35 else 'N/A'})"
+
+
+# Typeahead for the TCO calculator, e.g. /api/heat_pumps/lookup?q=daikin ehbh&limit=20. Every word has
+# to occur in the manufacturer or model identifier (trigram indexes); prefix matches come first.
+@main.route('/api/heat_pumps/lookup')
+def api_heat_pump_lookup():
+    query_val = ' '.join(request.args.get('q', '').split())
+    limit = min(max(request.args.get('limit', 20, type=int), 1), HEAT_PUMP_LOOKUP_LIMIT)
+    if len(query_val) < 2:
+        return jsonify({'q': query_val, 'results': []})
+
+    cache_key = make_filter_key({'q': query_val.lower(), 'limit': limit}, prefix='hp_lookup')
+    payload = heat_pump_lookup_cache.get(cache_key)
+    if payload is None:
+        lookup_query = HeatPump.query.with_entities(
+            HeatPump.id, HeatPump.manufacturer, HeatPump.model_identifier, HeatPump.scop_avg_lwt35)
+        words = query_val.split()
+        for word in words:
+            lookup_query = lookup_query.filter(or_(HeatPump.model_identifier.icontains(word, autoescape=True),
+                                                   HeatPump.manufacturer.icontains(word, autoescape=True)))
+        is_prefix = or_(HeatPump.model_identifier.istartswith(words[0], autoescape=True),
+                        HeatPump.manufacturer.istartswith(words[0], autoescape=True))
+        rows = lookup_query.order_by(case((is_prefix, 0), else_=1), HeatPump.manufacturer, HeatPump.model_identifier)\
+            .limit(limit).all()
+        payload = {'q': query_val, 'results': [{'id': row.id, 'label': heat_pump_choice_label(row)} for row in rows]}
+        heat_pump_lookup_cache.set(cache_key, payload)
+    return jsonify(payload)
+
+
+# climate=average|colder|warmer, or bin_hours=-10:1,-9:25,... with an optional design_temperature
+def climate_bins_from_request(form):
+    bin_hours_val = request.args.get('bin_hours')
+    design_temperature = request.args.get('design_temperature', type=float)
+    if bin_hours_val:
+        return climate_bins(bin_hours=parse_bin_hours(bin_hours_val), design_temperature=design_temperature)
+    if form.climate.data:
+        return climate_bins(form.climate.data, design_temperature=design_temperature)
+    return None
+
+
+def rank_form_from_request():
+    """TCOCalculatorForm from query args in ranking mode (hp_data_source is implied, not a query arg)."""
+    args = request.args.copy()
+    args['hp_data_source'] = 'rank'
+    form = TCOCalculatorForm(args, meta={'csrf': False})
+    form.db_hp_id.choices = []
+    return form
+
+
+def capacity_range_from_request():
+    """min_capacity/max_capacity query args (kW), checked like the form's rank capacity fields."""
+    min_capacity = request.args.get('min_capacity', type=float)
+    max_capacity = request.args.get('max_capacity', type=float)
+    if (min_capacity is not None and min_capacity < 0) or (max_capacity is not None and max_capacity < 0):
+        raise ValueError("'min_capacity' and 'max_capacity' must not be negative")
+    if min_capacity is not None and max_capacity is not None and min_capacity > max_capacity:
+        raise ValueError("'max_capacity' must not be below 'min_capacity'")
+    return min_capacity, max_capacity
+
+
+def sensitivity_ranges_from_request():
+    """<field>_min/<field>_max pairs, each bound within the same limits as the scenario field itself."""
+    ranges = {}
+    for name in SENSITIVITY_PARAMETERS:
+        low = request.args.get(f'{name}_min', type=float)
+        high = request.args.get(f'{name}_max', type=float)
+        if low is None and high is None:
+            continue
+        if low is None or high is None or low > high:
+            raise ValueError(f"'{name}_min' and '{name}_max' must both be given and ordered")
+        _, minimum, maximum = TCO_SCENARIO_LIMITS[name]
+        if low < minimum or (maximum is not None and high > maximum):
+            raise ValueError(f"'{name}' range must lie between {minimum} and {maximum}" if maximum is not None
+                             else f"'{name}' range must be at least {minimum}")
+        ranges[name] = (low, high)
+    return ranges
+
+
+# Cheapest-to-own heat pumps for one scenario; takes the TCOCalculatorForm fields as query args,
+# e.g. /api/tco/rank?annual_heat_demand=15000&electricity_price=0.3&annual_maintenance_cost=150&system_lifetime=20&discount_rate=0.04&n=10
+@main.route('/api/tco/rank')
+def api_tco_rank():
+    form = rank_form_from_request()
+    if not form.validate():
+        return jsonify({"error": "Invalid TCO scenario", "fields": form.errors}), 400
+    n = request.args.get('n', 20, type=int)
+    if n < 1 or n > TCO_RANK_LIMIT:
+        return jsonify({"error": f"'n' must be between 1 and {TCO_RANK_LIMIT}"}), 400
+    try:
+        bins = climate_bins_from_request(form)
+        min_capacity, max_capacity = capacity_range_from_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    scenario = scenario_from_form(form)
+    ranking = rank_heat_pumps_by_tco(scenario, n=n, min_capacity=min_capacity, max_capacity=max_capacity,
+                                     bins=bins, flow_temperature=form.flow_temperature.data or 35)
+    climate = None
+    if bins is not None:
+        temperatures, hours, design_temperature = bins
+        climate = {'name': form.climate.data or 'custom', 'design_temperature': design_temperature,
+                   'heating_hours': float(hours.sum()), 'flow_temperature': form.flow_temperature.data or 35}
+    return jsonify({'scenario': scenario, 'climate': climate, **ranking})
+
+
+# TCO percentile bands and chance of being cheapest over uncertain inputs. Ranges are given as
+# <field>_min/<field>_max for electricity_price, discount_rate, system_lifetime and capital_cost_subsidy,
+# e.g. /api/tco/sensitivity?<scenario>&electricity_price_min=0.2&electricity_price_max=0.45&mode=grid&steps=10
+@main.route('/api/tco/sensitivity')
+def api_tco_sensitivity():
+    form = rank_form_from_request()
+    if not form.validate():
+        return jsonify({"error": "Invalid TCO scenario", "fields": form.errors}), 400
+
+    try:
+        ranges = sensitivity_ranges_from_request()
+        min_capacity, max_capacity = capacity_range_from_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mode = request.args.get('mode', 'monte_carlo')
+    samples = request.args.get('samples', 10000, type=int)
+    steps = request.args.get('steps', 5, type=int)
+    if mode not in ('grid', 'monte_carlo'):
+        return jsonify({"error": "'mode' must be grid or monte_carlo"}), 400
+    scenario_count = steps ** len(ranges) if mode == 'grid' else samples
+    if samples < 1 or steps < 2 or scenario_count > SENSITIVITY_MAX_SCENARIOS:
+        return jsonify({"error": f"At most {SENSITIVITY_MAX_SCENARIOS} scenarios (samples, or steps per range for a grid)"}), 400
+
+    device_ids = request.args.getlist('ids', type=int)
+    n = request.args.get('n', 20, type=int)
+    if len(device_ids) > SENSITIVITY_MAX_DEVICES or n < 1 or n > SENSITIVITY_MAX_DEVICES:
+        return jsonify({"error": f"At most {SENSITIVITY_MAX_DEVICES} heat pumps can be compared"}), 400
+    seed = request.args.get('seed', type=int)
+    if seed is not None and seed < 0:
+        return jsonify({"error": "'seed' must not be negative"}), 400
+
+    result = heat_pump_sensitivity(scenario_from_form(form), ranges, mode=mode, samples=samples, steps=steps,
+                                   seed=seed, device_ids=device_ids, n=n,
+                                   min_capacity=min_capacity, max_capacity=max_capacity)
+    return jsonify({'scenario': scenario_from_form(form), 'ranges': ranges, **result})
+
+
+TCO_BATCH_LIMIT = 10000
+
+# Single evaluation from query args (the scenario fields plus device_id [& price_override] or custom_price
+# & custom_scop), or a batch as JSON: {"scenario": {...shared fields}, "evaluations": [{"device_id": 1}, ...]}
+@main.route('/api/tco', methods=['GET', 'POST'])
+def api_tco():
+    if request.method == 'GET':
+        result = evaluate_tco_batch([request.args.to_dict()])[0]
+        return jsonify(result), 400 if 'error' in result else 200
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('evaluations'), list):
+        return jsonify({"error": "Expected a JSON object with an 'evaluations' list"}), 400
+    shared = payload.get('scenario') or {}
+    evaluations = payload['evaluations']
+    if not isinstance(shared, dict) or not all(isinstance(evaluation, dict) for evaluation in evaluations):
+        return jsonify({"error": "'scenario' and every evaluation must be JSON objects"}), 400
+    if len(evaluations) > TCO_BATCH_LIMIT:
+        return jsonify({"error": f"At most {TCO_BATCH_LIMIT} evaluations per request"}), 400
+    results = evaluate_tco_batch([{**shared, **evaluation} for evaluation in evaluations])
+    return jsonify({'results': results, 'errors': sum(1 for result in results if 'error' in result)})
+
+
 @main.route('/tco_calculator', methods=['GET', 'POST'])
 def tco_calculator():
     form = TCOCalculatorForm()
-    available_heat_pumps = HeatPump.query.with_entities(
-        HeatPump.id, HeatPump.manufacturer, HeatPump.model_identifier,
-        HeatPump.scop_avg_lwt35,
-        HeatPump.price_amount
-    ).order_by(HeatPump.manufacturer, HeatPump.model_identifier).all()
-    
-    form.db_hp_id.choices = [('', '-- Select from Database --')] + \
-                            [(hp.id, f"{hp.manufacturer} - {hp.model_identifier} (SCOP LWT35: {hp.scop_avg_lwt35 if hp.scop_avg_lwt35 else 'N/A'})") 
-                             for hp in available_heat_pumps]
+    # Only the selected heat pump is rendered; the rest comes from the typeahead
+    form.db_hp_id.choices = [('', '-- Search the Database --')]
+    if form.db_hp_id.data:
+        selected_choice = HeatPump.query.with_entities(
+            HeatPump.id, HeatPump.manufacturer, HeatPump.model_identifier, HeatPump.scop_avg_lwt35
+        ).filter(HeatPump.id == form.db_hp_id.data).first()
+        if selected_choice:
+            form.db_hp_id.choices.append((selected_choice.id, heat_pump_choice_label(selected_choice)))
     tco_result = None
-
-    if form.validate_on_submit():
+    tco_ranking = None
+
+    submitted = form.validate_on_submit()
+    if submitted and form.hp_data_source.data == 'rank':
+        bins = climate_bins(form.climate.data) if form.climate.data else None
+        tco_ranking = rank_heat_pumps_by_tco(scenario_from_form(form), n=form.rank_top_n.data or 20,
+                                             min_capacity=form.rank_min_capacity.data,
+                                             max_capacity=form.rank_max_capacity.data,
+                                             bins=bins, flow_temperature=form.flow_temperature.data or 35)
+        if not tco_ranking['devices']:
+            flash("No heat pumps with both a price and a SCOP match the capacity range.", "warning")
+    elif submitted:
         try:
-            # General assumptions
-            H = form.annual_heat_demand.data
-            F = form.electricity_price.data
-            M = form.annual_maintenance_cost.data
-            T_lifetime = form.system_lifetime.data
-            i_rate = form.discount_rate.data
-            s_subsidy = form.capital_cost_subsidy.data if form.capital_cost_subsidy.data is not None else 0.0
-
-            hp_capital_cost = 0
-            hp_scop = 0
-            selected_hp_info = "N/A"
+            scenario = scenario_from_form(form)
             if form.hp_data_source.data == 'custom':
-                hp_capital_cost = form.custom_hp_price.data
-                hp_scop = form.custom_hp_scop.data
-                selected_hp_info = "Custom Heat Pump"
-            elif form.hp_data_source.data == 'database':
-                hp_id = form.db_hp_id.data
-                if hp_id is None:
-                    flash("Invalid Heat Pump selection from database.", "danger")
-                    raise ValueError("Database HP ID is None after validation.")
-
-                selected_hp = db.session.get(HeatPump, hp_id)
-                if not selected_hp:
-                    flash(f"Heat Pump with ID {hp_id} not found.", "danger")
-                    raise ValueError(f"HP ID {hp_id} not found.")
-
-                selected_hp_info = f"{selected_hp.manufacturer} - {selected_hp.model_identifier}"
-                
-                if form.db_hp_price_override.data is not None:
-                    hp_capital_cost = form.db_hp_price_override.data
-                elif selected_hp.price_amount is not None:
-                    hp_capital_cost = selected_hp.price_amount
-                else:
-                    flash(f"Capital cost for '{selected_hp_info}' must be provided or exist in DB.", "danger")
-                    raise ValueError("Missing capital cost for DB HP.")
-                
-                if hasattr(selected_hp, 'scop_avg_lwt35') and selected_hp.scop_avg_lwt35:
-                    hp_scop = selected_hp.scop_avg_lwt35
-                else:
-                    flash(f"Representative SCOP (e.g., scop_avg_lwt35) missing for '{selected_hp_info}'.", "danger")
-                    raise ValueError("Missing SCOP for DB HP.")
-            
-            if not (hp_capital_cost > 0): raise ValueError("Heat pump capital cost must be positive.")
-            if not (hp_scop > 0): raise ValueError("Heat pump SCOP must be positive.")
-
-            # TCO Calculation
-            # 1. Net Investment Cost (C_inv)
-            C_inv = hp_capital_cost * (1 - s_subsidy)
-
-            # 2. Annual Energy Consumption (E_a)
-            E_a = H / hp_scop  # kWh_electric / year
-
-            # 3. Annual Energy Cost (E_c)
-            E_c = E_a * F  # € / year
-
-            # 4. Total Annual Operational Expenditure (A_opex)
-            A_opex = E_c + M # € / year
-
-            # 5. NPV of Operational Expenditures (NPV_opex)
-            NPV_opex = 0
-            if i_rate > 0:
-                NPV_opex = A_opex * ( (1 - (1 + i_rate)**(-T_lifetime) ) / i_rate )
-            elif i_rate == 0: # No discounting
-                NPV_opex = A_opex * T_lifetime
+                tco_result = calculate_tco(scenario, form.custom_hp_price.data, form.custom_hp_scop.data)
             else:
-                flash("Negative discount rate is not typical for this TCO calculation.", "warning")
-                NPV_opex = A_opex * T_lifetime # Defaulting to no discount
-
-            # 6. Total Cost of Ownership (TCO)
-            TCO = C_inv + NPV_opex
-            print(TCO)
-
-            tco_result = {
-                "selected_hp_info": selected_hp_info,
-                "inputs": {
-                    "Annual Heat Demand (kWh)": H,
-                    "Electricity Price (€/kWh)": F,
-                    "Annual Maintenance (€)": M,
-                    "System Lifetime (Years)": T_lifetime,
-                    "Discount Rate": f"{i_rate*100:.2f}%",
-                    "Capital Cost Subsidy": f"{s_subsidy*100:.2f}%",
-                    "Heat Pump Capital Cost (for calc) (€)": hp_capital_cost,
-                    "Heat Pump SCOP (for calc)": round(hp_scop, 2),
-                },
-                "intermediate_calculations": {
-                    "Net Investment Cost (€)": round(C_inv, 2),
-                    "Annual Energy Consumption (kWh)": round(E_a, 2),
-                    "Annual Energy Cost (€)": round(E_c, 2),
-                    "Total Annual Operational Cost (€)": round(A_opex, 2),
-                    "NPV of Operational Costs (€)": round(NPV_opex, 2),
-                },
-                "total_tco_value": round(TCO, 2)
-            }
-            flash(f"TCO calculated successfully for {selected_hp_info}.", "success")
+                hp_id = form.db_hp_id.data
+                tco_result = heat_pump_tco(scenario, hp_id, form.db_hp_price_override.data)
+                if tco_result is None:
+                    raise ValueError(f"Heat Pump with ID {hp_id} not found.")
+            flash(f"TCO calculated successfully for {tco_result['selected_hp_info']}.", "success")
 
         except ValueError as ve: 
             flash(str(ve), "danger")
@@ -683,4 +1482,62 @@ def tco_calculator():
     return render_template('tco_calculator.html', 
                            title="Total Cost of Ownership Calculator", 
                            form=form, 
-                           tco_result=tco_result)
\ No newline at end of file
+                           tco_result=tco_result,
+                           tco_ranking=tco_ranking)
+
+
+ac_tco_cache = LRUCache(maxsize=256)
+
+
+def cached_ac_tco_ranking(form, n, min_capacity=None, max_capacity=None):
+    """AC ranking for a validated ACTCOCalculatorForm, cached per scenario, catalog version and day."""
+    params = {
+        **ac_scenario_from_form(form),
+        'climate_zone': form.climate_zone.data,
+        'usage': form.usage.data,
+        'annual_cooling_demand': form.annual_cooling_demand.data,
+        'annual_heating_demand': form.annual_heating_demand.data,
+        'n': n,
+        'min_capacity': min_capacity,
+        'max_capacity': max_capacity,
+    }
+    cache_key = make_filter_key(params, prefix='ac_tco', extra={'day': date.today().isoformat()})
+    ranking = ac_tco_cache.get(cache_key)
+    if ranking is None:
+        ranking = rank_air_conditioners_by_tco(ac_scenario_from_form(form), climate_zone=form.climate_zone.data,
+                                               usage=form.usage.data, cooling_demand=form.annual_cooling_demand.data,
+                                               heating_demand=form.annual_heating_demand.data, n=n,
+                                               min_capacity=min_capacity, max_capacity=max_capacity)
+        ranking = {'scenario': params, **ranking}
+        ac_tco_cache.set(cache_key, ranking)
+    return ranking
+
+
+@main.route('/ac_tco_calculator', methods=['GET', 'POST'])
+def ac_tco_calculator():
+    form = ACTCOCalculatorForm()
+    ac_ranking = None
+    if form.validate_on_submit():
+        ac_ranking = cached_ac_tco_ranking(form, form.top_n.data or 20,
+                                           min_capacity=form.min_cooling_capacity.data,
+                                           max_capacity=form.max_cooling_capacity.data)
+        if not ac_ranking['devices']:
+            flash("No on-market air conditioners with a price and the needed efficiency data match.", "warning")
+    return render_template('ac_tco_calculator.html',
+                           title="Air Conditioner Ownership Cost Ranking",
+                           form=form,
+                           ac_ranking=ac_ranking)
+
+
+# Cheapest-to-own on-market ACs, e.g. /api/tco/air_conditioners?climate_zone=colder&usage=both&electricity_price=0.3
+# &annual_maintenance_cost=100&system_lifetime=15&discount_rate=0.04&n=10
+@main.route('/api/tco/air_conditioners')
+def api_ac_tco_rank():
+    form = ACTCOCalculatorForm(request.args, meta={'csrf': False})
+    if not form.validate():
+        return jsonify({"error": "Invalid TCO scenario", "fields": form.errors}), 400
+    n = request.args.get('n', 20, type=int)
+    if n < 1 or n > TCO_RANK_LIMIT:
+        return jsonify({"error": f"'n' must be between 1 and {TCO_RANK_LIMIT}"}), 400
+    return jsonify(cached_ac_tco_ranking(form, n, min_capacity=form.min_cooling_capacity.data,
+                                         max_capacity=form.max_cooling_capacity.data))
@@ -0,0 +1,111 @@
+# app/similarity.py
+import threading
+from datetime import date
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import select
+from .models import db, HVACDevice, MODEL_MAP
+from .cache import get_catalog_version
+
+# Features compared per device type. Numeric features are robust-scaled ((x - median) / IQR)
+# so kW, SCOP and percentages weigh the same; the category can be required to match.
+SIMILARITY_FEATURES = {
+    'air_conditioner': {'numeric': ['design_load_cooling_kw', 'seer', 'scop_average'], 'category': 'refrigerant_type'},
+    'heat_pump': {'numeric': ['ph_a7_w35', 'scop_avg_lwt35'], 'category': 'refrigerant'},
+    'residential_ventilation_unit': {'numeric': ['maximumflowrate', 'specificpowerinput', 'thermalefficiencyheatrecovery'], 'category': 'typology'},
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class SimilarityIndex:
+    """KD-trees over the on-market devices of one type: one for the whole type and one per category."""
+
+    def __init__(self, device_type, device_ids, vectors, categories, center, scale):
+        self.device_type = device_type
+        self.center = center
+        self.scale = scale
+        self.device_ids = device_ids
+        self.vectors = vectors
+        self.tree = cKDTree(vectors) if len(vectors) else None
+        self.category_trees = {}
+        for category in set(categories) - {None}:
+            positions = np.flatnonzero(categories == category)
+            self.category_trees[category] = (positions, cKDTree(vectors[positions]))
+
+    def normalize(self, raw_values):
+        return (np.asarray(raw_values, dtype=float) - self.center) / self.scale
+
+    def query(self, raw_values, k, category=None, exclude_id=None):
+        if category is not None and category in self.category_trees:
+            positions, tree = self.category_trees[category]
+        elif category is not None or self.tree is None:
+            return []
+        else:
+            positions, tree = None, self.tree
+        # One extra neighbour in case the device itself is on the market
+        count = min(k + 1, tree.n)
+        distances, hits = tree.query(self.normalize(raw_values), k=count)
+        distances, hits = np.atleast_1d(distances), np.atleast_1d(hits)
+        if positions is not None:
+            hits = positions[hits]
+        neighbours = [(int(self.device_ids[hit]), float(distance)) for distance, hit in zip(distances, hits)
+                      if int(self.device_ids[hit]) != exclude_id]
+        return neighbours[:k]
+
+
+def build_similarity_index(device_type):
+    features = SIMILARITY_FEATURES[device_type]
+    hvac_table = HVACDevice.__table__
+    child_table = MODEL_MAP[device_type].__table__
+    numeric_columns = [child_table.c[name] for name in features['numeric']]
+
+    stmt = select(hvac_table.c.id, child_table.c[features['category']], *numeric_columns)\
+        .select_from(hvac_table.join(child_table, child_table.c.id == hvac_table.c.id))\
+        .where(hvac_table.c.device_type == device_type)\
+        .where(hvac_table.c.market_period.op('@>')(date.today()))\
+        .where(*[column.isnot(None) for column in numeric_columns])
+    rows = db.session.execute(stmt).all()
+
+    device_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    categories = np.array([row[1] for row in rows], dtype=object)
+    raw = np.array([row[2:] for row in rows], dtype=float).reshape(len(rows), len(numeric_columns))
+
+    if len(raw):
+        center = np.median(raw, axis=0)
+        q75, q25 = np.percentile(raw, [75, 25], axis=0)
+        scale = q75 - q25
+        scale = np.where(scale > 0, scale, raw.std(axis=0))
+        scale = np.where(scale > 0, scale, 1.0)
+    else:
+        center = np.zeros(len(numeric_columns))
+        scale = np.ones(len(numeric_columns))
+    return SimilarityIndex(device_type, device_ids, (raw - center) / scale, categories, center, scale)
+
+
+def get_similarity_index(device_type):
+    # Rebuilt lazily once the catalog changes (imports bump the version) or the day rolls over
+    cache_key = (device_type, get_catalog_version(), date.today())
+    with _indexes_lock:
+        index = _indexes.get(device_type)
+        if index is not None and index[0] == cache_key:
+            return index[1]
+    similarity_index = build_similarity_index(device_type)
+    with _indexes_lock:
+        _indexes[device_type] = (cache_key, similarity_index)
+    return similarity_index
+
+
+def find_similar_devices(device, k=10, same_category=True):
+    """[(device_id, distance), ...] of the k nearest on-market devices of the same type."""
+    features = SIMILARITY_FEATURES.get(device.device_type)
+    if features is None:
+        raise ValueError(f"Similarity search is not available for '{device.device_type}'")
+    raw_values = [getattr(device, name) for name in features['numeric']]
+    missing = [name for name, value in zip(features['numeric'], raw_values) if value is None]
+    if missing:
+        raise ValueError(f"Device {device.id} has no value for {', '.join(missing)}")
+
+    category = getattr(device, features['category']) if same_category else None
+    return get_similarity_index(device.device_type).query(raw_values, k, category=category, exclude_id=device.id)
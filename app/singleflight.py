@@ -0,0 +1,154 @@
+# app/singleflight.py
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; coalescing then stays per process
+    fcntl = None
+
+# Coalesces identical expensive requests that are in flight at the same time: the first caller
+# for a key computes, concurrent callers with the same key wait and get the same result. Nothing
+# is kept once the computation finishes, so this never serves anything older than the request.
+#
+# With config SINGLE_FLIGHT_LOCK_DIR set, the first caller also holds an fcntl lock on a per-key
+# file, so the workers of a host coalesce too. A worker that had to wait for the lock reuses the
+# result the holder published while it was waiting, provided the result could be pickled.
+
+# Lock and result files untouched for this long are removed (checked at most every PRUNE_INTERVAL)
+FILE_RETENTION_SECONDS = 600
+PRUNE_INTERVAL_SECONDS = 300
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.computed = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def configure(self, lock_dir=None):
+        if lock_dir and fcntl is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+            self.lock_dir = lock_dir
+        else:
+            self.lock_dir = None
+
+    def do(self, key, fn, shareable=None):
+        """
+        fn() once for all concurrent callers with this key. Callers share the result object,
+        so it must not be modified. shareable(result) decides if other workers may reuse it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.lock_dir is not None:
+                call.result = self._run_across_workers(key, fn, shareable)
+            else:
+                call.result = fn()
+                self.computed += 1
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run_across_workers(self, key, fn, shareable):
+        base_path = os.path.join(self.lock_dir, hashlib.sha1(repr(key).encode()).hexdigest())
+        result_path = base_path + '.result'
+        waiting_since = time.time()
+        lock_file = self._acquire(base_path + '.lock')
+        try:
+            try:
+                if os.path.getmtime(result_path) >= waiting_since:
+                    with open(result_path, 'rb') as f:
+                        result = pickle.load(f)
+                    self.shared_hits += 1
+                    return result
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+            result = fn()
+            self.computed += 1
+            if shareable is None or shareable(result):
+                temp_path = f'{result_path}.{os.getpid()}.{threading.get_ident()}'
+                try:
+                    with open(temp_path, 'wb') as f:
+                        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(temp_path, result_path)
+                except (OSError, pickle.PicklingError, TypeError, AttributeError):
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            self._prune()
+
+    @staticmethod
+    def _acquire(lock_path):
+        # A pruner may unlink the file between open and flock; retry until the locked file is the one on disk
+        while True:
+            lock_file = open(lock_path, 'a+b')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    os.utime(lock_path)
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = now
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if now - entry.stat().st_mtime < FILE_RETENTION_SECONDS:
+                    continue
+                if entry.name.endswith('.lock'):
+                    # Only unlinked while held, so nobody can be computing under it
+                    with open(entry.path, 'a+b') as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(entry.path)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+single_flight = SingleFlight()
+
+
+def configure_single_flight(config):
+    single_flight.configure(lock_dir=config.get('SINGLE_FLIGHT_LOCK_DIR'))
@@ -0,0 +1,80 @@
+# app/skyline.py
+import numpy as np
+
+# Candidates are compared against the current front in chunks of this size (k > 2)
+SKYLINE_CHUNK_SIZE = 256
+# The front of the first points in SFS order eliminates most candidates in one vectorised pass
+SKYLINE_PREFILTER_SIZE = 128
+
+
+def dominated_by(front, candidates):
+    """Boolean mask: which candidates are dominated by at least one point of front (all minimised)."""
+    if len(front) == 0:
+        return np.zeros(len(candidates), dtype=bool)
+    less_equal = (front[None, :, :] <= candidates[:, None, :]).all(axis=2)
+    strictly_less = (front[None, :, :] < candidates[:, None, :]).any(axis=2)
+    return (less_equal & strictly_less).any(axis=1)
+
+
+def skyline_2d(points):
+    # Sorted by x, a point is on the front iff its y beats every y seen before it
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    sorted_y = points[order, 1]
+    best_y_before = np.concatenate(([np.inf], np.minimum.accumulate(sorted_y)[:-1]))
+    return np.sort(order[sorted_y < best_y_before])
+
+
+def skyline_sfs(points, chunk_size=SKYLINE_CHUNK_SIZE):
+    # Sort-filter-skyline: sorted by the sum of (dense) per-metric ranks, a point can only be
+    # dominated by points before it, so front members are final once accepted.
+    ranks = np.column_stack([np.unique(points[:, i], return_inverse=True)[1].reshape(-1) for i in range(points.shape[1])])
+    order = np.argsort(ranks.sum(axis=1), kind='stable')
+
+    head = order[:SKYLINE_PREFILTER_SIZE]
+    head = head[~dominated_by(points[head], points[head])]
+    rest = order[SKYLINE_PREFILTER_SIZE:]
+    keep = np.concatenate([~dominated_by(points[head], points[rest[start:start + chunk_size * 16]])
+                           for start in range(0, len(rest), chunk_size * 16)] or [np.array([], dtype=bool)])
+    order = np.concatenate((order[:SKYLINE_PREFILTER_SIZE], rest[keep]))
+
+    front_indices = []
+    front = np.empty((0, points.shape[1]))
+    for start in range(0, len(order), chunk_size):
+        chunk_indices = order[start:start + chunk_size]
+        chunk = points[chunk_indices]
+        survivors = ~dominated_by(front, chunk)
+        chunk_indices, chunk = chunk_indices[survivors], chunk[survivors]
+        survivors = ~dominated_by(chunk, chunk)
+        front_indices.append(chunk_indices[survivors])
+        front = np.vstack((front, chunk[survivors]))
+    return np.sort(np.concatenate(front_indices)) if front_indices else np.array([], dtype=int)
+
+
+def pareto_front(values, maximize):
+    """
+    Indices of the non-dominated rows of values (n x k, 2 <= k <= 4).
+
+    maximize is one bool per column; other columns are minimised. Rows with a
+    missing value are never on the front. Identical rows do not dominate each
+    other, so duplicates of a front point are all returned. O(n log n) for two
+    metrics (sort + sweep), sort-filter-skyline in chunks for three or four.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2 or not 2 <= values.shape[1] <= 4:
+        raise ValueError("Skyline needs between 2 and 4 metrics")
+    signs = np.where(np.asarray(maximize, dtype=bool), -1.0, 1.0)
+    complete = np.flatnonzero(~np.isnan(values).any(axis=1))
+    points = values[complete] * signs
+
+    unique_points, inverse = np.unique(points, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if len(unique_points) == 0:
+        return complete
+    if unique_points.shape[1] == 2:
+        front_unique = skyline_2d(unique_points)
+    else:
+        front_unique = skyline_sfs(unique_points)
+
+    on_front = np.zeros(len(unique_points), dtype=bool)
+    on_front[front_unique] = True
+    return complete[on_front[inverse]]
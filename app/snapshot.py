@@ -0,0 +1,336 @@
+# app/snapshot.py
+import threading
+from collections import namedtuple
+from datetime import date
+import numpy as np
+import pandas as pd
+from flask import current_app
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select
+from sqlalchemy import types as sqltypes
+from .models import db, HVACDevice, MODEL_MAP
+from .forms import FIELD_DEFINITIONS, SPECIAL_GROUPING_OPTIONS, DEVICE_TYPE_MODEL_MAPPING
+from .cache import get_catalog_version, NON_FILTER_PARAMS
+from .utils import get_single_param, TRUTHY_PARAM_VALUES
+
+# Optional read engine (config COLUMNAR_SNAPSHOT): the whole catalog as one NumPy array per
+# column, answering the common filters with vectorised masks. Every method returns None for
+# anything it does not handle exactly like apply_search_filters, and the caller runs SQL instead.
+
+# Search parameters evaluated here; any other non-empty filter parameter means SQL
+SNAPSHOT_FILTER_PARAMS = {
+    'manufacturer', 'device_type', 'id_or_model_identifier', 'on_market_at', 'plausible_only',
+    'search_metric_name', 'search_metric_operator', 'search_metric_value', 'filter_field', 'filter_value',
+}
+
+GroupRow = namedtuple('GroupRow', ['grouping_key', 'count'])
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def column_kind(column):
+    column_type = column.type
+    if isinstance(column_type, (sqltypes.Integer, sqltypes.Numeric)):
+        return 'integer' if isinstance(column_type, sqltypes.Integer) else 'float'
+    if isinstance(column_type, sqltypes.Boolean):
+        return 'bool'
+    if isinstance(column_type, sqltypes.Date) and not isinstance(column_type, sqltypes.DateTime):
+        return 'date'
+    if isinstance(column_type, sqltypes.String):
+        return 'string'
+    return None # Timestamps, ranges, JSON: not needed for filtering
+
+
+class CatalogSnapshot:
+    def __init__(self, version, columns, kinds):
+        self.version = version
+        self.columns = columns # 'AirConditioner.seer' -> ndarray, one entry per device
+        self.kinds = kinds
+        self.ids = columns['HVACDevice.id'].astype(np.int64)
+        self.row_count = len(self.ids)
+        device_types = columns['HVACDevice.device_type']
+        self.class_masks = {model_class_name: device_types == type_key for type_key, model_class_name in DEVICE_TYPE_MODEL_MAPPING.items()}
+
+    def field_column(self, field_key):
+        if field_key == 'market_entry_year':
+            return 'HVACDevice.entry_year', 'HVACDevice'
+        f_def = FIELD_DEFINITIONS.get(field_key)
+        if not f_def:
+            return None, None
+        key = f"{f_def['model_class_name']}.{f_def['model_attr']}"
+        return (key, f_def['model_class_name']) if key in self.columns else (None, None)
+
+    def present(self, key):
+        values = self.columns[key]
+        kind = self.kinds[key]
+        if kind in ('integer', 'float'):
+            return ~np.isnan(values)
+        if kind == 'date':
+            return ~np.isnat(values)
+        if kind == 'bool':
+            return np.ones(self.row_count, dtype=bool)
+        return pd.notna(values)
+
+    def restrict_to(self, model_class_name):
+        # SQL joins the child table, which drops the other device types
+        return self.class_masks.get(model_class_name, np.ones(self.row_count, dtype=bool))
+
+    def contains(self, key, text):
+        return pd.Series(self.columns[key]).str.contains(str(text), case=False, regex=False, na=False).to_numpy(dtype=bool)
+
+    def compare(self, key, operator, value):
+        values = self.columns[key]
+        kind = self.kinds[key]
+        if kind == 'date':
+            value = np.datetime64(value, 'D')
+        elif kind == 'string':
+            if operator == 'like':
+                return self.contains(key, value)
+            if operator != '==':
+                return None # Collation-dependent ordering is left to the database
+        if operator not in ('>=', '<=', '=='):
+            return None
+        with np.errstate(invalid='ignore'):
+            if operator == '>=':
+                result = values >= value
+            elif operator == '<=':
+                result = values <= value
+            else:
+                result = values == value
+        return np.asarray(result, dtype=bool) & self.present(key)
+
+    def filter_mask(self, search_params, ignore_params=()):
+        for param_name in search_params:
+            if param_name in NON_FILTER_PARAMS or param_name in SNAPSHOT_FILTER_PARAMS or param_name in ignore_params:
+                continue
+            if get_single_param(search_params, param_name) is not None:
+                return None
+
+        mask = np.ones(self.row_count, dtype=bool)
+        manufacturer_val = get_single_param(search_params, 'manufacturer')
+        if manufacturer_val:
+            mask &= self.contains('HVACDevice.manufacturer', manufacturer_val)
+        device_type_val = get_single_param(search_params, 'device_type')
+        if device_type_val:
+            mask &= self.columns['HVACDevice.device_type'] == device_type_val
+        id_or_model_val = get_single_param(search_params, 'id_or_model_identifier')
+        if id_or_model_val:
+            try:
+                mask &= self.ids == int(id_or_model_val)
+            except ValueError:
+                mask &= self.contains('HVACDevice.model_identifier', id_or_model_val)
+
+        on_market_at_val = get_single_param(search_params, 'on_market_at')
+        if on_market_at_val:
+            try:
+                on_market_date = np.datetime64(on_market_at_val if isinstance(on_market_at_val, date) else date.fromisoformat(str(on_market_at_val)), 'D')
+            except ValueError:
+                return None
+            entry = self.columns['HVACDevice.market_entry']
+            exit_ = self.columns['HVACDevice.market_exit']
+            # Same as market_period @> date with market_period = [market_entry, market_exit)
+            mask &= (entry <= on_market_date) & (np.isnat(exit_) | (exit_ > on_market_date))
+
+        plausible_only_val = get_single_param(search_params, 'plausible_only')
+        if plausible_only_val and str(plausible_only_val).lower() in TRUTHY_PARAM_VALUES:
+            mask &= self.columns['HVACDevice.is_plausible']
+
+        metric_name_key = get_single_param(search_params, 'search_metric_name')
+        metric_operator = get_single_param(search_params, 'search_metric_operator')
+        metric_value_str = get_single_param(search_params, 'search_metric_value')
+        if metric_name_key and metric_operator and metric_value_str is not None:
+            metric_def = FIELD_DEFINITIONS.get(metric_name_key)
+            key, model_class_name = self.field_column(metric_name_key)
+            if not metric_def or not metric_def.get('searchable') or key is None:
+                return None
+            try:
+                metric_value = self.parse_value(metric_def.get('type', 'string'), metric_value_str)
+            except ValueError:
+                return None
+            if metric_operator == 'like' and metric_def.get('type', 'string') != 'string':
+                return None
+            metric_mask = self.compare(key, metric_operator, metric_value)
+            if metric_mask is None:
+                return None
+            mask &= metric_mask & self.restrict_to(model_class_name)
+
+        adv_filter_field_key = get_single_param(search_params, 'filter_field')
+        adv_filter_value = get_single_param(search_params, 'filter_value')
+        if adv_filter_field_key and adv_filter_value is not None and FIELD_DEFINITIONS.get(adv_filter_field_key):
+            adv_filter_def = FIELD_DEFINITIONS[adv_filter_field_key]
+            key, model_class_name = self.field_column(adv_filter_field_key)
+            if key is None:
+                return None
+            try:
+                adv_value = self.parse_value(adv_filter_def.get('type', 'string'), adv_filter_value)
+            except ValueError:
+                return None
+            if self.kinds[key] == 'string':
+                mask &= self.contains(key, adv_value)
+            else:
+                mask &= self.compare(key, '==', adv_value)
+            mask &= self.restrict_to(model_class_name)
+        return mask
+
+    @staticmethod
+    def parse_value(attr_type, value):
+        value = str(value)
+        if value.strip() == '':
+            raise ValueError("empty value")
+        if attr_type == 'float':
+            return float(value)
+        if attr_type == 'integer':
+            return int(value)
+        if attr_type == 'date':
+            return date.fromisoformat(value)
+        return value
+
+    def python_value(self, key, value):
+        if pd.isna(value):
+            return None
+        kind = self.kinds[key]
+        if kind == 'integer':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'date':
+            return pd.Timestamp(value).date()
+        if kind == 'bool':
+            return bool(value)
+        return value
+
+    def matching_ids(self, mask):
+        return np.sort(self.ids[mask])[::-1] # Newest first, like ORDER BY id DESC
+
+    def group_counts(self, mask, group_key):
+        group_def = FIELD_DEFINITIONS.get(group_key) or SPECIAL_GROUPING_OPTIONS.get(group_key)
+        if not group_def or not group_def.get('groupable', True) or group_def.get('rank_metric'):
+            return None
+        key, model_class_name = self.field_column(group_key)
+        if key is None:
+            return None
+        counts = pd.Series(self.columns[key][mask & self.restrict_to(model_class_name)]).value_counts(dropna=False)
+        group_rows = [GroupRow(self.python_value(key, value), int(count)) for value, count in counts.items()]
+        # ORDER BY grouping_key: NULL sorts last
+        group_rows.sort(key=lambda row: (row.grouping_key is None, row.grouping_key if row.grouping_key is not None else 0))
+        return group_rows
+
+    def histogram(self, mask, metric_key, bins=None, auto_max_bins=50):
+        key, model_class_name = self.field_column(metric_key)
+        if key is None or self.kinds[key] not in ('integer', 'float'):
+            return None
+        values = self.columns[key][mask & self.restrict_to(model_class_name) & self.present(key)]
+        if len(values) == 0:
+            return {'metric': metric_key, 'count': 0, 'min': None, 'max': None, 'bins': 0, 'bin_width': None, 'counts': []}
+        lo, hi = float(values.min()), float(values.max())
+        bin_total = bins or min(int(np.ceil(np.log2(max(len(values), 1)))) + 1, auto_max_bins)
+        if hi == lo:
+            bin_total = 1
+            buckets = np.zeros(len(values), dtype=np.int64)
+        else:
+            # width_bucket(v, lo, hi, bins) - 1, with the maximum folded into the last bin
+            buckets = np.minimum(np.floor((values - lo) / (hi - lo) * bin_total).astype(np.int64), bin_total - 1)
+        return {
+            'metric': metric_key,
+            'count': int(len(values)),
+            'min': lo,
+            'max': hi,
+            'bins': bin_total,
+            'bin_width': (hi - lo) / bin_total,
+            'counts': np.bincount(buckets, minlength=bin_total).tolist(),
+        }
+
+    def top_n(self, mask, metric_key, group_key, n, descending=True):
+        metric_column, metric_class = self.field_column(metric_key)
+        group_column, group_class = self.field_column(group_key)
+        if metric_column is None or group_column is None or self.kinds[metric_column] not in ('integer', 'float'):
+            return None
+        rows = np.flatnonzero(mask & self.present(metric_column) & self.present(group_column)
+                              & self.restrict_to(metric_class) & self.restrict_to(group_class))
+        metric_values = self.columns[metric_column][rows]
+        group_codes, group_values = pd.factorize(self.columns[group_column][rows], sort=True)
+        order = np.lexsort((self.ids[rows], -metric_values if descending else metric_values, group_codes))
+
+        sorted_codes = group_codes[order]
+        positions = np.arange(len(order))
+        group_starts = np.maximum.accumulate(np.where(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]], positions, 0)) if len(order) else positions
+        ranks = positions - group_starts + 1
+        keep = ranks <= n
+
+        groups = []
+        for code, rank, row in zip(sorted_codes[keep], ranks[keep], rows[order][keep]):
+            group_value = self.python_value(group_column, group_values[code])
+            if not groups or groups[-1]['group'] != group_value:
+                groups.append({'group': group_value, 'devices': []})
+            groups[-1]['devices'].append({
+                'rank': int(rank),
+                'id': int(self.ids[row]),
+                'manufacturer': self.columns['HVACDevice.manufacturer'][row],
+                'model_identifier': self.columns['HVACDevice.model_identifier'][row],
+                'value': self.python_value(metric_column, self.columns[metric_column][row]),
+            })
+        return groups
+
+
+class SnapshotPagination(Pagination):
+    """Pages over an id list from the snapshot; items are the ids on the page, nothing is loaded."""
+
+    def _query_items(self):
+        page_ids = self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]
+        return [int(device_id) for device_id in page_ids]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+
+def load_catalog_snapshot(version):
+    hvac_table = HVACDevice.__table__
+    hvac_columns = [column for column in hvac_table.c if column_kind(column)]
+    kinds = {f'HVACDevice.{column.name}': column_kind(column) for column in hvac_columns}
+    frames = []
+    for type_key, ModelClass in MODEL_MAP.items():
+        child_table = ModelClass.__table__
+        child_columns = [column for column in child_table.c if column.name != 'id' and column_kind(column)]
+        kinds.update({f'{ModelClass.__name__}.{column.name}': column_kind(column) for column in child_columns})
+        labelled = [column.label(f'HVACDevice.{column.name}') for column in hvac_columns] + \
+                   [column.label(f'{ModelClass.__name__}.{column.name}') for column in child_columns]
+        result = db.session.execute(
+            select(*labelled).select_from(hvac_table.join(child_table, child_table.c.id == hvac_table.c.id))
+                             .where(hvac_table.c.device_type == type_key)
+        )
+        frames.append(pd.DataFrame(result.all(), columns=list(result.keys())))
+    frame = pd.concat(frames, ignore_index=True, sort=False)
+
+    columns = {}
+    for key, kind in kinds.items():
+        series = frame[key] if key in frame.columns else pd.Series([None] * len(frame), dtype=object)
+        if kind in ('integer', 'float'):
+            columns[key] = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+        elif kind == 'date':
+            columns[key] = pd.to_datetime(series, errors='coerce').to_numpy().astype('datetime64[D]')
+        elif kind == 'bool':
+            columns[key] = series.fillna(False).astype(bool).to_numpy()
+        else:
+            columns[key] = series.astype(object).where(series.notna(), None).to_numpy()
+    return CatalogSnapshot(version, columns, kinds)
+
+
+def get_catalog_snapshot():
+    """The snapshot for the current catalog version, or None when disabled or unavailable."""
+    global _snapshot
+    if not current_app.config.get('COLUMNAR_SNAPSHOT'):
+        return None
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            try:
+                _snapshot = load_catalog_snapshot(version)
+                current_app.logger.info(f"Columnar snapshot loaded: {_snapshot.row_count} devices, catalog version {version}.")
+            except Exception as e:
+                current_app.logger.error(f"Columnar snapshot could not be loaded, using SQL: {e}", exc_info=True)
+                return None
+        return _snapshot
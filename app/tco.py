@@ -0,0 +1,596 @@
+# app/tco.py
+import threading
+from datetime import date
+import numpy as np
+from sqlalchemy import select
+from .models import db, HVACDevice, HeatPump, AirConditioner
+from .cache import LRUCache, get_catalog_version
+from .climate import bin_method_energy
+
+# The TCOCalculatorForm fields that make up a scenario
+TCO_SCENARIO_FIELDS = ('annual_heat_demand', 'electricity_price', 'annual_maintenance_cost',
+                       'system_lifetime', 'discount_rate', 'capital_cost_subsidy')
+
+# (type, minimum, maximum) per scenario field, as validated by TCOCalculatorForm
+TCO_SCENARIO_LIMITS = {
+    'annual_heat_demand': (float, 0, None),
+    'electricity_price': (float, 0, None),
+    'annual_maintenance_cost': (float, 0, None),
+    'system_lifetime': (int, 1, 50),
+    'discount_rate': (float, 0, 1),
+    'capital_cost_subsidy': (float, 0, None),
+}
+
+# Scenario fields that can be varied in a sensitivity analysis
+SENSITIVITY_PARAMETERS = ('electricity_price', 'discount_rate', 'system_lifetime', 'capital_cost_subsidy')
+SENSITIVITY_PERCENTILES = (5, 25, 50, 75, 95)
+# Upper bound on the device x scenario block evaluated at once (float32)
+SENSITIVITY_CHUNK_ELEMENTS = 4_000_000
+SENSITIVITY_MAX_SCENARIOS = 100_000
+SENSITIVITY_MAX_DEVICES = 1000
+
+# Air conditioners: the ownership-cost inputs (no heat demand, the AC consumption model replaces it)
+AC_SCENARIO_FIELDS = ('electricity_price', 'annual_maintenance_cost', 'system_lifetime', 'discount_rate', 'capital_cost_subsidy')
+# Equivalent full-load hours behind the declared annual consumption (Regulation (EU) 626/2011)
+AC_COOLING_EQUIVALENT_HOURS = 350
+AC_HEATING_EQUIVALENT_HOURS = {'average': 1400, 'warmer': 1400, 'colder': 2100}
+AC_CLIMATE_ZONE_COLUMNS = {
+    'average': ('scop_average', 'design_load_heating_average_kw', 'annual_consumption_heating_average_kwh'),
+    'warmer': ('scop_warm', 'design_load_heating_warm_kw', 'annual_consumption_heating_warm_kwh'),
+    'colder': ('scop_cold', 'design_load_heating_cold_kw', 'annual_consumption_heating_cold_kwh'),
+}
+
+# Single-device results keyed on (catalog version, device id, price override, scenario)
+tco_memo = LRUCache(maxsize=16384)
+
+_heat_pump_costs = None
+_heat_pump_costs_lock = threading.Lock()
+_air_conditioner_costs = None
+_air_conditioner_costs_lock = threading.Lock()
+
+
+def scenario_from_form(form):
+    scenario = {name: getattr(form, name).data for name in TCO_SCENARIO_FIELDS}
+    if scenario['capital_cost_subsidy'] is None:
+        scenario['capital_cost_subsidy'] = 0.0
+    return scenario
+
+
+def parse_scenario(values):
+    """Scenario from a plain mapping (query args, JSON); raises ValueError like the form validation would."""
+    scenario = {}
+    for name, (kind, minimum, maximum) in TCO_SCENARIO_LIMITS.items():
+        value = values.get(name)
+        if value is None or value == '':
+            if name == 'capital_cost_subsidy':
+                scenario[name] = 0.0
+                continue
+            raise ValueError(f"'{name}' is required")
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{name}' must be a number")
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError(f"'{name}' must be between {minimum} and {maximum}" if maximum is not None else f"'{name}' must be at least {minimum}")
+        scenario[name] = value
+    return scenario
+
+
+def ac_scenario_from_form(form):
+    scenario = {name: getattr(form, name).data for name in AC_SCENARIO_FIELDS}
+    if scenario['capital_cost_subsidy'] is None:
+        scenario['capital_cost_subsidy'] = 0.0
+    return scenario
+
+
+def annuity_factor(discount_rate, system_lifetime):
+    """Present value of 1 €/year over the lifetime; the plain number of years where the rate is 0."""
+    rate = np.asarray(discount_rate, dtype=float)
+    years = np.asarray(system_lifetime, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discounted = (1 - (1 + rate) ** -years) / rate
+    return np.where(rate > 0, discounted, years)
+
+
+def compute_tco(capital_cost, scop, annual_heat_demand, electricity_price, annual_maintenance_cost,
+                system_lifetime, discount_rate, capital_cost_subsidy=0.0):
+    """
+    TCO = C_inv + NPV_opex, with C_inv = cost * (1 - subsidy) and E_a = H / SCOP.
+
+    Every argument may be a scalar or a NumPy array; they are broadcast against each
+    other, so one call prices a whole catalog (or a whole grid of scenarios).
+    """
+    annual_energy = np.asarray(annual_heat_demand, dtype=float) / np.asarray(scop, dtype=float)
+    return ownership_cost(capital_cost, annual_energy, electricity_price, annual_maintenance_cost,
+                          system_lifetime, discount_rate, capital_cost_subsidy)
+
+
+def ownership_cost(capital_cost, annual_energy, electricity_price, annual_maintenance_cost,
+                   system_lifetime, discount_rate, capital_cost_subsidy=0.0):
+    """TCO from the annual electricity consumption (kWh); broadcasts like compute_tco."""
+    capital_cost = np.asarray(capital_cost, dtype=float)
+    net_investment = capital_cost * (1 - np.asarray(capital_cost_subsidy, dtype=float))
+    annual_energy = np.asarray(annual_energy, dtype=float)
+    annual_energy_cost = annual_energy * np.asarray(electricity_price, dtype=float)
+    annual_opex = annual_energy_cost + np.asarray(annual_maintenance_cost, dtype=float)
+    npv_opex = annual_opex * annuity_factor(discount_rate, system_lifetime)
+    return {
+        'net_investment': net_investment,
+        'annual_energy_kwh': annual_energy,
+        'annual_energy_cost': annual_energy_cost,
+        'annual_opex': annual_opex,
+        'npv_opex': npv_opex,
+        'tco': net_investment + npv_opex,
+    }
+
+
+def calculate_tco(scenario, capital_cost, scop, label="Custom Heat Pump"):
+    """TCO breakdown of one heat pump, as shown by the calculator."""
+    if capital_cost is None or not capital_cost > 0:
+        raise ValueError("Heat pump capital cost must be positive.")
+    if scop is None or not scop > 0:
+        raise ValueError("Heat pump SCOP must be positive.")
+    result = {name: float(value) for name, value in compute_tco(capital_cost, scop, **scenario).items()}
+    return {
+        "selected_hp_info": label,
+        "inputs": {
+            "Annual Heat Demand (kWh)": scenario['annual_heat_demand'],
+            "Electricity Price (€/kWh)": scenario['electricity_price'],
+            "Annual Maintenance (€)": scenario['annual_maintenance_cost'],
+            "System Lifetime (Years)": scenario['system_lifetime'],
+            "Discount Rate": f"{scenario['discount_rate']*100:.2f}%",
+            "Capital Cost Subsidy": f"{scenario['capital_cost_subsidy']*100:.2f}%",
+            "Heat Pump Capital Cost (for calc) (€)": capital_cost,
+            "Heat Pump SCOP (for calc)": round(scop, 2),
+        },
+        "intermediate_calculations": {
+            "Net Investment Cost (€)": round(result['net_investment'], 2),
+            "Annual Energy Consumption (kWh)": round(result['annual_energy_kwh'], 2),
+            "Annual Energy Cost (€)": round(result['annual_energy_cost'], 2),
+            "Total Annual Operational Cost (€)": round(result['annual_opex'], 2),
+            "NPV of Operational Costs (€)": round(result['npv_opex'], 2),
+        },
+        "total_tco_value": round(result['tco'], 2),
+    }
+
+
+def heat_pump_cost_inputs(heat_pump, price_override=None):
+    """(label, capital cost, SCOP) of a database heat pump; ValueError if either value is missing."""
+    label = f"{heat_pump.manufacturer} - {heat_pump.model_identifier}"
+    capital_cost = price_override if price_override is not None else heat_pump.price_amount
+    if capital_cost is None:
+        raise ValueError(f"Capital cost for '{label}' must be provided or exist in DB.")
+    if not heat_pump.scop_avg_lwt35:
+        raise ValueError(f"Representative SCOP (e.g., scop_avg_lwt35) missing for '{label}'.")
+    return label, capital_cost, heat_pump.scop_avg_lwt35
+
+
+def tco_memo_key(scenario, device_id, price_override=None):
+    return (get_catalog_version(), device_id, price_override, tuple(scenario[name] for name in TCO_SCENARIO_FIELDS))
+
+
+def heat_pump_tco(scenario, device_id, price_override=None):
+    """Memoized TCO breakdown of one database heat pump; None if there is no heat pump with that id."""
+    cache_key = tco_memo_key(scenario, device_id, price_override)
+    result = tco_memo.get(cache_key)
+    if result is None:
+        heat_pump = db.session.get(HeatPump, device_id)
+        if heat_pump is None:
+            return None
+        label, capital_cost, scop = heat_pump_cost_inputs(heat_pump, price_override)
+        result = calculate_tco(scenario, capital_cost, scop, label=label)
+        tco_memo.set(cache_key, result)
+    return result
+
+
+def evaluate_tco_batch(evaluations):
+    """
+    TCO of many (scenario, heat pump) pairs. Each evaluation holds the scenario fields plus
+    either device_id (and optionally price_override) or custom_price and custom_scop. Heat
+    pumps missing from the memo are loaded in one query. Failed evaluations get an 'error'.
+    """
+    parsed = []
+    for evaluation in evaluations:
+        try:
+            scenario = parse_scenario(evaluation)
+            device_id = evaluation.get('device_id')
+            device_id = int(device_id) if device_id not in (None, '') else None
+            price_override = evaluation.get('price_override')
+            price_override = float(price_override) if price_override not in (None, '') else None
+            parsed.append((scenario, device_id, price_override, None))
+        except (TypeError, ValueError) as e:
+            parsed.append((None, None, None, str(e)))
+
+    missing_ids = {device_id for scenario, device_id, price_override, error in parsed
+                   if device_id is not None and tco_memo.get(tco_memo_key(scenario, device_id, price_override)) is None}
+    # Keeps the loaded rows referenced, so db.session.get() below finds them in the identity map
+    loaded = HeatPump.query.filter(HeatPump.id.in_(missing_ids)).all() if missing_ids else []
+
+    results = []
+    for evaluation, (scenario, device_id, price_override, error) in zip(evaluations, parsed):
+        try:
+            if error is not None:
+                raise ValueError(error)
+            if device_id is not None:
+                result = heat_pump_tco(scenario, device_id, price_override)
+                if result is None:
+                    raise ValueError(f"Heat Pump with ID {device_id} not found.")
+                results.append({'device_id': device_id, **result})
+            else:
+                custom_price, custom_scop = evaluation.get('custom_price'), evaluation.get('custom_scop')
+                results.append(calculate_tco(scenario, float(custom_price) if custom_price not in (None, '') else None,
+                                             float(custom_scop) if custom_scop not in (None, '') else None))
+        except (TypeError, ValueError) as e:
+            results.append({'device_id': device_id, 'error': str(e)})
+    return results
+
+
+def load_heat_pump_costs():
+    """Column arrays of every heat pump that has both a price and a SCOP (LWT 35)."""
+    hvac_table = HVACDevice.__table__
+    hp_table = HeatPump.__table__
+    stmt = select(hvac_table.c.id, hvac_table.c.manufacturer, hvac_table.c.model_identifier,
+                  hvac_table.c.price_amount, hp_table.c.scop_avg_lwt35, hp_table.c.pdesignh_avg_lwt35,
+                  hp_table.c.scop_avg_lwt55, hp_table.c.pdesignh_avg_lwt55,
+                  hp_table.c.cop_am7_w35, hp_table.c.cop_a2_w35, hp_table.c.cop_a7_w35,
+                  hp_table.c.ph_am7_w35, hp_table.c.ph_a2_w35, hp_table.c.ph_a7_w35)\
+        .select_from(hvac_table.join(hp_table, hp_table.c.id == hvac_table.c.id))\
+        .where(hvac_table.c.price_amount > 0, hp_table.c.scop_avg_lwt35 > 0)\
+        .order_by(hvac_table.c.id)
+    rows = db.session.execute(stmt).all()
+    return {
+        'ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'names': np.array([f"{row[1]} - {row[2]}" for row in rows], dtype=object),
+        'price': np.array([row[3] for row in rows], dtype=float),
+        'scop': np.array([row[4] for row in rows], dtype=float),
+        'capacity': np.array([row[5] for row in rows], dtype=float),
+        'scop_lwt55': np.array([row[6] for row in rows], dtype=float),
+        'capacity_lwt55': np.array([row[7] for row in rows], dtype=float),
+        # Declared part-load points at -7/2/7 °C outdoor, W35
+        'cop_points': np.array([row[8:11] for row in rows], dtype=float).reshape(len(rows), 3),
+        'capacity_points': np.array([row[11:14] for row in rows], dtype=float).reshape(len(rows), 3),
+    }
+
+
+def get_heat_pump_costs():
+    # Reloaded once the catalog version moves (imports, manual adds)
+    global _heat_pump_costs
+    version = get_catalog_version()
+    with _heat_pump_costs_lock:
+        if _heat_pump_costs is not None and _heat_pump_costs[0] == version:
+            return _heat_pump_costs[1]
+    costs = load_heat_pump_costs()
+    with _heat_pump_costs_lock:
+        _heat_pump_costs = (version, costs)
+    return costs
+
+
+def capacity_mask(capacity, min_capacity=None, max_capacity=None):
+    mask = np.ones(len(capacity), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        if min_capacity is not None:
+            mask &= capacity >= min_capacity
+        if max_capacity is not None:
+            mask &= capacity <= max_capacity
+    return mask
+
+
+def lowest_positions(values, n):
+    """Positions of the n smallest values, ascending (ties by position)."""
+    count = min(n, len(values))
+    if not count:
+        return np.array([], dtype=int)
+    top = np.argpartition(values, count - 1)[:count]
+    return top[np.lexsort((top, values[top]))]
+
+
+def climate_performance(costs, positions, annual_heat_demand, bins, flow_temperature=35):
+    """
+    Bin-method energy of the heat pumps at positions for one climate ((temperatures, hours,
+    design temperature), see climate.climate_bins). The W55 curves are not declared point
+    by point, so the W35 points are scaled by the SCOP and design capacity ratios.
+    """
+    temperatures, hours, design_temperature = bins
+    cop_points = costs['cop_points'][positions]
+    capacity_points = costs['capacity_points'][positions]
+    seasonal_cop = costs['scop'][positions]
+    if flow_temperature == 55:
+        cop_points = cop_points * (costs['scop_lwt55'][positions] / seasonal_cop)[:, None]
+        capacity_ratio = costs['capacity_lwt55'][positions] / costs['capacity'][positions]
+        capacity_points = capacity_points * np.where(np.isfinite(capacity_ratio), capacity_ratio, 1.0)[:, None]
+        seasonal_cop = costs['scop_lwt55'][positions]
+    return bin_method_energy(annual_heat_demand, temperatures, hours, design_temperature,
+                             cop_points, capacity_points, seasonal_cop)
+
+
+def rank_heat_pumps_by_tco(scenario, n=20, min_capacity=None, max_capacity=None, bins=None, flow_temperature=35):
+    """
+    The n heat pumps with the lowest TCO under one scenario, optionally within a capacity range (kW).
+
+    Without bins the declared SCOP (LWT 35) is used; with climate bins the annual consumption
+    comes from the bin method at the given flow temperature.
+    """
+    costs = get_heat_pump_costs()
+    positions = np.flatnonzero(capacity_mask(costs['capacity'], min_capacity, max_capacity))
+    scop = costs['scop'][positions]
+    backup_heat = None
+    if bins is not None:
+        performance = climate_performance(costs, positions, scenario['annual_heat_demand'], bins, flow_temperature)
+        if scenario['annual_heat_demand'] > 0:
+            scop = performance['seasonal_cop']
+        elif flow_temperature == 55:
+            scop = costs['scop_lwt55'][positions]
+        usable = np.isfinite(scop) & (scop > 0)
+        positions, scop, backup_heat = positions[usable], scop[usable], performance['backup_heat_kwh'][usable]
+    result = compute_tco(costs['price'][positions], scop, **scenario)
+    tco = result['tco']
+
+    devices = []
+    for rank, index in enumerate(lowest_positions(tco, n), start=1):
+        position = positions[index]
+        capacity = costs['capacity'][position]
+        device = {
+            'rank': rank,
+            'id': int(costs['ids'][position]),
+            'name': costs['names'][position],
+            'capacity_kw': None if np.isnan(capacity) else float(capacity),
+            'price': float(costs['price'][position]),
+            'scop': float(costs['scop'][position]),
+            'seasonal_cop': round(float(scop[index]), 3),
+            'net_investment': round(float(result['net_investment'][index]), 2),
+            'annual_energy_kwh': round(float(result['annual_energy_kwh'][index]), 2),
+            'npv_opex': round(float(result['npv_opex'][index]), 2),
+            'tco': round(float(tco[index]), 2),
+        }
+        if backup_heat is not None:
+            device['backup_heat_kwh'] = round(float(backup_heat[index]), 2)
+        devices.append(device)
+    return {'candidates': len(positions), 'devices': devices}
+
+
+def scenario_samples(scenario, ranges, mode='monte_carlo', samples=10000, steps=5, seed=None):
+    """
+    One array per scenario field, all of the same length (one entry per sampled scenario).
+
+    ranges maps SENSITIVITY_PARAMETERS names to (low, high); the other fields keep their
+    scenario value. 'grid' takes the full product of steps evenly spaced values per range,
+    'monte_carlo' draws samples uniform values (whole years for the lifetime).
+    """
+    varied = [name for name in SENSITIVITY_PARAMETERS if name in ranges]
+    values = {}
+    if mode == 'grid':
+        axes = []
+        for name in varied:
+            low, high = ranges[name]
+            axis = np.linspace(low, high, steps)
+            axes.append(np.unique(np.round(axis)) if name == 'system_lifetime' else np.unique(axis))
+        mesh = np.meshgrid(*axes, indexing='ij') if axes else []
+        values = {name: grid.ravel() for name, grid in zip(varied, mesh)}
+        count = mesh[0].size if mesh else 1
+    elif mode == 'monte_carlo':
+        rng = np.random.default_rng(seed)
+        for name in varied:
+            low, high = ranges[name]
+            if name == 'system_lifetime':
+                values[name] = rng.integers(int(round(low)), int(round(high)) + 1, samples).astype(float)
+            else:
+                values[name] = rng.uniform(low, high, samples)
+        count = samples
+    else:
+        raise ValueError(f"Unknown sensitivity mode '{mode}', expected grid or monte_carlo")
+    for name in TCO_SCENARIO_FIELDS:
+        if name not in values:
+            values[name] = np.full(count, float(scenario[name]))
+    return values
+
+
+def percentile_bands(values, lower, weight):
+    """
+    Linear-interpolation percentiles of every row (np.percentile's default method) without
+    sorting: the rows are partitioned at each lower rank in turn, only over the part right of
+    the previous one, and the value just above a rank is the minimum of the part right of it.
+    Single-rank partitions use NumPy's SIMD selection, which a multi-rank partition does not.
+    Reorders values in place.
+    """
+    lower_values = np.empty((len(values), len(lower)), dtype=values.dtype)
+    upper_values = np.empty_like(lower_values)
+    start = 0
+    for position in np.argsort(lower, kind='stable'):
+        rank = lower[position]
+        if rank >= start:
+            values[:, start:].partition(rank - start, axis=1)
+            start = rank + 1
+        lower_values[:, position] = values[:, rank]
+        upper_values[:, position] = values[:, rank + 1:].min(axis=1) if rank + 1 < values.shape[1] else values[:, rank]
+    return lower_values * (1 - weight) + upper_values * weight
+
+
+def tco_sensitivity(capital_cost, scop, samples, percentiles=SENSITIVITY_PERCENTILES):
+    """
+    TCO of every device under every sampled scenario, reduced to per-device percentile
+    bands, the mean and the share of scenarios in which the device is the cheapest.
+
+    TCO[d, s] = price[d] * (1 - subsidy[s]) + (H[s] * F[s] * AF[s]) / scop[d] + M[s] * AF[s],
+    so the device x scenario matrix is two outer products and an add. It is built in float32
+    blocks of a few devices to bound memory, partitioned in place per device at just the ranks
+    the percentiles need (percentile_bands), and the cheapest device per scenario is carried
+    across blocks.
+    """
+    capital_cost = np.asarray(capital_cost, dtype=np.float32)
+    inverse_scop = (1 / np.asarray(scop, dtype=float)).astype(np.float32)
+    factor = annuity_factor(samples['discount_rate'], samples['system_lifetime'])
+    investment_share = (1 - samples['capital_cost_subsidy']).astype(np.float32)
+    energy_weight = (samples['annual_heat_demand'] * samples['electricity_price'] * factor).astype(np.float32)
+    fixed_cost = (samples['annual_maintenance_cost'] * factor).astype(np.float32)
+
+    scenario_count, device_count = len(factor), len(capital_cost)
+    ranks = np.asarray(percentiles, dtype=float) / 100 * (scenario_count - 1)
+    lower = np.floor(ranks).astype(int)
+    weight = (ranks - lower)[None, :]
+
+    bands = np.empty((device_count, len(percentiles)))
+    means = np.empty(device_count)
+    best_tco = np.full(scenario_count, np.inf, dtype=np.float32)
+    best_device = np.zeros(scenario_count, dtype=np.int64)
+    all_scenarios = np.arange(scenario_count)
+    block_size = max(1, SENSITIVITY_CHUNK_ELEMENTS // max(scenario_count, 1))
+    for start in range(0, device_count, block_size):
+        stop = min(start + block_size, device_count)
+        tco = np.multiply.outer(capital_cost[start:stop], investment_share)
+        tco += np.multiply.outer(inverse_scop[start:stop], energy_weight)
+        tco += fixed_cost
+
+        block_best = tco.argmin(axis=0)
+        block_min = tco[block_best, all_scenarios]
+        better = block_min < best_tco
+        best_tco[better] = block_min[better]
+        best_device[better] = block_best[better] + start
+
+        means[start:stop] = tco.mean(axis=1, dtype=float)
+        bands[start:stop] = percentile_bands(tco, lower, weight)
+
+    cheapest_share = np.bincount(best_device, minlength=device_count) / scenario_count if device_count else np.zeros(0)
+    return {'percentiles': bands, 'mean': means, 'probability_cheapest': cheapest_share}
+
+
+def heat_pump_sensitivity(scenario, ranges, mode='monte_carlo', samples=10000, steps=5, seed=None,
+                          device_ids=None, n=20, min_capacity=None, max_capacity=None):
+    """
+    Sensitivity of the heat pump TCO ranking. Either the given device ids or the n cheapest
+    heat pumps under the base scenario (within the capacity range) are compared. Given ids that
+    are not heat pumps with a price and a SCOP are returned as missing.
+    """
+    costs = get_heat_pump_costs()
+    missing = []
+    if device_ids:
+        positions = np.flatnonzero(np.isin(costs['ids'], np.asarray(device_ids, dtype=np.int64)))
+        missing = sorted(set(device_ids) - set(costs['ids'][positions].tolist()))
+    else:
+        positions = np.flatnonzero(capacity_mask(costs['capacity'], min_capacity, max_capacity))
+        base_tco = compute_tco(costs['price'][positions], costs['scop'][positions], **scenario)['tco']
+        positions = positions[lowest_positions(base_tco, n)]
+
+    sampled = scenario_samples(scenario, ranges, mode=mode, samples=samples, steps=steps, seed=seed)
+    result = tco_sensitivity(costs['price'][positions], costs['scop'][positions], sampled)
+    devices = []
+    for index, position in enumerate(positions):
+        devices.append({
+            'id': int(costs['ids'][position]),
+            'name': costs['names'][position],
+            'price': float(costs['price'][position]),
+            'scop': float(costs['scop'][position]),
+            'tco_mean': round(float(result['mean'][index]), 2),
+            'tco_percentiles': {f"p{percentile:g}": round(float(value), 2)
+                                for percentile, value in zip(SENSITIVITY_PERCENTILES, result['percentiles'][index])},
+            'probability_cheapest': round(float(result['probability_cheapest'][index]), 4),
+        })
+    devices.sort(key=lambda device: (-device['probability_cheapest'], device['tco_mean']))
+    return {'mode': mode, 'scenarios': len(sampled['electricity_price']), 'devices': devices, 'missing': missing}
+
+
+def load_air_conditioner_costs():
+    """Column arrays of every on-market air conditioner with a price."""
+    hvac_table = HVACDevice.__table__
+    ac_table = AirConditioner.__table__
+    zone_columns = [ac_table.c[name] for zone in AC_CLIMATE_ZONE_COLUMNS for name in AC_CLIMATE_ZONE_COLUMNS[zone]]
+    stmt = select(hvac_table.c.id, hvac_table.c.manufacturer, hvac_table.c.model_identifier, hvac_table.c.price_amount,
+                  ac_table.c.seer, ac_table.c.design_load_cooling_kw, ac_table.c.annual_consumption_cooling_kwh, *zone_columns)\
+        .select_from(hvac_table.join(ac_table, ac_table.c.id == hvac_table.c.id))\
+        .where(hvac_table.c.price_amount > 0, hvac_table.c.market_period.op('@>')(date.today()))\
+        .order_by(hvac_table.c.id)
+    rows = db.session.execute(stmt).all()
+
+    def column(index):
+        return np.array([row[index] for row in rows], dtype=float)
+
+    costs = {
+        'ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'names': np.array([f"{row[1]} - {row[2]}" for row in rows], dtype=object),
+        'price': column(3),
+        'seer': column(4),
+        'cooling_load': column(5),
+        'cooling_kwh': column(6),
+    }
+    for offset, zone in enumerate(AC_CLIMATE_ZONE_COLUMNS):
+        costs[f'scop_{zone}'] = column(7 + 3 * offset)
+        costs[f'heating_load_{zone}'] = column(8 + 3 * offset)
+        costs[f'heating_kwh_{zone}'] = column(9 + 3 * offset)
+    return costs
+
+
+def get_air_conditioner_costs():
+    # On-market status depends on the day, so the arrays are keyed on the date as well
+    global _air_conditioner_costs
+    cache_key = (get_catalog_version(), date.today())
+    with _air_conditioner_costs_lock:
+        if _air_conditioner_costs is not None and _air_conditioner_costs[0] == cache_key:
+            return _air_conditioner_costs[1]
+    costs = load_air_conditioner_costs()
+    with _air_conditioner_costs_lock:
+        _air_conditioner_costs = (cache_key, costs)
+    return costs
+
+
+def air_conditioner_energy(costs, climate_zone, usage='both', cooling_demand=None, heating_demand=None):
+    """
+    Annual cooling and heating electricity (kWh) per air conditioner; NaN where the stored
+    metrics cannot price the usage. With a demand (kWh of cooling/heat) it is divided by SEER
+    or the zone's SCOP; without one the declared consumption is used, or rebuilt from the
+    design load and the equivalent full-load hours when it is missing.
+    """
+    count = len(costs['ids'])
+    cooling = np.zeros(count)
+    heating = np.zeros(count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if usage in ('cooling', 'both'):
+            if cooling_demand is not None:
+                cooling = cooling_demand / costs['seer']
+            else:
+                rebuilt = costs['cooling_load'] * AC_COOLING_EQUIVALENT_HOURS / costs['seer']
+                cooling = np.where(np.isnan(costs['cooling_kwh']), rebuilt, costs['cooling_kwh'])
+        if usage in ('heating', 'both'):
+            scop = costs[f'scop_{climate_zone}']
+            if heating_demand is not None:
+                heating = heating_demand / scop
+            else:
+                rebuilt = costs[f'heating_load_{climate_zone}'] * AC_HEATING_EQUIVALENT_HOURS[climate_zone] / scop
+                declared = costs[f'heating_kwh_{climate_zone}']
+                heating = np.where(np.isnan(declared), rebuilt, declared)
+    cooling = np.where(np.isfinite(cooling) & (cooling >= 0), cooling, np.nan)
+    heating = np.where(np.isfinite(heating) & (heating >= 0), heating, np.nan)
+    return cooling, heating
+
+
+def rank_air_conditioners_by_tco(scenario, climate_zone='average', usage='both', cooling_demand=None, heating_demand=None,
+                                 n=20, min_capacity=None, max_capacity=None):
+    """The n on-market air conditioners with the lowest TCO, optionally within a cooling design load range (kW)."""
+    if climate_zone not in AC_CLIMATE_ZONE_COLUMNS:
+        raise ValueError(f"Unknown climate zone '{climate_zone}', expected one of {', '.join(AC_CLIMATE_ZONE_COLUMNS)}")
+    if usage not in ('cooling', 'heating', 'both'):
+        raise ValueError(f"Unknown usage '{usage}', expected cooling, heating or both")
+    costs = get_air_conditioner_costs()
+    cooling, heating = air_conditioner_energy(costs, climate_zone, usage, cooling_demand, heating_demand)
+    annual_energy = cooling + heating
+    positions = np.flatnonzero(capacity_mask(costs['cooling_load'], min_capacity, max_capacity) & ~np.isnan(annual_energy))
+    result = ownership_cost(costs['price'][positions], annual_energy[positions], **scenario)
+    tco = result['tco']
+
+    devices = []
+    for rank, index in enumerate(lowest_positions(tco, n), start=1):
+        position = positions[index]
+        capacity = costs['cooling_load'][position]
+        devices.append({
+            'rank': rank,
+            'id': int(costs['ids'][position]),
+            'name': costs['names'][position],
+            'cooling_capacity_kw': None if np.isnan(capacity) else float(capacity),
+            'price': float(costs['price'][position]),
+            'seer': None if np.isnan(costs['seer'][position]) else float(costs['seer'][position]),
+            'scop': None if np.isnan(costs[f'scop_{climate_zone}'][position]) else float(costs[f'scop_{climate_zone}'][position]),
+            'annual_cooling_kwh': round(float(cooling[position]), 2),
+            'annual_heating_kwh': round(float(heating[position]), 2),
+            'net_investment': round(float(result['net_investment'][index]), 2),
+            'npv_opex': round(float(result['npv_opex'][index]), 2),
+            'tco': round(float(tco[index]), 2),
+        })
+    return {'candidates': len(positions), 'devices': devices}
@@ -2,11 +2,80 @@
 import os
 import pandas as pd
 from werkzeug.utils import secure_filename
-from .models import db, HVACDevice, MODEL_MAP, AirConditioner, ResidentialVentilationUnit, HeatPump 
+from .models import db, HVACDevice, MODEL_MAP, AirConditioner, ResidentialVentilationUnit, HeatPump, DeviceComponent
 import math 
 from datetime import date
 import re
 from flask import current_app
+from .cache import bump_catalog_version
+from .validity import compute_validity_flags
+from .outliers import refresh_outlier_flags
+from .ranks import refresh_metric_ranks
+from .canonical import refresh_canonical_metrics
+
+TRUTHY_PARAM_VALUES = ('1', 'true', 'y', 'yes', 'on')
+
+def get_single_param(search_params, param_name):
+    val = search_params.get(param_name) 
+    if isinstance(val, list):
+        return val[0] if len(val) > 0 and val[0] is not None and str(val[0]).strip() != '' else None
+    elif isinstance(val, str):
+        return val if val.strip() != '' else None
+    elif val is not None:
+        return val 
+    return None
+
+def identifier_components(identifier, trim_variant_suffix=False):
+    """
+    Splits complex HVAC model identifiers into their unit codes (sorted).
+    Example: "MXZ-2D33VA-E4 / MSZ-SF15VA + MSZ-EF18VE" -> ['MSZ-EF18VE', 'MSZ-SF15VA', 'MXZ-2D33VA']
+    trim_variant_suffix also cuts trailing variant codes (VE3W -> VE) off the identifier's end;
+    that is lossy and only applied to the last unit, so it is for fuzzy file matching, not indexing.
+    """
+    if identifier is None or pd.isna(identifier):
+        return []
+
+    processed = re.sub(r'\s*[\+/]\s*', '/', str(identifier))
+    processed = re.sub(r'-E\d+', '', processed) # Remove -E followed by digits (e.g., -E4)
+    processed = re.sub(r'\([^\)]*\)', '', processed) # Remove anything in parentheses (e.g., (B)(S))
+    if trim_variant_suffix:
+        processed = re.sub(r'(\d[A-Z]?)(\d[A-Z]+)$', r'\1', processed) # Try removing patterns like VE3W -> VE
+
+    components = [part.strip() for part in processed.split('/') if part.strip()]
+    components = [re.sub(r'[^A-Za-z0-9]$', '', comp) for comp in components]
+    return sorted(comp for comp in components if comp)
+
+def normalize_identifier(identifier):
+    """
+    Attempts to normalize complex HVAC model identifiers into a standard format.
+    Example A: "MXZ-2D33VA-E4 / MSZ-SF15VA + MSZ-EF18VE"
+    Example B: "MXZ-2D33VA/MSZ-SF15VA/MSZ-EF18VE3W(B)(S)"
+    Target Normalized: "MXZ-2D33VA|MSZ-EF18VE|MSZ-SF15VA" (sorted components)
+    """
+    components = identifier_components(identifier, trim_variant_suffix=True)
+    return '|'.join(components) if components else None
+
+def component_codes(model_identifier):
+    # Upper-cased first so suffixes like "-e4" are stripped the same way as "-E4"
+    return sorted(set(identifier_components(model_identifier.upper() if isinstance(model_identifier, str) else model_identifier)))
+
+def build_device_components(model_identifier):
+    return [DeviceComponent(component=component) for component in component_codes(model_identifier)]
+
+def refresh_device_components():
+    """Rebuilds device_components for every device (backfill). Returns the number of rows written."""
+    component_table = DeviceComponent.__table__
+    records = [
+        {'device_id': device_id, 'component': component}
+        for device_id, model_identifier in db.session.query(HVACDevice.id, HVACDevice.model_identifier).all()
+        for component in component_codes(model_identifier)
+    ]
+    db.session.execute(component_table.delete())
+    if records:
+        db.session.execute(component_table.insert(), records)
+    bump_catalog_version()
+    db.session.commit()
+    return len(records)
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'csv'}
@@ -48,6 +117,17 @@ def get_row_value(row, col_name, data_type='string'):
         current_app.logger.warning(f"Conversion Warning: Could not convert value '{value}' for column '{col_name}' to type '{data_type}'. Field set to None.")
         return None
 
+# Side tables derived from a whole device type (outliers, percentile ranks, canonical metrics), rebuilt after an import.
+# A failure is logged but does not fail the import itself.
+def refresh_derived_tables(device_type):
+    for refresh in (refresh_outlier_flags, refresh_metric_ranks, refresh_canonical_metrics):
+        try:
+            row_count = refresh(device_type)
+            current_app.logger.info(f"{refresh.__name__} for {device_type}: {row_count} rows.")
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"{refresh.__name__} failed after import ({device_type}): {e}", exc_info=True)
+
 def process_csv(file_path, target_device_type_str):
     ModelClass = MODEL_MAP.get(target_device_type_str)
     if not ModelClass:
@@ -256,6 +336,8 @@ def process_csv(file_path, target_device_type_str):
                                 except: custom_data[csv_col_in_df] = str(value) # Fallback
                 
                 device = ModelClass(**common_data, **specific_data)
+                device.validity_flags = compute_validity_flags(target_device_type_str, {**common_data, **specific_data})
+                device.components = build_device_components(device.model_identifier)
                 db.session.add(device)
                 db.session.commit()
                 success_count += 1
@@ -271,6 +353,12 @@ def process_csv(file_path, target_device_type_str):
                 errors_list.append(f"Row {index + 2}: Unexpected error - {type(e).__name__} {e}")
                 current_app.logger.error(f"CSV Import Exception: Row {index+2}, Type {target_device_type_str}, Error: {e}", exc_info=True)
 
+        if success_count > 0:
+            # One bump per import: each one invalidates the result caches and the snapshot in every worker
+            bump_catalog_version()
+            db.session.commit()
+            refresh_derived_tables(target_device_type_str)
+
         # Construct summary message
         if success_count > 0 and error_count == 0:
             message = f"Successfully committed {success_count} {ModelClass.__name__} devices."
@@ -0,0 +1,107 @@
+# app/validity.py
+from sqlalchemy import and_, not_, case, literal
+from .models import db, HVACDevice, MODEL_MAP
+from .cache import bump_catalog_version
+
+# Declarative plausibility rules, evaluated once per row when a device is imported or
+# added. A violated rule sets bit <position in this list> of HVACDevice.validity_flags;
+# is_plausible is generated as (validity_flags = 0). Missing values never violate a rule.
+# Bits are stored, so only ever append new rules - reordering would change their meaning.
+# After editing the rules run `flask refresh-validity` to re-evaluate existing rows.
+#   min / max: exclusive bounds (min_inclusive=True makes the lower bound inclusive)
+#   scale: value is multiplied by this before comparing (e.g. m³/s -> m³/h)
+PLAUSIBILITY_RULES = [
+    # Air conditioners
+    {'device_type': 'air_conditioner', 'attr': 'seer', 'min': 1, 'max': 10},
+    {'device_type': 'air_conditioner', 'attr': 'scop_average', 'min': 1, 'max': 10},
+    {'device_type': 'air_conditioner', 'attr': 'design_load_cooling_kw', 'min': 0.1, 'max': 12},
+    {'device_type': 'air_conditioner', 'attr': 'refrigerant_gwp', 'min': 0, 'min_inclusive': True, 'max': 4000},
+    {'device_type': 'air_conditioner', 'attr': 'eta_s_cooling_percent', 'min': 50, 'max': 500},
+    {'device_type': 'air_conditioner', 'attr': 'noise_level_outdoor_cooling_db', 'min': 30, 'max': 90},
+    # Heat pumps
+    {'device_type': 'heat_pump', 'attr': 'pc_a35_w12_7', 'min': 0.1, 'max': 200},
+    {'device_type': 'heat_pump', 'attr': 'eer_a35_w12_7', 'min': 1, 'max': 10},
+    {'device_type': 'heat_pump', 'attr': 'seer_ac', 'min': 1, 'max': 15},
+    {'device_type': 'heat_pump', 'attr': 'eta_sc_ac', 'min': 50, 'max': 600},
+    {'device_type': 'heat_pump', 'attr': 'scop_avg_lwt35', 'min': 1, 'max': 7},
+    {'device_type': 'heat_pump', 'attr': 'eta_sh_avg_lwt35', 'min': 50, 'max': 300},
+    {'device_type': 'heat_pump', 'attr': 'scop_avg_lwt55', 'min': 1, 'max': 6},
+    {'device_type': 'heat_pump', 'attr': 'eta_sh_avg_lwt55', 'min': 50, 'max': 250},
+    # Residential ventilation units
+    {'device_type': 'residential_ventilation_unit', 'attr': 'fandrivepowerinput', 'max': 2000},
+    {'device_type': 'residential_ventilation_unit', 'attr': 'referenceflowrate', 'scale': 3600, 'max': 1000},
+    {'device_type': 'residential_ventilation_unit', 'attr': 'specificpowerinput', 'max': 2},
+]
+
+
+def rule_violated(rule, value):
+    if value is None:
+        return False
+    try:
+        scaled_value = float(value) * rule.get('scale', 1)
+    except (TypeError, ValueError):
+        return True
+    if rule.get('min') is not None:
+        if scaled_value < rule['min'] or (scaled_value == rule['min'] and not rule.get('min_inclusive')):
+            return True
+    if rule.get('max') is not None and scaled_value >= rule['max']:
+        return True
+    return False
+
+
+def compute_validity_flags(device_type, values):
+    flags = 0
+    for bit, rule in enumerate(PLAUSIBILITY_RULES):
+        if rule['device_type'] == device_type and rule_violated(rule, values.get(rule['attr'])):
+            flags |= 1 << bit
+    return flags
+
+
+def describe_validity_flags(flags):
+    return [rule['attr'] for bit, rule in enumerate(PLAUSIBILITY_RULES) if flags and flags & (1 << bit)]
+
+
+def validity_mask(device_type, attrs):
+    """Bits of the given metrics' rules, for checking only those (validity_flags & mask = 0)."""
+    mask = 0
+    for bit, rule in enumerate(PLAUSIBILITY_RULES):
+        if rule['device_type'] == device_type and rule['attr'] in attrs:
+            mask |= 1 << bit
+    return mask
+
+
+def rule_violation_expression(rule, column):
+    value = column * rule['scale'] if 'scale' in rule else column
+    in_range = []
+    if rule.get('min') is not None:
+        in_range.append(value >= rule['min'] if rule.get('min_inclusive') else value > rule['min'])
+    if rule.get('max') is not None:
+        in_range.append(value < rule['max'])
+    return and_(column.isnot(None), not_(and_(*in_range)))
+
+
+def refresh_validity_flags(device_type=None):
+    """Re-evaluates the rules for existing rows, one set-based UPDATE per device type."""
+    hvac_table = HVACDevice.__table__
+    updated = 0
+    for type_key, ModelClass in MODEL_MAP.items():
+        if device_type and type_key != device_type:
+            continue
+        child_table = ModelClass.__table__
+        flag_terms = []
+        for bit, rule in enumerate(PLAUSIBILITY_RULES):
+            if rule['device_type'] != type_key:
+                continue
+            column = child_table.c[rule['attr']] if rule['attr'] in child_table.c else hvac_table.c[rule['attr']]
+            flag_terms.append(case((rule_violation_expression(rule, column), 1 << bit), else_=0))
+        # Every rule owns a distinct bit, so adding the terms is the same as OR-ing them
+        flags_expression = sum(flag_terms[1:], flag_terms[0]) if flag_terms else literal(0)
+
+        stmt = hvac_table.update()\
+            .where(hvac_table.c.id == child_table.c.id)\
+            .where(hvac_table.c.device_type == type_key)\
+            .values(validity_flags=flags_expression)
+        updated += db.session.execute(stmt).rowcount
+    bump_catalog_version()
+    db.session.commit()
+    return updated
@@ -0,0 +1,124 @@
+import os
+import time
+from sqlalchemy import create_engine, text
+
+# --- Configuration ---
+DATABASE_URI = os.getenv('DATABASE_URL')
+
+if not DATABASE_URI:
+    raise ValueError("DATABASE_URI environment variable not set. Please set it before running.")
+
+# Each benchmark is run twice inside one transaction: with the indexes from the
+# migrations in place ("after"), then with them dropped ("before"). The transaction
+# is rolled back, so nothing is changed - but DROP INDEX takes an exclusive lock on
+# the table while it runs, so point this at a development copy of the database.
+BENCHMARKS = [
+    {
+        'name': 'AC search: device type + market entry range + SEER',
+        'indexes': ['ix_hvacdevices_device_type_market_entry', 'ix_air_conditioners_seer'],
+        'query': """
+            SELECT hd.id FROM hvacdevices hd JOIN air_conditioners ac ON ac.id = hd.id
+            WHERE hd.device_type = 'air_conditioner'
+              AND hd.market_entry BETWEEN DATE '2020-01-01' AND DATE '2022-12-31'
+              AND ac.seer >= 8.5
+        """,
+    },
+    {
+        'name': 'AC trend query: design load + SEER range',
+        'indexes': ['ix_air_conditioners_design_load_cooling_kw_seer', 'ix_air_conditioners_seer'],
+        'query': """
+            SELECT hd.manufacturer, hd.market_entry, ac.seer FROM hvacdevices hd JOIN air_conditioners ac ON ac.id = hd.id
+            WHERE ac.design_load_cooling_kw < 12 AND ac.seer BETWEEN 2.5 AND 10.0
+        """,
+    },
+    {
+        'name': 'HP search: SCOP LWT35 threshold',
+        'indexes': ['ix_heat_pumps_scop_avg_lwt35'],
+        'query': """
+            SELECT hd.id FROM hvacdevices hd JOIN heat_pumps hp ON hp.id = hd.id
+            WHERE hd.device_type = 'heat_pump' AND hp.scop_avg_lwt35 >= 5.0
+        """,
+    },
+    {
+        'name': 'RVU search: specific power input threshold',
+        'indexes': ['ix_residential_ventilation_units_specificpowerinput'],
+        'query': """
+            SELECT hd.id FROM hvacdevices hd JOIN residential_ventilation_units v ON v.id = hd.id
+            WHERE hd.device_type = 'residential_ventilation_unit' AND v.specificpowerinput < 0.3
+        """,
+    },
+    {
+        'name': 'Market snapshot: currently on market',
+        'indexes': ['ix_hvacdevices_on_market', 'ix_hvacdevices_market_exit'],
+        'query': """
+            SELECT hd.id FROM hvacdevices hd
+            WHERE hd.device_type = 'air_conditioner'
+              AND (hd.market_exit IS NULL OR hd.market_exit > CURRENT_DATE)
+              AND (hd.market_entry IS NOT NULL AND hd.market_entry <= CURRENT_DATE)
+        """,
+    },
+    {
+        'name': 'Time travel: on market at a past date',
+        'indexes': ['ix_hvacdevices_market_period'],
+        'query': """
+            SELECT hd.id FROM hvacdevices hd
+            WHERE hd.market_period @> DATE '2019-06-30'
+        """,
+    },
+    {
+        'name': 'Top 5 SCOP heat pumps per refrigerant',
+        'indexes': ['ix_heat_pumps_refrigerant_scop_avg_lwt35'],
+        'query': """
+            SELECT * FROM (
+                SELECT hp.id, hp.refrigerant, hp.scop_avg_lwt35,
+                       row_number() OVER (PARTITION BY hp.refrigerant ORDER BY hp.scop_avg_lwt35 DESC NULLS LAST, hp.id) AS rank
+                FROM heat_pumps hp
+                WHERE hp.refrigerant IS NOT NULL AND hp.scop_avg_lwt35 IS NOT NULL
+            ) ranked
+            WHERE rank <= 5
+        """,
+    },
+]
+
+
+def explain(connection, query):
+    start = time.perf_counter()
+    plan_rows = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}")).fetchall()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return [row[0] for row in plan_rows], elapsed_ms
+
+
+def run_benchmark(db_engine, benchmark):
+    print(f"\n=== {benchmark['name']} ===")
+    with db_engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # Warm the cache once so both plans are measured on hot buffers
+            connection.execute(text(benchmark['query'])).fetchall()
+
+            after_plan, after_ms = explain(connection, benchmark['query'])
+            for index_name in benchmark['indexes']:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+            before_plan, before_ms = explain(connection, benchmark['query'])
+        finally:
+            transaction.rollback()
+
+    print(f"--- Before (indexes {', '.join(benchmark['indexes'])} dropped): {before_ms:.1f} ms ---")
+    print("\n".join(before_plan))
+    print(f"--- After: {after_ms:.1f} ms ---")
+    print("\n".join(after_plan))
+    return before_ms, after_ms
+
+
+if __name__ == "__main__":
+    engine = create_engine(DATABASE_URI)
+    summary = []
+    for benchmark in BENCHMARKS:
+        try:
+            summary.append((benchmark['name'], *run_benchmark(engine, benchmark)))
+        except Exception as e:
+            print(f"ERROR: Benchmark '{benchmark['name']}' failed: {e}")
+
+    print("\n--- Summary ---")
+    for name, before_ms, after_ms in summary:
+        print(f"{name}: {before_ms:.1f} ms -> {after_ms:.1f} ms")
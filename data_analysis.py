@@ -4,6 +4,8 @@ from sqlalchemy import create_engine, text
 from overall_efficiency_trends import analyse_overall_efficiency_trends_ac, visualise_overall_efficiency_trends_ac
 from market_snapshot_analysis import analyse_distribution, _perform_series_analysis
 from rvu_trends import visualise_flowrate_to_powerinput_trends, calculate_correlation
+from app.market_population import monthly_market_population
+from app.validity import validity_mask
 # --- Configuration ---
 DATABASE_URI = os.getenv('DATABASE_URL')
 
@@ -42,14 +44,14 @@ WHERE
     AND base.market_entry IS NOT NULL
     -- AND base.market_exit IS NOT NULL
     AND (
-        (base.market_exit IS NOT NULL AND ROUND(((base.market_exit - base.market_entry) / 365.25)::numeric, 1) > 1.0)
+        base.market_life_days >= 384 -- Market life > 1.0 years when rounded to 0.1 years
         OR 
-        (base.market_exit IS NULL)
+        base.market_exit IS NULL
     )
     AND ac.design_load_cooling_kw < 12
 """
 
-AC_MARKET_SNAPSHOT_QUERY = """SELECT
+AC_MARKET_SNAPSHOT_QUERY = f"""SELECT
     ac.id,
     hd.manufacturer,
     hd.model_identifier,
@@ -122,20 +124,15 @@ FROM
 JOIN
     hvacdevices hd ON ac.id = hd.id
 WHERE
-    (hd.market_exit IS NULL OR hd.market_exit > CURRENT_DATE) -- Not yet exited or exit is in the future
-    AND (hd.market_entry IS NOT NULL AND hd.market_entry <= CURRENT_DATE) -- Is on the market
-    -- !! CRITICAL DATA CLEANING FILTERS from your CurrentMarketACs_Cleaned CTE !!
-    -- Repeat ALL the sensible range filters you established for each metric. Example for SEER:
-    AND (ac.seer IS NULL OR (ac.seer > 1 AND ac.seer < 10))
-    AND (ac.scop_average IS NULL OR (ac.scop_average > 1 AND ac.scop_average < 10))
-    AND (ac.design_load_cooling_kw IS NULL OR (ac.design_load_cooling_kw > 0.1 AND ac.design_load_cooling_kw < 12))
-    AND (ac.refrigerant_gwp IS NULL OR (ac.refrigerant_gwp >=0 AND ac.refrigerant_gwp < 4000))
-    AND (ac.eta_s_cooling_percent IS NULL OR (ac.eta_s_cooling_percent > 50 AND ac.eta_s_cooling_percent < 500))
-    AND (ac.noise_level_outdoor_cooling_db IS NULL OR (ac.noise_level_outdoor_cooling_db > 30 AND ac.noise_level_outdoor_cooling_db < 90))
+    hd.market_period @> CURRENT_DATE -- On the market today: entered, and not yet exited (GiST index)
+    -- !! CRITICAL DATA CLEANING FILTERS !!
+    -- Range checks for SEER, SCOP, design load, GWP, ηs cooling and outdoor noise, evaluated at import
+    -- (PLAUSIBILITY_RULES in app/validity.py); only these bits, so rules added later do not change the result
+    AND hd.validity_flags & {validity_mask('air_conditioner', {'seer', 'scop_average', 'design_load_cooling_kw', 'refrigerant_gwp', 'eta_s_cooling_percent', 'noise_level_outdoor_cooling_db'})} = 0
 ORDER BY
     ac.id; -- Or any other preferred order"""
 
-RVU_PERFORMANCE_QUERY = """
+RVU_PERFORMANCE_QUERY = f"""
 SELECT
     base.manufacturer,
 	base.market_entry AS date,
@@ -153,18 +150,18 @@ INNER JOIN
     residential_ventilation_units AS v ON base.id = v.id
 WHERE
     base.device_type = 'residential_ventilation_unit'
-    AND (EXTRACT (YEAR FROM base.market_entry)) > 2009
+    AND base.entry_year > 2009
 	AND v.heatrecoverysystem IS DISTINCT FROM 'NONE'
     AND v.maximumflowrate IS NOT NULL
-    AND v.fandrivepowerinput < 2000
-    AND v.referenceflowrate*3600 < 1000
+    AND base.validity_flags & {validity_mask('residential_ventilation_unit', {'fandrivepowerinput', 'referenceflowrate', 'specificpowerinput'})} = 0 -- fandrivepowerinput < 2000, referenceflowrate*3600 < 1000, specificpowerinput < 2
+    AND v.fandrivepowerinput IS NOT NULL
+    AND v.referenceflowrate IS NOT NULL
     AND v.specificenergyconsumptionaverage IS NOT NULL
     AND v.thermalefficiencyheatrecovery IS NOT NULL
-    AND (v.specificpowerinput IS NOT NULL OR v.fandrivepowerinput IS NOT NULL)
-    AND v.specificpowerinput < 2
+    AND v.specificpowerinput IS NOT NULL
 """
 
-RVU_MARKET_SNAPSHOT_QUERY = """SELECT
+RVU_MARKET_SNAPSHOT_QUERY = f"""SELECT
     v.id,
     hd.manufacturer,
     hd.model_identifier,
@@ -181,121 +178,53 @@ FROM
 JOIN
     hvacdevices hd ON v.id = hd.id
 WHERE
-    (hd.market_exit IS NULL OR hd.market_exit > CURRENT_DATE) -- Not yet exited or exit is in the future
-    AND (hd.market_entry IS NOT NULL AND hd.market_entry <= CURRENT_DATE) -- Is on the market
-    AND (EXTRACT (YEAR FROM hd.market_entry)) > 2009
+    hd.market_period @> CURRENT_DATE -- On the market today: entered, and not yet exited (GiST index)
+    AND hd.entry_year > 2009
 	AND v.heatrecoverysystem IS DISTINCT FROM 'NONE'
     AND v.maximumflowrate IS NOT NULL
-    AND v.fandrivepowerinput < 2000
-    AND v.referenceflowrate*3600 < 1000
+    AND hd.validity_flags & {validity_mask('residential_ventilation_unit', {'fandrivepowerinput', 'referenceflowrate', 'specificpowerinput'})} = 0 -- fandrivepowerinput < 2000, referenceflowrate*3600 < 1000, specificpowerinput < 2
+    AND v.fandrivepowerinput IS NOT NULL
+    AND v.referenceflowrate IS NOT NULL
     AND v.specificenergyconsumptionaverage IS NOT NULL
     AND v.thermalefficiencyheatrecovery IS NOT NULL
-    AND (v.specificpowerinput IS NOT NULL OR v.fandrivepowerinput IS NOT NULL)
-    AND v.specificpowerinput < 2
+    AND v.specificpowerinput IS NOT NULL
 """
 
-HP_MARKET_SNAPSHOW_QUERY =  """-- CTE to pivot the selected performance metrics for ALL heat pumps
-WITH PivotedHPPerformance AS (
-    SELECT
-        hp.id AS heat_pump_id, 
-        MAX(CASE
-            WHEN hpp.condition_name = 'SEER AC' AND hpp.metric_name = 'SEER'
-            THEN hpp.metric_value ELSE NULL
-        END) AS seer_ac,
-        MAX(CASE
-            WHEN hpp.condition_name = 'SEER AC' AND hpp.metric_name = 'ηsc' 
-            THEN hpp.metric_value ELSE NULL
-        END) AS eta_sc_seer_ac,
-        MAX(CASE
-            WHEN hpp.condition_name = 'A35/W12-7' AND hpp.metric_name = 'Pc'
-            THEN hpp.metric_value ELSE NULL
-        END) AS pc_a35_w12_7,
-        MAX(CASE
-            WHEN hpp.condition_name = 'A35/W12-7' AND hpp.metric_name = 'EER'
-            THEN hpp.metric_value ELSE NULL
-        END) AS eer_a35_w12_7,
-        
-        -- Added: SCOP and ηsh for Average Climate W35
-        MAX(CASE
-            WHEN hpp.condition_name = 'SCOP Average W35' AND hpp.metric_name = 'SCOP'
-            THEN hpp.metric_value ELSE NULL
-        END) AS scop_avg_w35,
-        MAX(CASE
-            WHEN hpp.condition_name = 'SCOP Average W35' AND hpp.metric_name = 'ηsh'
-            THEN hpp.metric_value ELSE NULL
-        END) AS eta_sh_avg_w35, -- ηsh is seasonal space heating efficiency (%)
-
-        -- Added: SCOP and ηsh for Average Climate W55
-        MAX(CASE
-            WHEN hpp.condition_name = 'SCOP Average W55' AND hpp.metric_name = 'SCOP'
-            THEN hpp.metric_value ELSE NULL
-        END) AS scop_avg_w55,
-        MAX(CASE
-            WHEN hpp.condition_name = 'SCOP Average W55' AND hpp.metric_name = 'ηsh'
-            THEN hpp.metric_value ELSE NULL
-        END) AS eta_sh_avg_w55
-        
-    FROM
-        heat_pumps hp 
-    LEFT JOIN
-        heat_pump_performance hpp ON hp.id = hpp.heat_pump_id
-    GROUP BY
-        hp.id
-),
--- CTE to apply data cleaning filters to the pivoted metrics
-CleanedHPDataForAnalysis AS (
-    SELECT
-        pivoted.heat_pump_id,
-        hd.manufacturer,       -- From hvacdevices table
-        hd.model_identifier,   -- From hvacdevices table
-        hp_base.refrigerant,   -- Example from heat_pumps specific table
-        pivoted.seer_ac,
-        pivoted.eta_sc_seer_ac,
-        pivoted.pc_a35_w12_7,
-        pivoted.eer_a35_w12_7,
-        pivoted.scop_avg_w35,   -- Added
-        pivoted.eta_sh_avg_w35, -- Added
-        pivoted.scop_avg_w55,   -- Added
-        pivoted.eta_sh_avg_w55  -- Added
-    FROM
-        PivotedHPPerformance pivoted
-    JOIN 
-        heat_pumps hp_base ON pivoted.heat_pump_id = hp_base.id 
-    JOIN 
-        hvacdevices hd ON pivoted.heat_pump_id = hd.id        
-    WHERE
-        hd.device_type = 'heat_pump' 
-        
-        -- !! CRITICAL DATA CLEANING FILTERS !!
-        -- Adjust these example ranges based on your data exploration for heat pumps.
-        AND (pivoted.pc_a35_w12_7 IS NULL OR (pivoted.pc_a35_w12_7 > 0.1 AND pivoted.pc_a35_w12_7 < 200))
-        AND (pivoted.eer_a35_w12_7 IS NULL OR (pivoted.eer_a35_w12_7 > 1 AND pivoted.eer_a35_w12_7 < 10))
-        AND (pivoted.seer_ac IS NULL OR (pivoted.seer_ac > 1 AND pivoted.seer_ac < 15))
-        AND (pivoted.eta_sc_seer_ac IS NULL OR (pivoted.eta_sc_seer_ac > 50 AND pivoted.eta_sc_seer_ac < 600))
-        -- Added filters for new SCOP and ηsh values (adjust ranges as needed)
-        AND (pivoted.scop_avg_w35 IS NULL OR (pivoted.scop_avg_w35 > 1 AND pivoted.scop_avg_w35 < 7)) 
-        AND (pivoted.eta_sh_avg_w35 IS NULL OR (pivoted.eta_sh_avg_w35 > 50 AND pivoted.eta_sh_avg_w35 < 300)) -- ηsh is a percentage
-        AND (pivoted.scop_avg_w55 IS NULL OR (pivoted.scop_avg_w55 > 1 AND pivoted.scop_avg_w55 < 6)) 
-        AND (pivoted.eta_sh_avg_w55 IS NULL OR (pivoted.eta_sh_avg_w55 > 50 AND pivoted.eta_sh_avg_w55 < 250)) -- ηsh at W55 might be lower
-)
--- Final SELECT to get the raw, cleaned data for each heat pump
-SELECT
-    heat_pump_id,
-    manufacturer,
-    model_identifier,
-    refrigerant,
-    seer_ac,
-    eta_sc_seer_ac,
-    pc_a35_w12_7,
-    eer_a35_w12_7,
-    scop_avg_w35,   -- Added
-    eta_sh_avg_w35, -- Added
-    scop_avg_w55,   -- Added
-    eta_sh_avg_w55  -- Added
+HP_MARKET_SNAPSHOW_QUERY =  f"""SELECT
+    hp.id AS heat_pump_id,
+    hd.manufacturer,
+    hd.model_identifier,
+    hp.refrigerant,
+    hp.seer_ac,
+    hp.eta_sc_ac AS eta_sc_seer_ac,
+    hp.pc_a35_w12_7,
+    hp.eer_a35_w12_7,
+    hp.scop_avg_lwt35 AS scop_avg_w35,
+    hp.eta_sh_avg_lwt35 AS eta_sh_avg_w35, -- ηsh is seasonal space heating efficiency (%)
+    hp.scop_avg_lwt55 AS scop_avg_w55,
+    hp.eta_sh_avg_lwt55 AS eta_sh_avg_w55
 FROM
-    CleanedHPDataForAnalysis
+    heat_pumps hp
+JOIN
+    hvacdevices hd ON hp.id = hd.id
+WHERE
+    hd.device_type = 'heat_pump'
+    -- !! CRITICAL DATA CLEANING FILTERS !!
+    -- Range checks for Pc, EER, SEER, ηsc, SCOP and ηsh (W35/W55) live in PLAUSIBILITY_RULES (app/validity.py)
+    AND hd.validity_flags & {validity_mask('heat_pump', {'pc_a35_w12_7', 'eer_a35_w12_7', 'seer_ac', 'eta_sc_ac', 'scop_avg_lwt35', 'eta_sh_avg_lwt35', 'scop_avg_lwt55', 'eta_sh_avg_lwt55'})} = 0
 ORDER BY
-    heat_pump_id;"""
+    hp.id;"""
+
+MARKET_EVENTS_QUERY = """
+SELECT
+    hd.market_entry,
+    hd.market_exit
+FROM
+    hvacdevices hd
+WHERE
+    hd.device_type = 'air_conditioner'
+    AND hd.market_entry IS NOT NULL
+"""
 
 def fetch_data(db_engine, query):
     """
@@ -370,6 +299,10 @@ if __name__ == "__main__":
         #if 'specificenergyconsumptionaverage' in data_df.columns:
         #    analyse_distribution(data_df, 'specificenergyconsumptionaverage', metric_label='Specific Energy Consumption Average Climate', group_by_column='energyclass')
 
+        #events_df = fetch_data(engine, MARKET_EVENTS_QUERY)
+        #population_df = monthly_market_population(events_df['market_entry'], events_df['market_exit'])
+        #print(population_df.tail(12))
+
         analysis_results = analyse_overall_efficiency_trends_ac(data_df)
         visualise_overall_efficiency_trends_ac(analysis_results)
         #calculate_correlation(data_df)
@@ -1,6 +1,6 @@
 import pandas as pd
-import re
 import os # Import os module for file path joining
+from app.utils import normalize_identifier # Shared with the device_components index
 
 # --- Configuration ---
 # Adjust these paths and column names to match your files
@@ -12,36 +12,6 @@ ID_COLUMN_A = 'modelIdentifier' # Name of the identifier column in FILE_A
 ID_COLUMN_B = 'MODEL_NAME' # Name of the identifier column in FILE_B
 # --- End Configuration ---
 
-def normalize_identifier(identifier):
-    """
-    Attempts to normalize complex HVAC model identifiers into a standard format.
-    Example A: "MXZ-2D33VA-E4 / MSZ-SF15VA + MSZ-EF18VE"
-    Example B: "MXZ-2D33VA/MSZ-SF15VA/MSZ-EF18VE3W(B)(S)"
-    Target Normalized: "MXZ-2D33VA|MSZ-EF18VE|MSZ-SF15VA" (sorted components)
-    """
-    if pd.isna(identifier):
-        return None
-    
-    original_identifier = str(identifier) # Ensure it's a string
-    
-    processed = re.sub(r'\s*[\+/]\s*', '/', original_identifier) 
-    processed = re.sub(r'-E\d+', '', processed) # Remove -E followed by digits (e.g., -E4)
-    processed = re.sub(r'\([^\)]*\)', '', processed) # Remove anything in parentheses (e.g., (B)(S))
-    processed = re.sub(r'(\d[A-Z]?)(\d[A-Z]+)$', r'\1', processed) # Try removing patterns like VE3W -> VE
-
-    components = [part.strip() for part in processed.split('/') if part.strip()]
-    
-    if not components:
-        return None 
-
-    components = [re.sub(r'[^A-Za-z0-9]$', '', comp) for comp in components]
-
-    components.sort()
-    
-    normalized_key = '|'.join(components)
-    
-    return normalized_key
-
 try:
     print(f"Loading data from {FILE_A}...")
     df_a = pd.read_csv(os.path.join(os.getcwd(), FILE_A)) 
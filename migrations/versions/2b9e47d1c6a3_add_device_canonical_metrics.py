@@ -0,0 +1,35 @@
+"""add device_canonical_metrics table
+
+Revision ID: 2b9e47d1c6a3
+Revises: 7c5d18e9b3a4
+Create Date: 2026-10-19 16:08:54.271930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9e47d1c6a3'
+down_revision = '7c5d18e9b3a4'
+branch_labels = None
+depends_on = None
+
+
+# The table starts out empty; run `flask refresh-canonical` afterwards to fill it.
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS device_canonical_metrics (
+            device_id integer NOT NULL REFERENCES hvacdevices (id) ON DELETE CASCADE,
+            canonical_metric varchar(100) NOT NULL,
+            device_type varchar(50) NOT NULL,
+            value double precision NOT NULL,
+            PRIMARY KEY (device_id, canonical_metric)
+        )
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_canonical_metrics_metric_value ON device_canonical_metrics (canonical_metric, value)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_canonical_metrics_device_type ON device_canonical_metrics (device_type)')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS device_canonical_metrics')
@@ -0,0 +1,44 @@
+"""add composite, metric and on-market indexes
+
+Revision ID: 3f9a1c2b7d10
+Revises:
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# The tables themselves are created by db.create_all() in create_app(), which also
+# creates these indexes on a fresh database, hence IF NOT EXISTS.
+INDEXES = [
+    ('ix_hvacdevices_device_type_market_entry', 'hvacdevices', '(device_type, market_entry)', None),
+    ('ix_hvacdevices_on_market', 'hvacdevices', '(device_type, market_entry)', 'market_exit IS NULL'),
+    ('ix_hvacdevices_market_exit', 'hvacdevices', '(market_exit)', None),
+    ('ix_air_conditioners_seer', 'air_conditioners', '(seer)', None),
+    ('ix_air_conditioners_scop_average', 'air_conditioners', '(scop_average)', None),
+    ('ix_air_conditioners_design_load_cooling_kw_seer', 'air_conditioners', '(design_load_cooling_kw, seer)', None),
+    ('ix_heat_pumps_scop_avg_lwt35', 'heat_pumps', '(scop_avg_lwt35)', None),
+    ('ix_heat_pumps_pdesignh_avg_lwt35', 'heat_pumps', '(pdesignh_avg_lwt35)', None),
+    ('ix_residential_ventilation_units_specificpowerinput', 'residential_ventilation_units', '(specificpowerinput)', None),
+]
+
+
+def upgrade():
+    for index_name, table_name, columns, where_clause in INDEXES:
+        where_sql = f' WHERE {where_clause}' if where_clause else ''
+        op.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} {columns}{where_sql}')
+    for table_name in {table_name for _, table_name, _, _ in INDEXES}:
+        op.execute(f'ANALYZE {table_name}')
+
+
+def downgrade():
+    for index_name, _, _, _ in reversed(INDEXES):
+        op.execute(f'DROP INDEX IF EXISTS {index_name}')
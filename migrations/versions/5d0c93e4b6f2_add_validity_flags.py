@@ -0,0 +1,32 @@
+"""add validity_flags and generated is_plausible flag
+
+Revision ID: 5d0c93e4b6f2
+Revises: c27e5f81d394
+Create Date: 2026-10-19 13:21:50.117392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c93e4b6f2'
+down_revision = 'c27e5f81d394'
+branch_labels = None
+depends_on = None
+
+
+# Existing rows start out as plausible; run `flask refresh-validity` afterwards to
+# evaluate PLAUSIBILITY_RULES against them.
+def upgrade():
+    op.execute("""
+        ALTER TABLE hvacdevices
+            ADD COLUMN IF NOT EXISTS validity_flags bigint NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS is_plausible boolean GENERATED ALWAYS AS (validity_flags = 0) STORED
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_is_plausible ON hvacdevices (is_plausible)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_is_plausible')
+    op.execute('ALTER TABLE hvacdevices DROP COLUMN IF EXISTS is_plausible, DROP COLUMN IF EXISTS validity_flags')
@@ -0,0 +1,32 @@
+"""add catalog version table
+
+Revision ID: 6e1b8d4f2a07
+Revises: d3a7f5c2e914
+Create Date: 2026-10-19 21:42:11.508263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1b8d4f2a07'
+down_revision = 'd3a7f5c2e914'
+branch_labels = None
+depends_on = None
+
+
+# One shared row instead of a per-process counter, so an import in one worker or a
+# `flask refresh-*` command invalidates the caches of every running worker.
+def upgrade():
+    op.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id SMALLINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    op.execute('INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS catalog_version')
@@ -0,0 +1,34 @@
+"""add group + metric indexes for top-N queries
+
+Revision ID: 7c5d18e9b3a4
+Revises: e81f3a6c05d2
+Create Date: 2026-10-19 15:20:18.664290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c5d18e9b3a4'
+down_revision = 'e81f3a6c05d2'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_air_conditioners_refrigerant_type_seer', 'air_conditioners', '(refrigerant_type, seer DESC NULLS LAST)'),
+    ('ix_heat_pumps_refrigerant_scop_avg_lwt35', 'heat_pumps', '(refrigerant, scop_avg_lwt35 DESC NULLS LAST)'),
+]
+
+
+def upgrade():
+    for index_name, table_name, columns in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} {columns}')
+    for _, table_name, _ in INDEXES:
+        op.execute(f'ANALYZE {table_name}')
+
+
+def downgrade():
+    for index_name, _, _ in reversed(INDEXES):
+        op.execute(f'DROP INDEX IF EXISTS {index_name}')
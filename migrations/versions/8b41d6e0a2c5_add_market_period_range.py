@@ -0,0 +1,33 @@
+"""add market_period daterange column with GiST index
+
+Revision ID: 8b41d6e0a2c5
+Revises: 3f9a1c2b7d10
+Create Date: 2026-10-19 10:47:05.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d6e0a2c5'
+down_revision = '3f9a1c2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE hvacdevices ADD COLUMN IF NOT EXISTS market_period daterange
+        GENERATED ALWAYS AS (
+            CASE WHEN market_entry IS NOT NULL AND (market_exit IS NULL OR market_exit >= market_entry)
+            THEN daterange(market_entry, market_exit, '[)') END
+        ) STORED
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_market_period ON hvacdevices USING gist (market_period)')
+    op.execute('ANALYZE hvacdevices')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_market_period')
+    op.execute('ALTER TABLE hvacdevices DROP COLUMN IF EXISTS market_period')
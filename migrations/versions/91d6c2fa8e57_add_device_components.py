@@ -0,0 +1,32 @@
+"""add device_components table
+
+Revision ID: 91d6c2fa8e57
+Revises: 2b9e47d1c6a3
+Create Date: 2026-10-19 16:41:12.508317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91d6c2fa8e57'
+down_revision = '2b9e47d1c6a3'
+branch_labels = None
+depends_on = None
+
+
+# The table starts out empty; run `flask refresh-components` afterwards to index existing rows.
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS device_components (
+            device_id integer NOT NULL REFERENCES hvacdevices (id) ON DELETE CASCADE,
+            component varchar(255) NOT NULL,
+            PRIMARY KEY (device_id, component)
+        )
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_components_component ON device_components (component)')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS device_components')
@@ -0,0 +1,36 @@
+"""add device_outliers side table
+
+Revision ID: a4e2b9c71f08
+Revises: 5d0c93e4b6f2
+Create Date: 2026-10-19 14:02:07.584113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e2b9c71f08'
+down_revision = '5d0c93e4b6f2'
+branch_labels = None
+depends_on = None
+
+
+# The table starts out empty; run `flask refresh-outliers` afterwards to flag existing rows.
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS device_outliers (
+            device_id integer NOT NULL REFERENCES hvacdevices (id) ON DELETE CASCADE,
+            metric varchar(100) NOT NULL,
+            device_type varchar(50) NOT NULL,
+            capacity_bin integer,
+            value double precision,
+            robust_z double precision NOT NULL,
+            PRIMARY KEY (device_id, metric)
+        )
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_outliers_device_type_metric ON device_outliers (device_type, metric)')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS device_outliers')
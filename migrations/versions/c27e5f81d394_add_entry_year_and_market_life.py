@@ -0,0 +1,37 @@
+"""add generated entry_year and market_life_days columns
+
+Revision ID: c27e5f81d394
+Revises: 8b41d6e0a2c5
+Create Date: 2026-10-19 11:58:23.440871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27e5f81d394'
+down_revision = '8b41d6e0a2c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE hvacdevices
+            ADD COLUMN IF NOT EXISTS entry_year integer
+                GENERATED ALWAYS AS (EXTRACT(YEAR FROM market_entry)::integer) STORED,
+            ADD COLUMN IF NOT EXISTS market_life_days integer
+                GENERATED ALWAYS AS (market_exit - market_entry) STORED
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_entry_year ON hvacdevices (entry_year)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_market_life_days ON hvacdevices (market_life_days)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_device_type_entry_year ON hvacdevices (device_type, entry_year)')
+    op.execute('ANALYZE hvacdevices')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_device_type_entry_year')
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_market_life_days')
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_entry_year')
+    op.execute('ALTER TABLE hvacdevices DROP COLUMN IF EXISTS market_life_days, DROP COLUMN IF EXISTS entry_year')
@@ -0,0 +1,31 @@
+"""add trigram indexes for heat pump lookup
+
+Revision ID: d3a7f5c2e914
+Revises: 91d6c2fa8e57
+Create Date: 2026-10-19 17:08:37.214906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f5c2e914'
+down_revision = '91d6c2fa8e57'
+branch_labels = None
+depends_on = None
+
+
+# GIN trigram indexes serve the ILIKE '%...%' matching of /api/heat_pumps/lookup. They need
+# pg_trgm, so unlike the other indexes they are not declared on the models (db.create_all()
+# would fail on databases without the extension).
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_model_identifier_trgm ON hvacdevices USING gin (model_identifier gin_trgm_ops)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_hvacdevices_manufacturer_trgm ON hvacdevices USING gin (manufacturer gin_trgm_ops)')
+    op.execute('ANALYZE hvacdevices')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_manufacturer_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_hvacdevices_model_identifier_trgm')
@@ -0,0 +1,38 @@
+"""add device_metric_ranks table
+
+Revision ID: e81f3a6c05d2
+Revises: a4e2b9c71f08
+Create Date: 2026-10-19 14:47:33.902651
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81f3a6c05d2'
+down_revision = 'a4e2b9c71f08'
+branch_labels = None
+depends_on = None
+
+
+# The table starts out empty; run `flask refresh-ranks` afterwards to rank existing rows.
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS device_metric_ranks (
+            device_id integer NOT NULL REFERENCES hvacdevices (id) ON DELETE CASCADE,
+            metric varchar(100) NOT NULL,
+            device_type varchar(50) NOT NULL,
+            entry_year integer NOT NULL,
+            value double precision NOT NULL,
+            percent_rank double precision NOT NULL,
+            decile smallint NOT NULL,
+            PRIMARY KEY (device_id, metric)
+        )
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_metric_ranks_metric_percent_rank ON device_metric_ranks (metric, percent_rank)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_device_metric_ranks_device_type ON device_metric_ranks (device_type)')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS device_metric_ranks')
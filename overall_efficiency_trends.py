@@ -21,16 +21,20 @@ def analyse_overall_efficiency_trends_ac(df):
         df['market_entry'] = pd.to_datetime(df['market_entry'], errors='coerce')
         df['rating_to_test'] = pd.to_numeric(df['rating_to_test'], errors='coerce')
 
-        if 'market_exit' in df.columns:
+        if 'market_life_days' in df.columns or 'market_exit' in df.columns:
             print("Applying filter for devices with market life >= 1 year...")
-            df['market_exit'] = pd.to_datetime(df['market_exit'], errors='coerce')
+            if 'market_life_days' in df.columns:
+                # Stored generated column from hvacdevices, no need to recompute from the dates
+                df['market_life_days'] = pd.to_numeric(df['market_life_days'], errors='coerce')
+            else:
+                df['market_exit'] = pd.to_datetime(df['market_exit'], errors='coerce')
 
-            valid_dates_mask = df['market_entry'].notna() & df['market_exit'].notna()
-            df['market_life_days'] = np.nan 
-            df.loc[valid_dates_mask, 'market_life_days'] = \
-                (df.loc[valid_dates_mask, 'market_exit'] - df.loc[valid_dates_mask, 'market_entry']).dt.days
+                valid_dates_mask = df['market_entry'].notna() & df['market_exit'].notna()
+                df['market_life_days'] = np.nan 
+                df.loc[valid_dates_mask, 'market_life_days'] = \
+                    (df.loc[valid_dates_mask, 'market_exit'] - df.loc[valid_dates_mask, 'market_entry']).dt.days
 
-            mask_exited_short_life = df['market_exit'].notna() & (df['market_life_days'] < 365)
+            mask_exited_short_life = df['market_life_days'].notna() & (df['market_life_days'] < 365)
 
             count_before_filter = len(df)
             df = df[~mask_exited_short_life].copy()
@@ -40,7 +44,7 @@ def analyse_overall_efficiency_trends_ac(df):
                 print("Warning: DataFrame is empty after filtering for market lifespan. No data to analyze.")
                 return None
         else:
-            print("Warning: 'market_exit' column not found. Cannot filter by market lifespan. Proceeding with unfiltered data.")
+            print("Warning: Neither 'market_life_days' nor 'market_exit' column found. Cannot filter by market lifespan. Proceeding with unfiltered data.")
 
         df.dropna(subset=['market_entry', 'rating_to_test'], inplace=True)
         if df.empty:
@@ -176,16 +180,17 @@ def analyse_overall_efficiency_trends_ac(df):
         # Yearly Group Avg
         yearly_group_avg_seer = None
         if not df_indexed.empty and 'rating_to_test' in df_indexed.columns:
+            # Per-year quantiles of this frame, i.e. after the market life and SEER filters. The stored
+            # device_metric_ranks are ranked over every plausible device of the year and would shift the groups.
             print("Calculating yearly SEER quantiles...")
             temp_year_col = df_indexed.index.year.to_series(index=df_indexed.index)
-
-            df_indexed['rating_to_test_q_low'] = df_indexed.groupby(temp_year_col)['rating_to_test'].transform(lambda x: x.quantile(quantile_threshold_low))
-            df_indexed['rating_to_test_q_high'] = df_indexed.groupby(temp_year_col)['rating_to_test'].transform(lambda x: x.quantile(quantile_threshold))
-            
+            grouped_rating = df_indexed.groupby(temp_year_col)['rating_to_test']
+            rating_q_low = grouped_rating.transform('quantile', quantile_threshold_low)
+            rating_q_high = grouped_rating.transform('quantile', quantile_threshold)
             conditions = [
-                (df_indexed['rating_to_test'] > df_indexed['rating_to_test_q_high']),
-                (df_indexed['rating_to_test'] < df_indexed['rating_to_test_q_low']),
-                (df_indexed['rating_to_test'] >= df_indexed['rating_to_test_q_low']) & (df_indexed['rating_to_test'] <= df_indexed['rating_to_test_q_high'])
+                (df_indexed['rating_to_test'] > rating_q_high),
+                (df_indexed['rating_to_test'] < rating_q_low),
+                (df_indexed['rating_to_test'] >= rating_q_low) & (df_indexed['rating_to_test'] <= rating_q_high)
             ]
             group_labels = ['High', 'Low', 'Average']
             df_indexed['performance_group'] = np.select(conditions, group_labels, default='Unknown')
@@ -193,7 +198,6 @@ def analyse_overall_efficiency_trends_ac(df):
             yearly_group_avg_seer = df_indexed.groupby([df_indexed.index.year, 'performance_group'])['rating_to_test'].mean().unstack()
             yearly_group_avg_seer.index.name = 'entry_year'
 
-            df_indexed = df_indexed.drop(columns=['rating_to_test_q_low', 'rating_to_test_q_high'])
         else:
             print("Skipping yearly group calculations as df_indexed is empty or missing 'rating_to_test'.")
             yearly_group_avg_seer = pd.DataFrame()